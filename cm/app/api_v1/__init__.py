@@ -1,6 +1,9 @@
-from flask import Blueprint
+import time
+
+from flask import Blueprint, g, request
 
 from ..decorators import etag, rate_limit
+from ..metrics import STATS
 
 api = Blueprint('api', __name__)
 
@@ -8,7 +11,7 @@ api = Blueprint('api', __name__)
 @api.before_request
 def before_request():
     """All routes in this blueprint require authentication."""
-    pass
+    g.request_start = time.perf_counter()
 
 
 @api.after_request
@@ -18,4 +21,16 @@ def after_request(rv):
     return rv
 
 
+@api.after_request
+def record_request(rv):
+    """Count the response and record the duration of the request, by route
+    (the rule, not the url, to keep the number of series bounded)."""
+    start = g.get('request_start')
+    if start is not None:
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        STATS.observe_request(request.method, rule, rv.status_code,
+                              time.perf_counter() - start)
+    return rv
+
+
 from . import transactions, errors
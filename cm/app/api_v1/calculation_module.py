@@ -1,19 +1,47 @@
-import json
+import glob
 import logging
-import pathlib
-from pprint import pprint
-
-import tempfile
-from urllib.request import Request, urlopen
+import os
 
 import numpy as np
-import pandas as pd
-from pint import UnitRegistry
 
 import resutils.unit as ru
 
-from ..constant import CM_NAME
-
+from .. import constant, helper
+from ..constant import CM_NAME, SIGNATURE
+from ..exceptions import ValidationError
+from ..metrics import STATS
+from ..profiling import stage
+from .my_calculation_module_directory.breakdown import FORMATS, write_breakdown
+from .my_calculation_module_directory.datastore import STORE, file_digest
+from .my_calculation_module_directory.download import DOWNLOADER
+from .my_calculation_module_directory.efficiency import (
+    COLLECTION,
+    ELECTRICITY,
+    HEAT,
+    compute_potentials,
+    efficiency_matrix,
+)
+from .my_calculation_module_directory.ingest import (
+    columns_digest,
+    columns_energy,
+    records_codes,
+    records_energy_by_code,
+    records_to_columns,
+)
+from .my_calculation_module_directory.nuts import (
+    NutsSelection,
+    normalize_codes,
+    outermost_codes,
+)
+from .my_calculation_module_directory.raster import ID_FIELD, write_density
+from .my_calculation_module_directory.result_cache import RESULTS, make_key
+from .my_calculation_module_directory.sensitivity import (
+    NSAMPLES,
+    PERCENTILES,
+    percentile_bands,
+    sample_efficiencies,
+)
+from .my_calculation_module_directory.units import ENERGY_UNIT
 
 # set a logger
 LOG_FORMAT = (
@@ -24,8 +52,9 @@ logging.basicConfig(format=LOG_FORMAT)
 LOGGER = logging.getLogger(__name__)
 # LOGGER.setLevel("DEBUG")
 
-# set a unit register to convert between units
-ureg = UnitRegistry()
+# state of the caches of the process, reported by the alive consumer
+STATS.collect("datasets", lambda: dict(STORE.stats))
+STATS.collect("results", lambda: dict(RESULTS.stats))
 
 """ Entry point of the calculation module function"""
 # store vector layer names in global variables
@@ -39,12 +68,58 @@ BASEURL = (
     "{repo}/-/raw/master/data/{csv}?inline=false"
 )
 
+# TODO: the vector layers are read from the inputs_vector_selection as soon as
+# they are integrated in the datawarehouse and listed in the SIGNATURE
+VECTOR_LAYERS = bool(SIGNATURE["vectors_needed"])
+
+# parameters of: (collection, heat, electricity) efficiency of each layer
+KEYS = [
+    ("waste_coll_perc", "waste_heat_eff", "waste_el_eff"),
+    ("agric_coll_perc", "agric_heat_eff", "agric_el_eff"),
+    ("forst_coll_perc", "forst_heat_eff", "forst_el_eff"),
+    ("lvstk_coll_perc", "lvstk_heat_eff", "lvstk_el_eff"),
+]
+LABELS = [
+    "solid waste",
+    "agriculture residues",
+    "forest residues",
+    "livestock effluents",
+]
+
+# cached results computed by a different version of the code are not used:
+# the version covers this module, the modules of the calculation (units,
+# efficiency, NUTS index, ingest, datastore, ...) and the SIGNATURE
+CODE_FILES = sorted(
+    glob.glob(
+        os.path.join(
+            os.path.dirname(__file__), "my_calculation_module_directory", "*.py"
+        )
+    )
+) + [__file__, constant.__file__]
+CODE_VERSION = make_key(
+    files={
+        os.path.relpath(path, os.path.dirname(constant.__file__)): file_digest(path)
+        for path in CODE_FILES
+    }
+)[:16]
+
 URLS = {
     WASTE: dict(repo="potential_municipal_solid_waste", csv="solid_waste.csv"),
     AGRIC: dict(repo="potential_biomass", csv="agricultural_residues.csv"),
     LVSTK: dict(repo="potential_biomass", csv="livestock_effluents.csv"),
     FORST: dict(repo="potential_biomass", csv="forest_residues.csv"),
 }
+# expected sha256 of the datasets, e.g.: CM_SHA256_FOREST_RESIDUES=<digest>,
+# a download with a different content is rejected and the local copy is kept
+SHA256 = {
+    url["csv"]: os.environ.get("CM_SHA256_" + os.path.splitext(url["csv"])[0].upper())
+    for url in URLS.values()
+}
+
+# vector file of the NUTS regions (e.g. the GISCO NUTS geopackage) with the
+# code of each region in CM_NUTS_ID_FIELD, needed by the raster output
+NUTS_GEOMETRIES = os.environ.get("CM_NUTS_GEOMETRIES")
+NUTS_ID_FIELD = os.environ.get("CM_NUTS_ID_FIELD", ID_FIELD)
 
 
 def check_eff(type_eff, collecting_eff, heat_eff, el_eff, warnings=None):
@@ -65,80 +140,90 @@ def check_eff(type_eff, collecting_eff, heat_eff, el_eff, warnings=None):
     return warnings
 
 
-def apply_efficiency(energy, collecting_eff, heat_eff, el_eff):
-    res = (energy * collecting_eff * heat_eff, energy * collecting_eff * el_eff)
-    LOGGER.info(
-        "heat = (energy * collecting_eff * heat_eff)\n"
-        f"heat = ({energy} * {collecting_eff} * {heat_eff}) = {res[0]}\n"
-        "elec = (energy * collecting_eff * el_eff)\n"
-        f"elec = ({energy} * {collecting_eff} * {el_eff}) = {res[1]}"
+def get_csvpath(repo, csv):
+    """Return the path of the csv file, download the file if missing"""
+    return DOWNLOADER.fetch(
+        BASEURL.format(repo=repo, csv=csv), csv, sha256=SHA256.get(csv)
     )
-    return res
 
 
 def get_data(repo, csv):
     """Retrieve/read agricultural residues data"""
     # TODO: once the dataset is integrated remove this function
-    def read_csv(csvpath):
-        try:
-            return pd.read_csv(csvpath, header=0, index_col=0)
-        except Exception as exc:
-            LOGGER.exception(f"Failed to read: {csvpath} >> " f"exception = {exc}")
-            raise exc
-
-    # check if the file exists and in case download
-    csvpath = pathlib.Path(tempfile.gettempdir(), csv)
-    if csvpath.exists():
-        return read_csv(csvpath)
-    else:
-        url = BASEURL.format(repo=repo, csv=csv)
-        print(url)
-        req = Request(url, headers={"User-Agent": "Mozilla/5.0"})
-        with open(csvpath, mode="wb") as cfile:
-            cfile.write(urlopen(req).read())
-        try:
-            return read_csv(csvpath)
-        except Exception as exc:
-            LOGGER.exception(
-                f"Failed to read: {csvpath} the file "
-                f"has not been downloaded correctly from {url}."
-            )
-            raise exc
+    csvpath = get_csvpath(repo, csv)
+    try:
+        return STORE.get(csv, csvpath)
+    except Exception as exc:
+        LOGGER.exception(
+            f"Failed to read: {csvpath} the file "
+            f"has not been downloaded correctly from "
+            f"{BASEURL.format(repo=repo, csv=csv)}."
+        )
+        raise exc
 
 
-def calculation(
-    output_directory,
-    inputs_raster_selection,
-    inputs_vector_selection,
-    inputs_parameter_selection,
-):
+def selected_codes(inputs_vector_selection):
+    """Return the NUTS codes of the selected area or None if the vector
+    selection does not contain any code"""
+    codes = records_codes(inputs_vector_selection or {}, (WASTE, AGRIC, LVSTK, FORST))
+    return sorted(codes) if codes else None
+
+
+def get_datasets():
+    """Return the datasets of the layers: waste, agric, forst, lvstk"""
     # retrieve the inputs layes
     # TODO: the part in >>>>> {part} <<<<< have to be removed as soon as the layer
     # on agricurltural residues is integrated.
     # >>>>>
     # we need to retrieve the agricultural residues dataset
-    waste = get_data(**URLS[WASTE])
-    agric = get_data(**URLS[AGRIC])
-    lvstk = get_data(**URLS[LVSTK])
-    forst = get_data(**URLS[FORST])
+    with stage("load"):
+        waste = get_data(**URLS[WASTE])
+        agric = get_data(**URLS[AGRIC])
+        lvstk = get_data(**URLS[LVSTK])
+        forst = get_data(**URLS[FORST])
     # <<<<<
 
     # livestock:      code	source	value	note	unit
     # forset biomass: code	source	value	note	unit
     # agriculture:    code	source	value	note	unit
     # solid_waste:    code	source	value	note	unit
-    LOGGER.info("Start reading input json strings.")
-    # TODO: uncomment the line bellow as soon as the layer it is available on the datawarehouse
-    # >>>>>
-    # waste = pd.read_json(json.dumps(inputs_vector_selection[WASTE]), orient="records")
-    # agric = pd.read_json(json.dumps(inputs_vector_selection[AGRIC]), orient="records")
-    # lvstk = pd.read_json(json.dumps(inputs_vector_selection[LVSTK]), orient="records")
-    # forst = pd.read_json(json.dumps(inputs_vector_selection[FORST]), orient="records")
-    # <<<<<
+    return waste, agric, forst, lvstk
 
-    # convert str to float
-    psel = {k: float(v) / 100.0 for k, v in inputs_parameter_selection.items()}
-    LOGGER.info(f"Selected parameters: {psel}")
+
+def vector_columns(inputs_vector_selection):
+    """Return the code, unit and value columns of the records of each layer:
+    waste, agric, forst, lvstk"""
+    with stage("filter"):
+        return [
+            records_to_columns(
+                inputs_vector_selection.get(layer) or (),
+                fields=("code", "unit", "value"),
+            )
+            for layer in (WASTE, AGRIC, FORST, LVSTK)
+        ]
+
+
+def get_inputs(inputs_vector_selection):
+    """Return the data of a request: the columns of the vector layers when
+    they are sent with the selection, the datasets of the layers otherwise.
+    They are retrieved once and passed to the steps of the request."""
+    if VECTOR_LAYERS:
+        return vector_columns(inputs_vector_selection)
+    return get_datasets()
+
+
+def data_version(inputs_vector_selection, inputs=None):
+    """Return the version of the data used to compute the selection, the
+    records of the vector layers are hashed from their columns"""
+    if inputs is None:
+        inputs = get_inputs(inputs_vector_selection)
+    if VECTOR_LAYERS:
+        return columns_digest(inputs)
+    return [df.version for df in inputs]
+
+
+def get_energy(inputs_vector_selection, inputs=None):
+    """Return the energy of each layer, in ENERGY_UNIT, in the selected area"""
     """
 {'agricultural_residues_view': [{'code': 'AT111',
                                  'source': 'cereal.straw',
@@ -157,66 +242,109 @@ def calculation(
                                       'unit': 'PetaJoule',
                                       'value': 0.0355200131152591}]}
     """
-    keys = [
-        ("waste_coll_perc", "waste_heat_eff", "waste_el_eff"),
-        ("agric_coll_perc", "agric_heat_eff", "agric_el_eff"),
-        ("forst_coll_perc", "forst_heat_eff", "forst_el_eff"),
-        ("lvstk_coll_perc", "lvstk_heat_eff", "lvstk_el_eff"),
-    ]
-    labels = [
-        "solid waste",
-        "agriculture residues",
-        "forest residues",
-        "livestock effluents",
-    ]
+    if inputs is None:
+        inputs = get_inputs(inputs_vector_selection)
+    if VECTOR_LAYERS:
+        # the layers are available on the datawarehouse: the records of the
+        # selection are converted to arrays without any json round trip
+        with stage("unit_conversion"):
+            return np.array([columns_energy(cols) for cols in inputs])
+
+    datasets = inputs
+    with stage("filter"):
+        codes = selected_codes(inputs_vector_selection)
+        LOGGER.info("Selected NUTS codes: %s", "all" if codes is None else len(codes))
+
+        if codes is not None:
+            # normalized and reduced once for all the datasets
+            codes = NutsSelection(codes, [df.cube for df in datasets])
+
+        # energy of each layer converted to the same unit when the data are
+        # loaded
+        return np.array([df.sum(codes) for df in datasets])
+
+
+def get_energy_by_code(inputs_vector_selection, inputs=None):
+    """Return the sorted NUTS codes of the selected area and the energy of
+    each layer and code, in ENERGY_UNIT, with shape (layers, codes)"""
+    layers = (WASTE, AGRIC, FORST, LVSTK)
+    if VECTOR_LAYERS:
+        with stage("filter"):
+            codes = normalize_codes(records_codes(inputs_vector_selection, layers))
+        with stage("unit_conversion"):
+            return codes, np.array(
+                [
+                    records_energy_by_code(inputs_vector_selection[layer], codes)
+                    for layer in layers
+                ]
+            )
+
+    datasets = get_datasets() if inputs is None else inputs
+    with stage("filter"):
+        codes = selected_codes(inputs_vector_selection)
+        if codes is None:
+            # all the regions of the datasets
+            codes = np.unique(np.concatenate([df.index.codes for df in datasets]))
+        codes = normalize_codes(codes)
+        return codes, np.array([df.sums(codes) for df in datasets])
+
+
+def get_parameters(inputs_parameter_selection):
+    """Return the selected parameters as float and the list of warnings"""
+    # convert str to float
+    psel = {k: float(v) / 100.0 for k, v in inputs_parameter_selection.items()}
+    LOGGER.info(f"Selected parameters: {psel}")
     warnings = []
-    for label, (coll_perc, heat_eff, el_eff) in zip(labels, keys):
+    for label, (coll_perc, heat_eff, el_eff) in zip(LABELS, KEYS):
         check_eff(
             label, psel[coll_perc], psel[heat_eff], psel[el_eff], warnings=warnings
         )
+    return psel, warnings
 
-    heats, els = [], []
-    for df, (coll_perc, heat_eff, el_eff) in zip((waste, agric, forst, lvstk), keys):
-        val = df.value.sum()
-        units = df.unit.drop_duplicates()
-        if len(units) > 1:
-            LOGGER.warnings(
-                f"More than one unit found: {units} " "only the first will be used."
-            )
-            # TODO: In case of more units do something to handle this case
-        unit = units.iloc[0]
-        if unit == "PetaJoule":
-            unit = "PJ"
-        out_unit = "MWh"
-        val = ureg.Quantity(val, ureg.parse_units(unit))
-        val = val.to(out_unit).magnitude
-        heat, el = apply_efficiency(val, psel[coll_perc], psel[heat_eff], psel[el_eff])
-        heats.append(heat)
-        els.append(el)
-
-    hres = np.array(heats)
-    eres = np.array(els)
-
-    array = np.array(heats + els)
-    _, graph_unit, graph_factor = ru.best_unit(
-        array, out_unit, no_data=0, fstat=np.median, powershift=0
-    )
+
+def build_result(hres, eres, warnings, out_unit=ENERGY_UNIT):
+    """Return the result dictionary with indicators and graphics given the
+    heat and electricity potential of each layer"""
+    array = np.concatenate((hres, eres))
+    with stage("best_unit"):
+        _, graph_unit, graph_factor = ru.best_unit(
+            array, out_unit, no_data=0, fstat=np.median, powershift=0
+        )
     LOGGER.info(
         f"Moving from {out_unit} to {graph_unit} " "to improve the visualization"
     )
-    heats_l = list((hres * graph_factor).round(decimals=3))
-    els_l = list((eres * graph_factor).round(decimals=3))
+    with stage("graphics"):
+        return graphics_result(hres, eres, warnings, graph_unit, graph_factor)
+
+
+def graphics_result(hres, eres, warnings, graph_unit, graph_factor):
+    """Return the result dictionary with the potentials scaled to graph_unit"""
+    return make_result(
+        (hres * graph_factor).round(decimals=3),
+        (eres * graph_factor).round(decimals=3),
+        np.round(hres.sum() * graph_factor, decimals=1),
+        np.round(eres.sum() * graph_factor, decimals=1),
+        warnings,
+        graph_unit,
+    )
+
+
+def make_result(heats, els, heat_tot, el_tot, warnings, graph_unit):
+    """Return the result dictionary of the scaled and rounded potentials"""
+    labels = LABELS
+    heats_l = list(heats)
+    els_l = list(els)
 
     indicators = [
         {
             "unit": graph_unit,
             "name": "Total biomass heat energy potential",
-            "value": np.round(hres.sum() * graph_factor, decimals=1),
+            "value": heat_tot,
         },
         {
             "unit": graph_unit,
             "name": "Total biomass electric energy potential",
-            "value": np.round(eres.sum() * graph_factor, decimals=1),
+            "value": el_tot,
         },
     ]
 
@@ -244,7 +372,6 @@ def calculation(
             ),
         )
     ]
-    LOGGER.info(f"Computation graphics for biomass is: {graphics}")
     result = dict()
     result["name"] = CM_NAME
     result["indicator"] = []
@@ -254,8 +381,289 @@ def calculation(
         )
     result["indicator"].extend(indicators)
     result["graphics"] = graphics
-    # result["vector_layers"] = []
-    # result["raster_layers"] = []
-    pprint(result)
-    LOGGER.info(f"Computation result for biomass is: {result}")
+    return result
+
+
+def get_breakdown(
+    output_directory, inputs_vector_selection, psel, fmt="csv", inputs=None
+):
+    """Write the heat and electricity potential of each layer and NUTS
+    code of the selected area and return the vector layer of the result"""
+    if fmt not in FORMATS:
+        raise ValidationError(
+            f"Unknown breakdown format: {fmt!r}, use one of: {list(FORMATS)}"
+        )
+    codes, energy = get_energy_by_code(inputs_vector_selection, inputs)
+    pot = compute_potentials(energy, efficiency_matrix(psel, KEYS))
+    path = helper.generate_output_file_with_extension(output_directory, FORMATS[fmt])
+    write_breakdown(
+        path,
+        codes,
+        pot.heat,
+        pot.electricity,
+        [lkeys[0].split("_")[0] for lkeys in KEYS],
+    )
+    LOGGER.info(f"Breakdown of {len(codes)} regions written in: {path}")
+    return {
+        "name": f"Biomass heat and electricity potential by NUTS region [{ENERGY_UNIT}]",
+        "path": path,
+    }
+
+
+def get_rasters(
+    output_directory,
+    inputs_raster_selection,
+    inputs_vector_selection,
+    psel,
+    inputs=None,
+):
+    """Write the heat and electricity potential density of the regions of
+    the selected area on the grid of the first raster of the selection and
+    return the raster layers of the result"""
+    if not NUTS_GEOMETRIES:
+        raise ValidationError(
+            "The raster output is not available: the NUTS geometries are not "
+            "configured (CM_NUTS_GEOMETRIES)"
+        )
+    if not inputs_raster_selection:
+        raise ValidationError("The raster output needs an inputs_raster_selection")
+    reference = inputs_raster_selection[sorted(inputs_raster_selection)[0]]
+    codes, energy = get_energy_by_code(inputs_vector_selection, inputs)
+    # the potential of a region is burnt once, not again with its parent
+    keep = np.isin(codes, outermost_codes(list(codes)))
+    codes, energy = codes[keep], energy[:, keep]
+    pot = compute_potentials(energy, efficiency_matrix(psel, KEYS)).by_region()
+    heat_path = helper.generate_output_file_tif(output_directory)
+    el_path = helper.generate_output_file_tif(output_directory)
+    write_density(
+        reference,
+        NUTS_GEOMETRIES,
+        list(codes),
+        [(heat_path, pot.heat), (el_path, pot.electricity)],
+        id_field=NUTS_ID_FIELD,
+    )
+    return [
+        {
+            "name": f"Biomass heat potential density [{ENERGY_UNIT}/ha]",
+            "path": heat_path,
+            "type": "heat",
+        },
+        {
+            "name": f"Biomass electricity potential density [{ENERGY_UNIT}/ha]",
+            "path": el_path,
+            "type": "electricity",
+        },
+    ]
+
+
+def calculation(
+    output_directory,
+    inputs_raster_selection,
+    inputs_vector_selection,
+    inputs_parameter_selection,
+    breakdown=None,
+    raster=False,
+):
+    # the same area and parameters are requested again and again from the map
+    # the datasets, or the columns of the records, are retrieved once for
+    # the key, the energy and the output files
+    inputs = get_inputs(inputs_vector_selection)
+    version = data_version(inputs_vector_selection, inputs)
+    with stage("filter"):
+        codes = selected_codes(inputs_vector_selection)
+    with stage("cache"):
+        key = make_key(
+            codes=codes,
+            params={k: float(v) for k, v in inputs_parameter_selection.items()},
+            version=[CODE_VERSION, version],
+        )
+        result = RESULTS.get(key)
+    if result is not None:
+        LOGGER.info(f"Computation result for biomass found in cache: {key}")
+        psel = None
+    else:
+        energy = get_energy(inputs_vector_selection, inputs)
+        with stage("efficiency"):
+            psel, warnings = get_parameters(inputs_parameter_selection)
+
+            # compute heat and electricity of all the layers at once
+            pot = compute_potentials(
+                energy[:, np.newaxis], efficiency_matrix(psel, KEYS)
+            ).by_layer()
+        hres, eres = pot.heat, pot.electricity
+        LOGGER.debug(f"energy = {energy} {ENERGY_UNIT}, heat = {hres}, elec = {eres}")
+
+        result = build_result(hres, eres, warnings)
+        with stage("cache"):
+            RESULTS.set(key, result)
+
+    # the output files are not cached, they are written for each request
+    if (breakdown or raster) and psel is None:
+        psel, _ = get_parameters(inputs_parameter_selection)
+    if breakdown:
+        fmt = "csv" if breakdown is True else breakdown
+        result["vector_layers"] = [
+            get_breakdown(output_directory, inputs_vector_selection, psel, fmt, inputs)
+        ]
+    if raster:
+        result["raster_layers"] = get_rasters(
+            output_directory,
+            inputs_raster_selection,
+            inputs_vector_selection,
+            psel,
+            inputs,
+        )
+    return result
+
+
+def parameter_matrix(inputs_parameter_selections):
+    """Return the (scenarios, layers, 3) matrix with the collection, heat and
+    electricity efficiency of each scenario and layer, the parameter
+    selections are validated (float percentages)"""
+    return (
+        np.array(
+            [
+                [[p[key] for key in lkeys] for lkeys in KEYS]
+                for p in inputs_parameter_selections
+            ],
+            dtype=float,
+        )
+        / 100.0
+    )
+
+
+def check_effs(effs):
+    """Return the warnings of each scenario of a parameter matrix, as
+    check_eff does for a single scenario"""
+    warnings = [[] for _ in range(len(effs))]
+    coll = effs[..., COLLECTION]
+    for scenario, layer in zip(*np.nonzero((coll > 1) | (coll < 0))):
+        warnings[scenario].append(
+            f"The efficiency in collecting {LABELS[layer]} is not between 0 and 100"
+        )
+    nexceed = np.count_nonzero(effs[..., HEAT] + effs[..., ELECTRICITY] > 1)
+    if nexceed:
+        LOGGER.warning(
+            "The sum of the efficiency to generate heat and electricity "
+            "exceed 100 for %s layers of the scenarios",
+            nexceed,
+        )
+    return warnings
+
+
+def calculation_batch(
+    output_directory,
+    inputs_raster_selection,
+    inputs_vector_selection,
+    inputs_parameter_selections,
+):
+    """Evaluate a list of parameter selections (scenarios) on the same
+    selected area, data are loaded and aggregated only once and all the
+    scenarios share the unit of the graphics"""
+    energy = get_energy(inputs_vector_selection)
+    with stage("efficiency"):
+        effs = parameter_matrix(inputs_parameter_selections)
+        warnings = check_effs(effs)
+
+        # compute heat and electricity of all the scenarios and layers at once
+        pot = compute_potentials(energy[:, np.newaxis], effs).by_layer()
+    with stage("best_unit"):
+        _, graph_unit, graph_factor = ru.best_unit(
+            np.concatenate((pot.heat, pot.electricity), axis=None),
+            ENERGY_UNIT,
+            no_data=0,
+            fstat=np.median,
+            powershift=0,
+        )
+    LOGGER.info("Computed %s scenarios for biomass in %s", len(effs), graph_unit)
+    with stage("graphics"):
+        # scaled and rounded for all the scenarios at once
+        heats = (pot.heat * graph_factor).round(decimals=3)
+        els = (pot.electricity * graph_factor).round(decimals=3)
+        heat_tots = np.round(pot.heat.sum(axis=1) * graph_factor, decimals=1)
+        el_tots = np.round(pot.electricity.sum(axis=1) * graph_factor, decimals=1)
+        return [
+            make_result(*values, graph_unit)
+            for values in zip(heats, els, heat_tots, el_tots, warnings)
+        ]
+
+
+def calculation_sensitivity(
+    output_directory,
+    inputs_raster_selection,
+    inputs_vector_selection,
+    inputs_parameter_selection,
+    sensitivity,
+):
+    """Sample the efficiencies from the distributions given in
+    sensitivity["distributions"] and return the P5/P50/P95 bands of the heat
+    and electricity potential of each biomass typology"""
+    energy = get_energy(inputs_vector_selection)
+    with stage("efficiency"):
+        psel, warnings = get_parameters(inputs_parameter_selection)
+        effs = sample_efficiencies(
+            psel,
+            sensitivity.get("distributions", {}),
+            KEYS,
+            nsamples=int(sensitivity.get("samples", NSAMPLES)),
+            seed=sensitivity.get("seed"),
+        )
+
+        # compute heat and electricity of all the samples and layers at once
+        pot = compute_potentials(energy[:, np.newaxis], effs).by_layer()
+    hbands = percentile_bands(pot.heat)
+    ebands = percentile_bands(pot.electricity)
+    htot = percentile_bands(pot.heat.sum(axis=1))
+    etot = percentile_bands(pot.electricity.sum(axis=1))
+    LOGGER.info(f"Computed {len(effs)} samples for biomass")
+
+    with stage("best_unit"):
+        _, graph_unit, graph_factor = ru.best_unit(
+            np.concatenate((hbands[1], ebands[1])),
+            ENERGY_UNIT,
+            no_data=0,
+            fstat=np.median,
+            powershift=0,
+        )
+    indicators = []
+    for perc, hval, evalue in zip(PERCENTILES, htot, etot):
+        indicators.extend(
+            [
+                {
+                    "unit": graph_unit,
+                    "name": f"Total biomass heat energy potential P{perc}",
+                    "value": np.round(hval * graph_factor, decimals=1),
+                },
+                {
+                    "unit": graph_unit,
+                    "name": f"Total biomass electric energy potential P{perc}",
+                    "value": np.round(evalue * graph_factor, decimals=1),
+                },
+            ]
+        )
+    colors = ("#c1d8ee", "#3e95cd", "#1c4f72")
+    graphics = [
+        dict(
+            type="bar",
+            xLabel="Biomass typologies",
+            yLabel=graph_unit,
+            data=dict(
+                labels=LABELS,
+                datasets=[
+                    dict(
+                        label=f"Biomass {name} potential P{perc}",
+                        backgroundColor=[color] * len(LABELS),
+                        data=list((band * graph_factor).round(decimals=3)),
+                    )
+                    for perc, color, band in zip(PERCENTILES, colors, bands)
+                ],
+            ),
+        )
+        for name, bands in (("heat", hbands), ("electricity", ebands))
+    ]
+    result = dict()
+    result["name"] = CM_NAME
+    result["indicator"] = [{"unit": "-", "name": msg, "value": 0} for msg in warnings]
+    result["indicator"].extend(indicators)
+    result["graphics"] = graphics
     return result
@@ -1,14 +1,25 @@
-from flask import jsonify
+from flask import Response, jsonify
 
 from . import api
-from ..exceptions import ValidationError
+from .. import encoder
+from ..exceptions import RpcTimeout, ValidationError
+
+
+def bad_request_message(e):
+    return {'status': 400, 'error': 'bad request', 'message': e.args[0]}
 
 
 @api.errorhandler(ValidationError)
 def bad_request(e):
-    response = jsonify({'status': 400, 'error': 'bad request',
+    # the same bytes as the reply of the compute consumer
+    return Response(encoder.dumps(bad_request_message(e)), status=400,
+                    mimetype='application/json')
+
+@api.errorhandler(RpcTimeout)
+def gateway_timeout(e):
+    response = jsonify({'status': 504, 'error': 'gateway timeout',
                         'message': e.args[0]})
-    response.status_code = 400
+    response.status_code = 504
     return response
 
 @api.errorhandler(404)
@@ -0,0 +1,46 @@
+import gzip
+
+import numpy as np
+
+# formats of the per-region breakdown and extension of the output file
+FORMATS = {"csv": ".csv", "csv.gz": ".csv.gz"}
+FLOAT_FORMAT = "%.3f"
+
+
+def breakdown_columns(prefixes):
+    """Return the header of the breakdown: code and, for each layer, the
+    heat and electricity potential."""
+    columns = ["code"]
+    for prefix in prefixes:
+        columns.extend([f"{prefix}_heat", f"{prefix}_el"])
+    return columns
+
+
+def format_table(codes, heat, electricity, prefixes, float_format=FLOAT_FORMAT):
+    """Return the CSV text of the breakdown.
+
+    codes: array with the R region codes.
+    heat, electricity: arrays with shape (layers, R).
+    The whole table is formatted with one %-operation on a row template
+    repeated R times, without a Python loop over the rows.
+    """
+    nregions = len(codes)
+    values = np.empty((nregions, 2 * len(prefixes)), dtype=np.float64)
+    values[:, 0::2] = np.transpose(heat)
+    values[:, 1::2] = np.transpose(electricity)
+    table = np.empty((nregions, values.shape[1] + 1), dtype=object)
+    table[:, 0] = np.asarray(codes, dtype=str)
+    table[:, 1:] = values
+    row = ",".join(["%s"] + [float_format] * values.shape[1]) + "\n"
+    header = ",".join(breakdown_columns(prefixes)) + "\n"
+    return header + (row * nregions) % tuple(table.ravel().tolist())
+
+
+def write_breakdown(path, codes, heat, electricity, prefixes):
+    """Write the per-region breakdown as CSV, compressed with gzip if path
+    ends with .gz, and return the path."""
+    data = format_table(codes, heat, electricity, prefixes).encode("utf-8")
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, mode="wb") as out:
+        out.write(data)
+    return path
@@ -0,0 +1,317 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import nuts, units
+from .nuts import NUTS_LEVELS, NutsCube, NutsIndex, NutsSelection
+from .units import ENERGY_UNIT, FACTORS, convert
+
+LOGGER = logging.getLogger(__name__)
+
+CATEGORICALS = ("code", "source", "unit")
+
+# directory with the datasets converted to memory mapped numpy arrays
+BINARY_DIR = os.environ.get(
+    "CM_DATASET_DIR", os.path.join(tempfile.gettempdir(), "biomass_npy")
+)
+# seconds after which a temporary directory is left over by an interrupted
+# conversion and can be removed
+TMP_GRACE = 3600
+
+
+class Dataset(object):
+    """Columnar view of a biomass dataset: categorical code/source/unit
+    columns and a contiguous float64 array with the values. The values
+    converted to ENERGY_UNIT are indexed by NUTS code and aggregated at
+    every NUTS level."""
+
+    __slots__ = (
+        "name",
+        "code",
+        "source",
+        "unit",
+        "value",
+        "energy",
+        "version",
+        "index",
+        "cube",
+    )
+
+    def __init__(
+        self,
+        name,
+        code,
+        source,
+        unit,
+        value,
+        version=None,
+        energy=None,
+        index=None,
+        cube=None,
+    ):
+        self.name = name
+        self.code = code
+        self.source = source
+        self.unit = unit
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.version = version
+        # rows with different units are converted element-wise
+        if energy is None:
+            energy = convert(self.value, unit, ENERGY_UNIT)
+        self.energy = energy
+        if index is None or cube is None:
+            codes = np.asarray(code, dtype=str)
+            index = NutsIndex(codes, energy) if index is None else index
+            if cube is None:
+                cube = NutsCube(codes, np.asarray(source, dtype=str), energy)
+        self.index = index
+        self.cube = cube
+
+    def __len__(self):
+        return len(self.value)
+
+    def __repr__(self):
+        return f"<Dataset {self.name!r}: {len(self)} rows, version={self.version}>"
+
+    @property
+    def units(self):
+        """Return the list of units used in the dataset."""
+        return list(self.unit.categories[np.unique(self.unit.codes)])
+
+    def rows(self, codes=None):
+        """Return the positions of the rows of the selected NUTS codes,
+        codes can be given at any NUTS level, e.g.: AT1 selects AT111,
+        AT112, AT121, etc."""
+        if codes is None:
+            return np.arange(len(self))
+        return self.index.rows(codes)
+
+    def sum(self, codes=None):
+        """Return the energy, in ENERGY_UNIT, of the selected NUTS codes or
+        NutsSelection (shared by the datasets of a request)."""
+        if codes is None:
+            return self.energy.sum()
+        if not isinstance(codes, NutsSelection):
+            codes = NutsSelection(codes, [self.cube])
+        return codes.sum(self.index, self.cube)
+
+    def sums(self, codes):
+        """Return the energy, in ENERGY_UNIT, of each NUTS code or code
+        prefix, codes must be normalized (see nuts.normalize_codes)."""
+        return self.index.sums(codes)
+
+    @classmethod
+    def from_frame(cls, name, df, version=None):
+        """Build a dataset from a DataFrame with at least the columns:
+        code, source, value and unit."""
+        if "code" not in df.columns:
+            df = df.reset_index().rename(columns={df.index.name or "index": "code"})
+        cols = {col: pd.Categorical(df[col].astype(str).values) for col in CATEGORICALS}
+        # missing values do not contribute to the potential, as in DataFrame.sum
+        value = df["value"].fillna(0.0).values
+        return cls(name, value=value, version=version, **cols)
+
+    def to_frame(self):
+        """Return the dataset as a pandas DataFrame."""
+        return pd.DataFrame(
+            dict(code=self.code, source=self.source, value=self.value, unit=self.unit)
+        )
+
+
+def file_digest(path, blocksize=1 << 20):
+    """Return the sha256 hex digest of a file."""
+    sha = hashlib.sha256()
+    with open(path, mode="rb") as fobj:
+        for block in iter(lambda: fobj.read(blocksize), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def format_version():
+    """Return the version of the binary format: the stored energy depends on
+    ENERGY_UNIT and on the conversion factors, the layout of the arrays on
+    the code of the dataset, NUTS index and cube."""
+    sha = hashlib.sha256(f"{ENERGY_UNIT}:{sorted(FACTORS.items())}".encode())
+    for path in (__file__, nuts.__file__, units.__file__):
+        sha.update(file_digest(path).encode())
+    return sha.hexdigest()[:8]
+
+
+# binary copies written by another version of the code are not loaded
+FORMAT_VERSION = format_version()
+
+
+def read_csv(name, csvpath, version=None):
+    """Parse a biomass csv file into a columnar Dataset."""
+    try:
+        df = pd.read_csv(
+            csvpath,
+            header=0,
+            index_col=0,
+            dtype={col: "category" for col in CATEGORICALS},
+        )
+    except Exception as exc:
+        LOGGER.exception(f"Failed to read: {csvpath} >> " f"exception = {exc}")
+        raise exc
+    return Dataset.from_frame(name, df, version=version)
+
+
+def save_binary(dataset, directory):
+    """Save all the arrays of a dataset, including the NUTS index and
+    cube, as .npy files in directory."""
+    os.makedirs(directory, exist_ok=True)
+    arrays = dict(value=dataset.value, energy=dataset.energy)
+    for col in CATEGORICALS:
+        cat = getattr(dataset, col)
+        arrays[f"{col}_codes"] = cat.codes
+        arrays[f"{col}_categories"] = np.asarray(cat.categories, dtype=str)
+    for key, array in dataset.index.arrays().items():
+        arrays[f"index_{key}"] = array
+    cube = dataset.cube.arrays()
+    arrays["cube_sources"] = cube["sources"]
+    for level, keys, sums in zip(NUTS_LEVELS, cube["keys"], cube["sums"]):
+        arrays[f"cube_keys_{level}"] = keys
+        arrays[f"cube_sums_{level}"] = sums
+    for key, array in arrays.items():
+        np.save(os.path.join(directory, key + ".npy"), np.asarray(array))
+
+
+def load_binary(name, directory, version=None):
+    """Load a dataset saved with `save_binary`, the arrays are memory mapped
+    read-only: the pages are shared by all the processes of the host."""
+
+    def load(key):
+        return np.load(os.path.join(directory, key + ".npy"), mmap_mode="r")
+
+    cols = {
+        col: pd.Categorical.from_codes(
+            load(f"{col}_codes"), categories=load(f"{col}_categories")
+        )
+        for col in CATEGORICALS
+    }
+    index = NutsIndex.from_arrays(
+        **{key: load(f"index_{key}") for key in ("order", "codes", "values", "csum")}
+    )
+    cube = NutsCube.from_arrays(
+        load("cube_sources"),
+        [load(f"cube_keys_{level}") for level in NUTS_LEVELS],
+        [load(f"cube_sums_{level}") for level in NUTS_LEVELS],
+    )
+    return Dataset(
+        name,
+        value=load("value"),
+        energy=load("energy"),
+        version=version,
+        index=index,
+        cube=cube,
+        **cols,
+    )
+
+
+def read_binary(name, csvpath, version=None, bindir=BINARY_DIR):
+    """Return the dataset from its binary copy, the csv file is parsed and
+    converted only the first time by the first process, and again when the
+    file or the FORMAT_VERSION change."""
+    stem = os.path.splitext(os.path.basename(csvpath))[0]
+    directory = os.path.join(bindir, f"{stem}-{version}-{FORMAT_VERSION}")
+    if not os.path.isdir(directory):
+        dataset = read_csv(name, csvpath, version=version)
+        os.makedirs(bindir, exist_ok=True)
+        tmpdir = tempfile.mkdtemp(dir=bindir, prefix=".tmp-")
+        try:
+            save_binary(dataset, tmpdir)
+            # atomic: other processes see the complete directory or nothing
+            os.rename(tmpdir, directory)
+            LOGGER.info(f"Converted {csvpath} to {directory}")
+        except OSError:
+            # already converted by another process
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        remove_stale(bindir, stem, os.path.basename(directory))
+    return load_binary(name, directory, version=version)
+
+
+def remove_stale(bindir, stem, current, grace=TMP_GRACE):
+    """Remove the versions of `stem` older than the previous one and the
+    temporary directories older than `grace` seconds. The previous version
+    is kept for the processes that resolved its path just before the
+    conversion, mapped files stay valid until closed."""
+    now = time.time()
+    versions = []
+    for entry in os.scandir(bindir):
+        try:
+            mtime = entry.stat().st_mtime
+        except OSError:
+            # removed by another process
+            continue
+        if entry.name.startswith(".tmp-"):
+            if now - mtime > grace:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        elif entry.name.startswith(f"{stem}-") and entry.name != current:
+            versions.append((mtime, entry.path))
+    for _, path in sorted(versions, reverse=True)[1:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class DatasetStore(object):
+    """Process level store that parses each dataset file only once.
+
+    Every access checks the file modification time and size, when they
+    change the sha256 digest of the file is compared with the one of the
+    loaded version and the file is parsed again only if the content differs.
+    """
+
+    def __init__(self, loader=read_binary):
+        self.loader = loader
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.stats = dict(
+            hits=0, misses=0, invalidations=0, loads=0, load_time=0.0, last_load=None
+        )
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def get(self, name, path):
+        """Return the Dataset `name` stored in the file `path`."""
+        path = os.fspath(path)
+        st = os.stat(path)
+        stamp = (path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry["stamp"] == stamp:
+                self.stats["hits"] += 1
+                return entry["dataset"]
+            digest = file_digest(path)
+            if entry is not None and entry["digest"] == digest:
+                # the file was touched but the content is the same
+                entry["stamp"] = stamp
+                self.stats["hits"] += 1
+                return entry["dataset"]
+            self.stats["misses"] += 1
+            if entry is not None:
+                self.stats["invalidations"] += 1
+            start = time.perf_counter()
+            dataset = self.loader(name, path, version=digest[:16])
+            elapsed = time.perf_counter() - start
+            self._entries[name] = dict(stamp=stamp, digest=digest, dataset=dataset)
+            self.stats["loads"] += 1
+            self.stats["load_time"] += elapsed
+            self.stats["last_load"] = time.time()
+            LOGGER.info(f"Loaded {dataset} from {path} in {elapsed:.3f}s")
+            return dataset
+
+    def clear(self):
+        """Drop all the loaded datasets."""
+        with self._lock:
+            self._entries.clear()
+
+
+# store shared by all the requests served by the process
+STORE = DatasetStore()
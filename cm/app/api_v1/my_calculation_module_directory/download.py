@@ -0,0 +1,206 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+LOGGER = logging.getLogger(__name__)
+
+# local directory where the downloaded datasets are mirrored
+MIRROR_DIR = os.environ.get("CM_DATASET_MIRROR", tempfile.gettempdir())
+# seconds after which a local file is revalidated against the server
+REVALIDATE = float(os.environ.get("CM_DATASET_REVALIDATE", 24 * 3600))
+TIMEOUT = 60
+BLOCKSIZE = 1 << 20
+
+
+class ChecksumError(ValueError):
+    pass
+
+
+@contextlib.contextmanager
+def file_lock(path, blocking=True):
+    """Exclusive lock, shared by all the processes of the host, on path.
+    Yield whether the lock is held: False if it is not blocking and another
+    process holds it."""
+    with open(path, mode="a") as lock:
+        try:
+            fcntl.flock(
+                lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            )
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class Downloader(object):
+    """Download files in a local mirror directory.
+
+    Only one process per host downloads a file: the others wait on a file
+    lock and then use the local copy. Files are written to a temporary file
+    and atomically renamed, so readers never see partial files. Local copies
+    are revalidated with ETag/Last-Modified after `revalidate` seconds: the
+    stale copy is served while a background thread revalidates it, unless
+    another process of the host is already doing it.
+    """
+
+    def __init__(self, directory=MIRROR_DIR, revalidate=REVALIDATE, timeout=TIMEOUT):
+        self.directory = directory
+        self.revalidate = revalidate
+        self.timeout = timeout
+        self.stats = dict(downloads=0, not_modified=0, errors=0)
+        self._pending = {}
+        self._lock = threading.Lock()
+        # parsed metadata of the local copies, by (mtime, size) of the file
+        self._meta = {}
+
+    def _read_meta(self, path):
+        """Return a copy of the metadata of the local copy of a file, the
+        metadata file is parsed again only when it changes."""
+        metapath = path + ".meta.json"
+        try:
+            st = os.stat(metapath)
+        except OSError:
+            return {}
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._meta.get(metapath)
+        if cached is None or cached[0] != stamp:
+            try:
+                with open(metapath, mode="r") as jsfile:
+                    cached = (stamp, json.load(jsfile))
+            except (OSError, ValueError):
+                return {}
+            self._meta[metapath] = cached
+        return dict(cached[1])
+
+    def _write_meta(self, path, meta):
+        metapath = path + ".meta.json"
+        fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, mode="w") as jsfile:
+            json.dump(meta, jsfile)
+        os.replace(tmppath, metapath)
+        st = os.stat(metapath)
+        self._meta[metapath] = ((st.st_mtime_ns, st.st_size), dict(meta))
+
+    def _is_fresh(self, path, meta):
+        if not os.path.exists(path):
+            return False
+        if self.revalidate is None:
+            return True
+        return time.time() - meta.get("checked", 0) < self.revalidate
+
+    def fetch(self, url, filename, sha256=None):
+        """Return the path of the local copy of url, download the file if it
+        is missing and revalidate it in the background if it is stale. If
+        sha256 is given the content is verified."""
+        path = os.path.join(self.directory, filename)
+        if self._is_fresh(path, self._read_meta(path)):
+            return path
+        if os.path.exists(path):
+            self._revalidate_later(url, path, sha256)
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(path + ".lock"):
+            # another process may have downloaded the file meanwhile
+            meta = self._read_meta(path)
+            if not os.path.exists(path):
+                self._download(url, path, meta, sha256)
+        return path
+
+    def _revalidate_later(self, url, path, sha256):
+        with self._lock:
+            if path in self._pending:
+                return
+            thread = threading.Thread(
+                target=self._revalidate, args=(url, path, sha256), daemon=True
+            )
+            self._pending[path] = thread
+        thread.start()
+
+    def _revalidate(self, url, path, sha256):
+        try:
+            with file_lock(path + ".lock", blocking=False) as locked:
+                meta = self._read_meta(path)
+                # revalidated meanwhile, or being revalidated, by another
+                # process
+                if not locked or self._is_fresh(path, meta):
+                    return
+                try:
+                    self._download(url, path, meta, sha256)
+                except (HTTPError, URLError, OSError, ChecksumError) as exc:
+                    self.stats["errors"] += 1
+                    LOGGER.warning(f"Failed to revalidate {url}, using {path}: {exc}")
+                    # do not retry on every request while the server is
+                    # unreachable
+                    meta["checked"] = time.time()
+                    self._write_meta(path, meta)
+        finally:
+            with self._lock:
+                del self._pending[path]
+
+    def wait(self, timeout=None):
+        """Wait for the revalidations in progress in the process."""
+        with self._lock:
+            threads = list(self._pending.values())
+        for thread in threads:
+            thread.join(timeout)
+
+    def _download(self, url, path, meta, sha256):
+        headers = {"User-Agent": "Mozilla/5.0"}
+        if os.path.exists(path):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            resp = urlopen(Request(url, headers=headers), timeout=self.timeout)
+        except HTTPError as exc:
+            if exc.code != 304:
+                raise
+            LOGGER.info(f"Not modified: {url}")
+            self.stats["not_modified"] += 1
+            meta["checked"] = time.time()
+            self._write_meta(path, meta)
+            return
+        LOGGER.info(f"Downloading: {url}")
+        sha = hashlib.sha256()
+        fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with resp, os.fdopen(fd, mode="wb") as tmpfile:
+                for block in iter(lambda: resp.read(BLOCKSIZE), b""):
+                    sha.update(block)
+                    tmpfile.write(block)
+            digest = sha.hexdigest()
+            if sha256 is not None and digest != sha256:
+                raise ChecksumError(
+                    f"Checksum mismatch for {url}: {digest} instead of {sha256}"
+                )
+            os.replace(tmppath, path)
+        except BaseException:
+            os.remove(tmppath)
+            raise
+        self.stats["downloads"] += 1
+        self._write_meta(
+            path,
+            dict(
+                url=url,
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+                sha256=digest,
+                checked=time.time(),
+            ),
+        )
+
+
+# downloader shared by all the requests served by the process
+DOWNLOADER = Downloader()
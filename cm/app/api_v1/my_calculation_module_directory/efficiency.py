@@ -0,0 +1,54 @@
+from collections import namedtuple
+
+import numpy as np
+
+# columns of the efficiency matrix
+COLLECTION, HEAT, ELECTRICITY = 0, 1, 2
+
+
+class Potentials(namedtuple("Potentials", ("heat", "electricity"))):
+    """Heat and electricity potentials with shape: (..., layers, regions)."""
+
+    __slots__ = ()
+
+    def by_layer(self):
+        """Return the potentials summed over the regions."""
+        return Potentials(self.heat.sum(axis=-1), self.electricity.sum(axis=-1))
+
+    def by_region(self):
+        """Return the potentials summed over the layers."""
+        return Potentials(self.heat.sum(axis=-2), self.electricity.sum(axis=-2))
+
+    def total(self):
+        """Return the potentials summed over layers and regions."""
+        return Potentials(
+            self.heat.sum(axis=(-2, -1)), self.electricity.sum(axis=(-2, -1))
+        )
+
+
+def efficiency_matrix(psel, keys):
+    """Return the (layers x 3) matrix with the collection, heat and
+    electricity efficiencies of each layer, keys is a sequence of tuples with
+    the parameter names: (collection, heat, electricity)."""
+    return np.array([[psel[key] for key in lkeys] for lkeys in keys], dtype=float)
+
+
+def compute_potentials(energy, efficiencies):
+    """Compute the heat and electricity potentials of all the layers and
+    regions at once.
+
+    energy: array with shape (layers, regions) with the energy of each layer
+        and region.
+    efficiencies: array with shape (..., layers, 3) with the collection, heat
+        and electricity efficiency of each layer, leading dimensions can be
+        used to evaluate several scenarios.
+    """
+    energy = np.asarray(energy, dtype=float)
+    eff = np.asarray(efficiencies, dtype=float)
+    # (..., layers, 1, 1) * (..., layers, 2, 1) * (layers, 1, regions)
+    res = (
+        eff[..., COLLECTION, np.newaxis, np.newaxis]
+        * eff[..., HEAT:, np.newaxis]
+        * energy[:, np.newaxis, :]
+    )
+    return Potentials(res[..., 0, :], res[..., 1, :])
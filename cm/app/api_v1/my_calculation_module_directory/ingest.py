@@ -0,0 +1,85 @@
+import hashlib
+from operator import itemgetter
+
+import numpy as np
+
+from ...exceptions import ValidationError
+from .units import ENERGY_UNIT, convert
+
+FIELDS = ("code", "source", "unit", "value")
+
+
+def records_to_columns(records, fields=FIELDS):
+    """Return a dictionary of columns built in one pass from the list of
+    records (dictionaries) of a vector layer, the value column is a float64
+    array with the missing values set to 0."""
+    try:
+        rows = list(map(itemgetter(*fields), records))
+    except (KeyError, TypeError) as exc:
+        raise ValidationError(f"Invalid vector layer record, missing: {exc}")
+    cols = dict(zip(fields, zip(*rows))) if rows else {f: () for f in fields}
+    if "value" in cols:
+        value = np.array(cols["value"], dtype=np.float64)
+        value[np.isnan(value)] = 0.0
+        cols["value"] = value
+    return cols
+
+
+def columns_energy(cols, to_unit=ENERGY_UNIT):
+    """Return the energy of the unit and value columns of a vector layer in
+    to_unit."""
+    if not len(cols["value"]):
+        return 0.0
+    return convert(cols["value"], cols["unit"], to_unit).sum()
+
+
+def records_energy(records, to_unit=ENERGY_UNIT):
+    """Return the energy of the records of a vector layer in to_unit."""
+    if not records:
+        return 0.0
+    cols = records_to_columns(records, fields=("unit", "value"))
+    return columns_energy(cols, to_unit)
+
+
+def columns_digest(layers, fields=("code", "unit")):
+    """Return the sha256 hex digest of the columns of vector layers: the
+    string fields and the value array of each layer, without any json
+    encoding of the records."""
+    sha = hashlib.sha256()
+    for cols in layers:
+        sha.update(f"{len(cols['value'])}:".encode())
+        for field in fields:
+            sha.update("\0".join(map(str, cols[field])).encode("utf-8") + b"\1")
+        sha.update(np.ascontiguousarray(cols["value"], dtype=np.float64).tobytes())
+    return sha.hexdigest()
+
+
+def records_energy_by_code(records, codes, to_unit=ENERGY_UNIT):
+    """Return the energy of the records of a vector layer, in to_unit,
+    summed by code, codes is a sorted array of unique codes."""
+    energy = np.zeros(len(codes), dtype=np.float64)
+    if not records or not len(codes):
+        return energy
+    cols = records_to_columns(records, fields=("code", "unit", "value"))
+    rcodes = np.asarray(cols["code"], dtype=str)
+    pos = np.minimum(np.searchsorted(codes, rcodes), len(codes) - 1)
+    found = codes[pos] == rcodes
+    values = convert(cols["value"], cols["unit"], to_unit)
+    energy += np.bincount(pos[found], weights=values[found], minlength=len(codes))
+    return energy
+
+
+def records_codes(inputs_vector_selection, layers):
+    """Return the set of NUTS codes found in the records of the layers."""
+    getter = itemgetter("code")
+    codes = set()
+    for layer in layers:
+        records = inputs_vector_selection.get(layer) or ()
+        try:
+            codes.update(map(getter, records))
+        except (KeyError, TypeError):
+            # records without code are ignored
+            codes.update(rec.get("code") for rec in records)
+    codes.discard(None)
+    codes.discard("")
+    return codes
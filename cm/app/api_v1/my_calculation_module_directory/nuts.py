@@ -0,0 +1,251 @@
+import numpy as np
+
+# NUTS 0 codes are the two letters of the country, every further level
+# adds one character: AT -> AT1 -> AT11 -> AT111
+NUTS0_LEN = 2
+NUTS_LEVELS = (0, 1, 2, 3)
+
+# character sorting after any character used in a NUTS code, used to build
+# the upper bound of a prefix search
+_MAXCHAR = "\U0010ffff"
+
+
+def nuts_level(code):
+    """Return the NUTS level of a code, e.g.: AT -> 0, AT111 -> 3."""
+    return len(code) - NUTS0_LEN
+
+
+def normalize_codes(codes):
+    """Return a sorted array of unique, upper case and stripped NUTS codes."""
+    if isinstance(codes, str):
+        codes = [codes]
+    return np.unique(np.char.upper(np.char.strip(np.asarray(list(codes), dtype=str))))
+
+
+def outermost_codes(codes):
+    """Return the codes that are not below another code of the selection,
+    e.g.: AT1 and DE for AT1, AT111 and DE."""
+    selected = set(codes)
+    return [
+        code
+        for code in codes
+        if not any(code[:size] in selected for size in range(2, len(code)))
+    ]
+
+
+def merge_spans(lo, hi):
+    """Merge overlapping [lo, hi) intervals, return the disjoint intervals
+    sorted by start."""
+    keep = hi > lo
+    lo, hi = lo[keep], hi[keep]
+    if len(lo) == 0:
+        return lo, hi
+    order = np.argsort(lo, kind="stable")
+    lo, hi = lo[order], np.maximum.accumulate(hi[order])
+    # a new interval starts where the start is beyond the previous stop
+    start = np.ones(len(lo), dtype=bool)
+    start[1:] = lo[1:] > hi[:-1]
+    ends = np.flatnonzero(np.append(start[1:], True))
+    return lo[start], hi[ends]
+
+
+class NutsIndex(object):
+    """Sorted index from NUTS codes to the row positions of a dataset.
+
+    Rows are ordered by code, therefore every code and every prefix of a
+    code (e.g.: AT1 for AT111, AT112, AT121, ...) maps to a contiguous
+    interval of rows. Sums over a selection are computed with a prefix sum
+    of the sorted values, without scanning the dataset.
+    """
+
+    def __init__(self, codes, values=None):
+        codes = np.asarray(codes, dtype=str)
+        self.order = np.argsort(codes, kind="stable")
+        self.codes = codes[self.order]
+        self.values = None
+        self.csum = None
+        if values is not None:
+            self.set_values(values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def from_arrays(cls, order, codes, values, csum):
+        """Build the index from the arrays returned by `arrays`, without
+        copying them (e.g.: memory mapped arrays)."""
+        index = cls.__new__(cls)
+        index.order, index.codes, index.values, index.csum = order, codes, values, csum
+        return index
+
+    def arrays(self):
+        """Return the arrays of the index."""
+        return dict(
+            order=self.order, codes=self.codes, values=self.values, csum=self.csum
+        )
+
+    def set_values(self, values):
+        """Store the values, sorted as the codes, and their prefix sum."""
+        self.values = np.ascontiguousarray(np.asarray(values)[self.order])
+        self.csum = np.zeros(len(self.values) + 1, dtype=np.float64)
+        np.cumsum(self.values, out=self.csum[1:])
+
+    def bounds(self, codes):
+        """Return the [lo, hi) interval of the sorted rows matching each
+        code or code prefix, codes must be normalized."""
+        lo = np.searchsorted(self.codes, codes, side="left")
+        hi = np.searchsorted(self.codes, np.char.add(codes, _MAXCHAR), side="left")
+        return lo, hi
+
+    def spans(self, codes):
+        """Return the disjoint [lo, hi) intervals of the sorted rows matching
+        the selected codes or code prefixes."""
+        return merge_spans(*self.bounds(normalize_codes(codes)))
+
+    def rows(self, codes):
+        """Return the positions, in the original dataset, of the rows
+        matching the selected codes or code prefixes."""
+        lo, hi = self.spans(codes)
+        if len(lo) == 0:
+            return np.empty(0, dtype=self.order.dtype)
+        sizes = hi - lo
+        # vectorized concatenation of the ranges lo[i]:hi[i]
+        offsets = np.repeat(lo - np.cumsum(sizes) + sizes, sizes)
+        return self.order[offsets + np.arange(sizes.sum())]
+
+    def sum(self, codes):
+        """Return the sum of the values of the selected codes."""
+        lo, hi = self.spans(codes)
+        return (self.csum[hi] - self.csum[lo]).sum()
+
+    def sums(self, codes):
+        """Return the sum of the values of each code or code prefix, codes
+        must be normalized."""
+        lo, hi = self.bounds(codes)
+        return self.csum[hi] - self.csum[lo]
+
+
+class NutsCube(object):
+    """Rollup of the values by source at every NUTS level.
+
+    For each level the codes of the rows are truncated to the length of the
+    level and the values are summed by (code, source), e.g.: the NUTS 0 row
+    of AT contains the sum of all the AT rows. A selection is reduced to the
+    coarsest codes covering it, selecting all the NUTS 3 of a country costs
+    one lookup.
+    """
+
+    def __init__(self, codes, sources, values):
+        codes = np.asarray(codes, dtype=str)
+        sources, src = np.unique(np.asarray(sources, dtype=str), return_inverse=True)
+        values = np.asarray(values, dtype=np.float64)
+        nsrc = len(sources)
+        lengths = np.char.str_len(codes)
+        keys, sums = [], []
+        for level in NUTS_LEVELS:
+            size = NUTS0_LEN + level
+            mask = lengths >= size
+            lkeys, inv = np.unique(codes[mask].astype(f"<U{size}"), return_inverse=True)
+            keys.append(lkeys)
+            sums.append(
+                np.bincount(
+                    inv * nsrc + src[mask],
+                    weights=values[mask],
+                    minlength=len(lkeys) * nsrc,
+                ).reshape(len(lkeys), nsrc)
+            )
+        self._set_levels(sources, keys, sums)
+
+    def _set_levels(self, sources, keys, sums):
+        self.sources, self.keys, self.sums = sources, keys, sums
+        self.table = {}
+        self.nchildren = {}
+        for level, (lkeys, lsums) in zip(NUTS_LEVELS, zip(keys, sums)):
+            self.table.update(zip(lkeys.tolist(), lsums))
+            if level > 0:
+                parents, counts = np.unique(
+                    lkeys.astype(f"<U{NUTS0_LEN + level - 1}"), return_counts=True
+                )
+                self.nchildren.update(zip(parents.tolist(), counts.tolist()))
+        self.empty = np.zeros(len(sources), dtype=np.float64)
+
+    @classmethod
+    def from_arrays(cls, sources, keys, sums):
+        """Build the cube from the arrays returned by `arrays`."""
+        cube = cls.__new__(cls)
+        cube._set_levels(sources, keys, sums)
+        return cube
+
+    def arrays(self):
+        """Return the sources and, for each NUTS level, the codes and the
+        sums by source."""
+        return dict(sources=self.sources, keys=self.keys, sums=self.sums)
+
+    def cover(self, codes):
+        """Return the coarsest list of codes that covers the selection."""
+        return cover(normalize_codes(codes), [self])
+
+    def sum(self, codes, by_source=False):
+        """Return the sum of the values of the selected codes, by source if
+        required."""
+        return self.sum_cover(self.cover(codes), by_source=by_source)
+
+    def sum_cover(self, codes, by_source=False):
+        """Return the sum of the values of a cover, see `cover`."""
+        res = sum((self.table.get(code, self.empty) for code in codes), self.empty)
+        return res if by_source else res.sum()
+
+
+def cover(codes, cubes):
+    """Return the coarsest list of codes that covers the normalized codes in
+    all the cubes: a parent replaces its children only when the selection
+    contains all its children in every cube."""
+    selected = {
+        code for code in codes.tolist() if any(code in cube.table for cube in cubes)
+    }
+    # drop the codes already included by a selected ancestor
+    selected = {
+        code
+        for code in selected
+        if not any(code[:n] in selected for n in range(NUTS0_LEN, len(code)))
+    }
+    # replace the codes with their parent when all the children are selected
+    for level in sorted(NUTS_LEVELS[1:], reverse=True):
+        byparent = {}
+        for code in selected:
+            if nuts_level(code) == level:
+                byparent.setdefault(code[:-1], []).append(code)
+        for parent, children in byparent.items():
+            if all(
+                sum(code in cube.table for code in children)
+                == cube.nchildren.get(parent, 0)
+                for cube in cubes
+            ):
+                selected.difference_update(children)
+                selected.add(parent)
+    return sorted(selected)
+
+
+class NutsSelection(object):
+    """Selected NUTS codes, normalized once and shared by the datasets of a
+    request.
+
+    A selection of NUTS 3 codes only is summed with the spans of the
+    NutsIndex of each dataset, which are vectorized. Any other selection is
+    reduced to the coarsest codes covering it in all the cubes, computed
+    once, and summed with the cube of each dataset.
+    """
+
+    def __init__(self, codes, cubes):
+        self.codes = normalize_codes(codes)
+        self.leaf = bool(
+            (np.char.str_len(self.codes) == NUTS0_LEN + NUTS_LEVELS[-1]).all()
+        )
+        self.cover = None if self.leaf else cover(self.codes, cubes)
+
+    def sum(self, index, cube):
+        """Return the sum of the values of the selection in a dataset."""
+        if self.leaf:
+            # codes of the same length are disjoint prefixes
+            return index.sums(self.codes).sum()
+        return cube.sum_cover(self.cover)
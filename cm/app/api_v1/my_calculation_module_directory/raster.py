@@ -0,0 +1,177 @@
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+# size of the tiles of the output rasters, data are read and written by tile
+BLOCK_SIZE = 256
+NODATA = -1.0
+# field of the NUTS code in the vector file of the geometries
+ID_FIELD = "NUTS_ID"
+CREATION_OPTIONS = (
+    "TILED=YES",
+    f"BLOCKXSIZE={BLOCK_SIZE}",
+    f"BLOCKYSIZE={BLOCK_SIZE}",
+    "COMPRESS=DEFLATE",
+    "PREDICTOR=3",
+    "BIGTIFF=IF_SAFER",
+)
+
+
+def get_gdal():
+    """Return the gdal module, imported at the first call."""
+    from osgeo import gdal
+
+    gdal.UseExceptions()
+    return gdal
+
+
+def iter_windows(xsize, ysize, block_size=BLOCK_SIZE):
+    """Yield the (xoff, yoff, width, height) windows covering a raster of
+    xsize x ysize cells, aligned to the tiles of the output rasters."""
+    for yoff in range(0, ysize, block_size):
+        height = min(block_size, ysize - yoff)
+        for xoff in range(0, xsize, block_size):
+            yield xoff, yoff, min(block_size, xsize - xoff), height
+
+
+def valid_cells(array, nodata=None):
+    """Return the mask of the cells with data."""
+    mask = np.isfinite(array)
+    if nodata is not None:
+        mask &= array != nodata
+    return mask
+
+
+def region_densities(values, ncells, hectares):
+    """Return the density per hectare of each region, NODATA for the
+    regions without any valid cell.
+
+    values: value of each region, e.g. in MWh
+    ncells: number of valid cells of each region
+    """
+    values = np.asarray(values, dtype=float)
+    densities = np.full(len(values), NODATA, dtype=np.float32)
+    covered = ncells > 0
+    densities[covered] = values[covered] / (ncells[covered] * hectares)
+    return densities
+
+
+def burn_regions(src, geometries, codes, path, id_field=ID_FIELD):
+    """Write the raster of the regions on the grid of src: the cells of the
+    geometry of codes[i] are set to i + 1, the other cells to 0.
+
+    geometries: vector file of the NUTS regions, with their code in id_field
+    """
+    gdal = get_gdal()
+    from osgeo import ogr
+
+    vector = gdal.OpenEx(geometries, gdal.OF_VECTOR)
+    layer = vector.GetLayer(0)
+    # the ids of the regions are burnt from an attribute of a layer in memory
+    regions = ogr.GetDriverByName("Memory").CreateDataSource("regions")
+    burnt = regions.CreateLayer("regions", layer.GetSpatialRef(), ogr.wkbUnknown)
+    burnt.CreateField(ogr.FieldDefn("region", ogr.OFTInteger))
+    ids = {code: i + 1 for i, code in enumerate(codes)}
+    for feature in layer:
+        region = ids.get(feature.GetField(id_field))
+        if region is not None:
+            out = ogr.Feature(burnt.GetLayerDefn())
+            out.SetGeometry(feature.GetGeometryRef())
+            out.SetField("region", region)
+            burnt.CreateFeature(out)
+
+    dst = gdal.GetDriverByName("GTiff").Create(
+        path,
+        src.RasterXSize,
+        src.RasterYSize,
+        1,
+        gdal.GDT_Int32,
+        options=[opt for opt in CREATION_OPTIONS if not opt.startswith("PREDICTOR")],
+    )
+    dst.SetGeoTransform(src.GetGeoTransform())
+    dst.SetProjection(src.GetProjection())
+    dst.GetRasterBand(1).Fill(0)
+    # the geometries are reprojected to the grid when the systems differ
+    gdal.RasterizeLayer(dst, [1], burnt, options=["ATTRIBUTE=region"])
+    dst.FlushCache()
+    del dst, burnt, regions, layer, vector
+    return path
+
+
+def write_density(
+    reference, geometries, codes, outputs, id_field=ID_FIELD, block_size=BLOCK_SIZE
+):
+    """Spread uniformly the value of each region, e.g. in MWh, over the
+    valid cells of its geometry and write the density per hectare, e.g. in
+    MWh/ha, on a grid aligned to the reference raster.
+
+    geometries: vector file of the NUTS regions, with their code in id_field
+    codes: codes of the regions, they must not overlap
+    outputs: list of (path, values) tuples, values of each code, all the
+        outputs are written in the same pass over the reference.
+    The regions are burnt on the grid of the reference, then the reference
+    and the regions are read twice, tile by tile: to count the valid cells
+    of each region and to write the densities, memory is bounded by the
+    size of one tile.
+    """
+    gdal = get_gdal()
+    src = gdal.Open(reference)
+    band = src.GetRasterBand(1)
+    nodata = band.GetNoDataValue()
+    xsize, ysize = src.RasterXSize, src.RasterYSize
+    geotransform = src.GetGeoTransform()
+    hectares = abs(geotransform[1] * geotransform[5]) / 1e4
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(outputs[0][0])) as tmpdir:
+        regions = gdal.Open(
+            burn_regions(
+                src, geometries, codes, os.path.join(tmpdir, "regions.tif"), id_field
+            )
+        )
+        rband = regions.GetRasterBand(1)
+
+        def tiles():
+            for window in iter_windows(xsize, ysize, block_size):
+                ids = rband.ReadAsArray(*window)
+                mask = valid_cells(band.ReadAsArray(*window), nodata) & (ids > 0)
+                yield window, ids, mask
+
+        ncells = np.zeros(len(codes) + 1, dtype=np.int64)
+        for _, ids, mask in tiles():
+            ncells += np.bincount(ids[mask], minlength=len(ncells))
+        missing = [code for code, n in zip(codes, ncells[1:]) if n == 0]
+        if missing:
+            LOGGER.warning(
+                f"{len(missing)} regions without any valid cell in {reference}: "
+                f"{missing[:10]}"
+            )
+        LOGGER.info(f"Burning {len(codes)} regions on {ncells.sum()} cells")
+
+        driver = gdal.GetDriverByName("GTiff")
+        dsts = []
+        for path, values in outputs:
+            dst = driver.Create(
+                path, xsize, ysize, 1, gdal.GDT_Float32, options=list(CREATION_OPTIONS)
+            )
+            dst.SetGeoTransform(geotransform)
+            dst.SetProjection(src.GetProjection())
+            dst.GetRasterBand(1).SetNoDataValue(NODATA)
+            # density of each region id, id 0 are the cells out of the regions
+            densities = np.concatenate(
+                [[NODATA], region_densities(values, ncells[1:], hectares)]
+            ).astype(np.float32)
+            dsts.append((dst, densities))
+
+        for (xoff, yoff, _, _), ids, mask in tiles():
+            for dst, densities in dsts:
+                block = np.where(mask, densities[ids], np.float32(NODATA))
+                dst.GetRasterBand(1).WriteArray(block, xoff, yoff)
+        for dst, _ in dsts:
+            dst.FlushCache()
+        # the gdal datasets are closed when they are dereferenced
+        del dsts, rband, regions, band, src
+    return [path for path, _ in outputs]
@@ -0,0 +1,146 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from ... import encoder
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get(
+    "CM_RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "biomass_results")
+)
+CACHE_SIZE = int(os.environ.get("CM_RESULT_CACHE_SIZE", 1024))
+CACHE_TTL = float(os.environ.get("CM_RESULT_CACHE_TTL", 24 * 3600))
+
+
+def make_key(**kwargs):
+    """Return a stable hash of the keyword arguments, the arguments must be
+    JSON serializable."""
+    txt = json.dumps(kwargs, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(txt.encode("utf-8")).hexdigest()
+
+
+class ResultCache(object):
+    """LRU cache with time to live of JSON serializable results.
+
+    Results are kept in memory and, if `directory` is given, in one file per
+    key, so that all the processes of the host (e.g.: gunicorn workers)
+    share the results. Entries expire `ttl` seconds after they are
+    computed, however often they are used: the modification time of the
+    files is the time of creation and their access time, set at every hit,
+    is used to evict the least recently used ones.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, directory=CACHE_DIR):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.directory = directory
+        self._mem = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = dict(
+            hits=0, misses=0, evictions=0, file_evictions=0, expirations=0
+        )
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def hit_ratio(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def _get_file(self, key, now):
+        path = self._path(key)
+        try:
+            created = os.stat(path).st_mtime
+            if now - created > self.ttl:
+                os.remove(path)
+                self.stats["expirations"] += 1
+                return None
+            with open(path, mode="rb") as jsfile:
+                txt = jsfile.read()
+            # mark the entry as recently used, keep its time of creation
+            os.utime(path, (now, created))
+            return created, txt
+        except OSError:
+            # missing file or removed by another process
+            return None
+
+    def get(self, key):
+        """Return the cached result or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._mem[key]
+                self.stats["expirations"] += 1
+                entry = None
+            if entry is None and self.directory is not None:
+                entry = self._get_file(key, now)
+                if entry is not None:
+                    self._set_mem(key, entry)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._mem.move_to_end(key)
+            self.stats["hits"] += 1
+        return encoder.loads(entry[1])
+
+    def _set_mem(self, key, entry):
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def set(self, key, result):
+        """Store the result, return the serialized result."""
+        txt = encoder.dumps(result)
+        now = time.time()
+        with self._lock:
+            self._set_mem(key, (now, txt))
+        if self.directory is not None:
+            fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, mode="wb") as jsfile:
+                jsfile.write(txt)
+            os.replace(tmppath, self._path(key))
+            self._evict_files()
+        return txt
+
+    def _evict_files(self):
+        """Remove the least recently used files beyond maxsize."""
+        try:
+            entries = [
+                entry
+                for entry in os.scandir(self.directory)
+                if entry.name.endswith(".json")
+            ]
+            if len(entries) <= self.maxsize:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_atime)
+            for entry in entries[: len(entries) - self.maxsize]:
+                os.remove(entry.path)
+                self.stats["file_evictions"] += 1
+        except OSError as exc:
+            # files removed concurrently by another process
+            LOGGER.debug(f"Result cache eviction skipped: {exc}")
+
+    def clear(self):
+        """Remove all the cached results."""
+        with self._lock:
+            self._mem.clear()
+            if self.directory is not None:
+                for entry in os.scandir(self.directory):
+                    if entry.name.endswith(".json"):
+                        os.remove(entry.path)
+
+
+# results shared by all the requests served by the processes of the host
+RESULTS = ResultCache()
@@ -0,0 +1,74 @@
+import numpy as np
+
+from ...constant import INPUTS_CALCULATION_MODULE
+from ...exceptions import ValidationError
+
+DISTRIBUTIONS = ("uniform", "triangular", "normal")
+PERCENTILES = (5, 50, 95)
+NSAMPLES = 100000
+MAX_SAMPLES = 1000000
+
+# bounds of the parameters, in %, as defined in the SIGNATURE
+BOUNDS = {
+    inp["input_parameter_name"]: (float(inp["input_min"]), float(inp["input_max"]))
+    for inp in INPUTS_CALCULATION_MODULE
+}
+
+
+def sample_parameter(rng, name, spec, size):
+    """Return `size` samples, in %, of the parameter `name` drawn from the
+    distribution described by `spec` and bounded by input_min/input_max, e.g.:
+
+        {"distribution": "triangular", "min": 40, "mode": 50, "max": 70}
+        {"distribution": "normal", "mean": 50, "std": 5}
+    """
+    low, high = BOUNDS[name]
+    kind = spec.get("distribution", "uniform")
+    try:
+        lo = max(float(spec.get("min", low)), low)
+        hi = min(float(spec.get("max", high)), high)
+        if lo > hi:
+            raise ValueError(f"min: {lo} is greater than max: {hi}")
+        if kind == "uniform":
+            samples = rng.uniform(lo, hi, size)
+        elif kind == "triangular":
+            mode = min(max(float(spec.get("mode", (lo + hi) / 2.0)), lo), hi)
+            samples = (
+                rng.triangular(lo, mode, hi, size) if hi > lo else np.full(size, lo)
+            )
+        elif kind == "normal":
+            samples = rng.normal(float(spec["mean"]), float(spec["std"]), size)
+        else:
+            raise ValueError(
+                f"unknown distribution: {kind!r}, use one of: {DISTRIBUTIONS}"
+            )
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValidationError(f"Invalid distribution for {name}: {exc}")
+    return np.clip(samples, lo, hi)
+
+
+def sample_efficiencies(psel, distributions, keys, nsamples=NSAMPLES, seed=None):
+    """Return an array with shape (nsamples, layers, 3) with the sampled
+    collection, heat and electricity efficiencies, the parameters without a
+    distribution keep the value of psel."""
+    unknown = set(distributions) - set(BOUNDS)
+    if unknown:
+        raise ValidationError(f"Unknown parameters: {sorted(unknown)}")
+    if not 0 < nsamples <= MAX_SAMPLES:
+        raise ValidationError(f"The number of samples must be in: 1-{MAX_SAMPLES}")
+    rng = np.random.default_rng(seed)
+    effs = np.empty((nsamples, len(keys), 3), dtype=np.float64)
+    for layer, lkeys in enumerate(keys):
+        for col, key in enumerate(lkeys):
+            if key in distributions:
+                effs[:, layer, col] = (
+                    sample_parameter(rng, key, distributions[key], nsamples) / 100.0
+                )
+            else:
+                effs[:, layer, col] = psel[key]
+    return effs
+
+
+def percentile_bands(values, percentiles=PERCENTILES):
+    """Return the percentiles of the samples along the first axis."""
+    return np.percentile(values, percentiles, axis=0)
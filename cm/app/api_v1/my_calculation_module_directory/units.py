@@ -0,0 +1,62 @@
+import functools
+import logging
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+# unit used for all the energy computations
+ENERGY_UNIT = "MWh"
+
+# unit names used in the datasets that are not understood by pint
+ALIASES = {"PetaJoule": "PJ", "TeraJoule": "TJ", "GigaJoule": "GJ"}
+
+# precomputed conversion factors, pint is used only for missing pairs
+FACTORS = {
+    ("PJ", "MWh"): 1e15 / 3.6e9,
+    ("TJ", "MWh"): 1e12 / 3.6e9,
+    ("GJ", "MWh"): 1e9 / 3.6e9,
+    ("MJ", "MWh"): 1e6 / 3.6e9,
+    ("TWh", "MWh"): 1e6,
+    ("GWh", "MWh"): 1e3,
+    ("MWh", "MWh"): 1.0,
+    ("kWh", "MWh"): 1e-3,
+}
+
+_UREG = None
+
+
+def get_registry():
+    """Return the pint unit registry, building it at the first call."""
+    global _UREG
+    if _UREG is None:
+        from pint import UnitRegistry
+
+        _UREG = UnitRegistry()
+    return _UREG
+
+
+@functools.lru_cache(maxsize=None)
+def conversion_factor(from_unit, to_unit):
+    """Return the factor to convert a value from `from_unit` to `to_unit`."""
+    from_unit = ALIASES.get(from_unit, from_unit)
+    to_unit = ALIASES.get(to_unit, to_unit)
+    if (from_unit, to_unit) in FACTORS:
+        return FACTORS[(from_unit, to_unit)]
+    if (to_unit, from_unit) in FACTORS:
+        return 1.0 / FACTORS[(to_unit, from_unit)]
+    LOGGER.info(f"Conversion factor from {from_unit} to {to_unit} not cached")
+    ureg = get_registry()
+    return ureg.Quantity(1.0, ureg.parse_units(from_unit)).to(to_unit).magnitude
+
+
+def convert(values, units, to_unit=ENERGY_UNIT):
+    """Convert element-wise an array of values with the corresponding array
+    of units, units can be a pandas Categorical or an array of strings."""
+    values = np.asarray(values, dtype=np.float64)
+    if hasattr(units, "categories"):
+        categories, codes = units.categories, units.codes
+    else:
+        categories, codes = np.unique(np.asarray(units, dtype=str), return_inverse=True)
+    factors = np.array([conversion_factor(str(u), to_unit) for u in categories])
+    return values * factors[codes]
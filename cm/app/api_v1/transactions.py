@@ -6,14 +6,19 @@ import json
 import requests
 import logging
 import os
-from flask import send_from_directory
-from  app import helper
-from app import constant
+import shutil
+from flask import Response, send_from_directory
+from app import encoder, profiling, prometheus
+from app.exceptions import ValidationError
+from app.http_client import CLIENT
+from app.metrics import STATS
+from app.profiling import stage
+from app.warmup import is_ready
+from app.validation import VALIDATOR
 
 from app.api_v1 import errors
-import socket
 from . import calculation_module
-from app import CalculationModuleRpcClient
+from app import rpc
 
 LOG_FORMAT = ('%(levelname) -10s %(asctime)s %(name) -30s %(funcName) '
               '-35s %(lineno) -5d: %(message)s')
@@ -24,6 +29,24 @@ UPLOAD_DIRECTORY = '/var/tmp'
 if not os.path.exists(UPLOAD_DIRECTORY):
     os.makedirs(UPLOAD_DIRECTORY)
     os.chmod(UPLOAD_DIRECTORY, 0o777)
+# buffer of the copy of the downloaded files
+COPY_BUFFER_SIZE = 1 << 20
+
+@api.route('/ready/', methods=['GET'])
+def ready():
+    # the CM is ready once the datasets are loaded and a worker serves the
+    # requests at steady-state latency
+    if is_ready():
+        return jsonify({'ready': True})
+    response = jsonify({'ready': False})
+    response.status_code = 503
+    return response
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    # counters of all the workers and consumers of the host, including the
+    # ones that exited, in the Prometheus text format
+    return Response(prometheus.render(), mimetype=prometheus.CONTENT_TYPE)
 
 @api.route('/files/<string:filename>', methods=['GET'])
 def get(filename):
@@ -51,41 +74,32 @@ def register():
 
     # about to send the external IP
     print ('CM will begin register ')
-    ip = socket.gethostbyname(socket.gethostname())
-    # retrive dynamic url
-    base_url = 'http://'+ str(ip) +':'+ str(constant.PORT) +'/'
-    signature_final = SIGNATURE
-
-
-    calculation_module_rpc = CalculationModuleRpcClient()
-
-    signature_final["cm_url"] = base_url
-    payload = json.dumps(signature_final)
-    response = calculation_module_rpc.call(payload)
-
-
-    return response
+    return rpc.register()
 
 
 
 def savefile(filename,url):
-    print ('CM is Computing and will dowload files with url: ',url)
-    r = None
+    """Download the file into the upload directory, return its path or None.
+    The connections to the main web service are kept alive and the file is
+    copied from the socket with a large buffer."""
+    LOGGER.info('CM is Computing and will dowload files with url: %s', url)
     path = None
     try:
-        r = requests.get(url, stream=True)
-    except:
-        LOGGER.error('API unable to download tif files')
-
-
-    print ('image saved',r.status_code)
-    if r.status_code == 200:
-        path = os.path.join(UPLOAD_DIRECTORY, filename)
-        with open(path, 'wb') as f:
-            for chunk in r.iter_content(1024):
-                f.write(chunk)
-    else:
+        r = CLIENT.get(url, stream=True, name='raster')
+    except requests.RequestException:
         LOGGER.error('API unable to download tif files')
+        return path
+
+    with r:
+        if r.status_code == 200:
+            path = os.path.join(UPLOAD_DIRECTORY, filename)
+            r.raw.decode_content = True
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(r.raw, f, COPY_BUFFER_SIZE)
+            LOGGER.info('image saved %s', path)
+        else:
+            LOGGER.error('API unable to download tif files, status: %s',
+                         r.status_code)
 
     return path
 
@@ -126,35 +140,82 @@ def compute():
 
     print ('CM will Compute ')
     #import ipdb; ipdb.set_trace()
-    data = request.get_json()
-
+    with profiling.request() as timings:
+        with stage("parse"):
+            data = request.get_json()
+        response = compute_result(data)
+        if data.get("timings"):
+            response["timings"] = profiling.milliseconds(timings)
+        # NumPy scalars are encoded natively, large results can be streamed
+        if data.get("stream"):
+            return Response(encoder.iterencode(response), mimetype="application/json")
+        with stage("serialization"):
+            rv = Response(encoder.dumps(response), mimetype="application/json")
+        if data.get("timings"):
+            rv.headers["Server-Timing"] = profiling.server_timing(timings)
+        return rv
+
+
+@STATS.track()
+def compute_result(data):
+    """Validate the inputs of a compute request and run the calculation
+    module, return the response dictionary. It does not depend on the
+    flask request: the RPC consumer calls it directly."""
     #TODO CM Developper do not need to change anything here
     # here is the inputs layers and parameters
-    inputs_raster_selection = helper.validateJSON(data["inputs_raster_selection"])
+    # the inputs are checked against the SIGNATURE, parameters are converted
+    # to float and invalid requests are rejected with a 400
+    with stage("parse"):
+        (inputs_raster_selection,
+         inputs_vector_selection,
+         inputs_parameter_selection) = VALIDATOR.validate(data)
+        breakdown, raster = VALIDATOR.outputs(data)
     LOGGER.info(f"inputs_raster_selection {inputs_raster_selection}")
-
-    inputs_parameter_selection = helper.validateJSON(data["inputs_parameter_selection"])
     LOGGER.info(f"inputs_parameter_selection {inputs_parameter_selection}")
-
-    inputs_vector_selection = helper.validateJSON(data["inputs_vector_selection"])
-    LOGGER.info(f"inputs_vector_selection {inputs_vector_selection}")
+    # the vector selection can be large and it is already parsed by get_json
+    LOGGER.info("inputs_vector_selection: %s",
+                {k: len(v or ()) for k, v in inputs_vector_selection.items()})
 
     output_directory = UPLOAD_DIRECTORY
-    # call the calculation module function
-    result = calculation_module.calculation(output_directory, 
-                                            inputs_raster_selection,
-                                            inputs_vector_selection,
-                                            inputs_parameter_selection)
-
-    response = {
-        'result': result
-
-
-    }
-    LOGGER.info(f"type response {type(response)}")
-    # convert response dict to json
-    response = json.dumps(response)
-    LOGGER.info(f"response {response}")
-    return response
-
-
+    if data.get("sensitivity") not in (None, False):
+        # sample the parameters and return the percentile bands
+        with stage("parse"):
+            sensitivity = VALIDATOR.sensitivity(data["sensitivity"],
+                                                inputs_parameter_selection)
+        result = calculation_module.calculation_sensitivity(output_directory,
+                                                            inputs_raster_selection,
+                                                            inputs_vector_selection,
+                                                            inputs_parameter_selection,
+                                                            sensitivity)
+    elif isinstance(inputs_parameter_selection, list):
+        # batch mode: evaluate all the scenarios on the same selection
+        result = calculation_module.calculation_batch(output_directory,
+                                                      inputs_raster_selection,
+                                                      inputs_vector_selection,
+                                                      inputs_parameter_selection)
+    else:
+        # call the calculation module function
+        result = calculation_module.calculation(output_directory,
+                                                inputs_raster_selection,
+                                                inputs_vector_selection,
+                                                inputs_parameter_selection,
+                                                breakdown=breakdown,
+                                                raster=raster)
+
+    return {'result': result}
+
+
+def compute_reply(body):
+    """Return the reply to the body of a compute request, the same bytes as
+    the response of the compute route."""
+    with profiling.request() as timings:
+        try:
+            with stage("parse"):
+                data = json.loads(body)
+            response = compute_result(data)
+        except ValidationError as e:
+            return encoder.dumps(errors.bad_request_message(e))
+        if data.get("timings"):
+            response["timings"] = profiling.milliseconds(timings)
+        with stage("serialization"):
+            return encoder.dumps(response)
@@ -3,6 +3,8 @@ from time import time
 
 from flask import current_app, g, jsonify, request
 
+from ..metrics import STATS
+
 _limiter = None
 
 
@@ -75,6 +77,7 @@ def rate_limit(limit, period):
                 # if the client went over the limit respond with a 429 status
                 # code, else invoke the wrapped function
                 if not allowed:
+                    STATS.incr('rate_limited')
                     response = jsonify(
                         {'status': 429, 'error': 'too many requests',
                          'message': 'You have exceeded your request rate'})
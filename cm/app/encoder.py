@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# name of the backend used to serialize the responses
+BACKEND = "json" if orjson is None else "orjson"
+# size of the chunks of a streamed response
+CHUNK_SIZE = 1 << 16
+
+
+def default(obj):
+    """Convert the NumPy scalars and arrays to Python objects."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_ENCODER = json.JSONEncoder(default=default, separators=(",", ":"))
+
+
+def dumps(obj):
+    """Return the compact JSON encoding, as bytes, of obj."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return _ENCODER.encode(obj).encode("utf-8")
+
+
+def loads(data):
+    """Return the object decoded from a JSON str or bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def iterencode(obj, chunk_size=CHUNK_SIZE):
+    """Yield the bytes of dumps(obj) in chunks of about chunk_size bytes.
+
+    orjson encodes the whole document at once, much faster than the json
+    module streams it, the stream is then a split of the same bytes. Without
+    orjson the document is encoded while it is streamed.
+    """
+    if orjson is not None:
+        data = dumps(obj)
+        for start in range(0, len(data), chunk_size):
+            yield data[start : start + chunk_size]
+        return
+    buf, size = [], 0
+    for txt in _ENCODER.iterencode(obj):
+        buf.append(txt)
+        size += len(txt)
+        if size >= chunk_size:
+            yield "".join(buf).encode("utf-8")
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf).encode("utf-8")
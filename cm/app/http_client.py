@@ -0,0 +1,69 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+LOGGER = logging.getLogger(__name__)
+
+# connections kept alive for each host, at least the number of threads
+# calling the same host (e.g. the consumer calling the web workers)
+POOL_SIZE = int(os.environ.get("CM_HTTP_POOL_SIZE", 32))
+# number of hosts with a pool of connections
+POOL_HOSTS = 4
+
+
+class HttpClient(object):
+    """HTTP client shared by the threads of the process.
+
+    The connections are kept alive and reused from a pool for each host,
+    the time of each call is recorded by name, e.g. "compute" or "raster".
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, pool_hosts=POOL_HOSTS):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def request(self, method, url, name=None, **kwargs):
+        name = name or method.lower()
+        error = False
+        start = time.perf_counter()
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            error = True
+            raise
+        finally:
+            self._record(name, time.perf_counter() - start, error)
+
+    def _record(self, name, seconds, error):
+        with self._lock:
+            stats = self.stats.setdefault(
+                name, dict(calls=0, errors=0, seconds=0.0, max_seconds=0.0)
+            )
+            stats["calls"] += 1
+            stats["errors"] += error
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        LOGGER.debug(f"HTTP call {name} took {seconds * 1e3:.1f} ms")
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def timings(self):
+        """Return a copy of the statistics of the calls."""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self.stats.items()}
+
+
+# client shared by all the requests of the process
+CLIENT = HttpClient()
@@ -0,0 +1,369 @@
+import bisect
+import collections
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+
+from .exceptions import ValidationError
+
+LOGGER = logging.getLogger(__name__)
+
+# directory of the files with the statistics of the processes of the host
+METRICS_DIR = os.environ.get(
+    "CM_METRICS_DIR", os.path.join(tempfile.gettempdir(), "biomass_metrics")
+)
+# number of latencies kept by each process
+WINDOW = int(os.environ.get("CM_METRICS_WINDOW", 1000))
+# seconds between two writes of the statistics of a process
+INTERVAL = float(os.environ.get("CM_METRICS_INTERVAL", 1.0))
+PERCENTILES = (50, 95, 99)
+# upper bounds of the buckets of the histograms, in seconds
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    float("inf"),
+)
+# counters of the statistics, the ones of the processes that exited are
+# summed in the archive of their role
+COUNTERS = (
+    "requests",
+    "errors",
+    "rejected",
+    "rate_limited",
+    "responses",
+    "routes",
+    "stages",
+    "datasets",
+    "results",
+)
+# fields of the counters that are not counted
+NOT_COUNTED = frozenset(("last_load",))
+ARCHIVE = "archive.json"
+
+
+def rss():
+    """Return the resident memory of the process in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # peak memory, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentiles(values, qs=PERCENTILES):
+    """Return the nearest-rank percentiles of the values."""
+    values = sorted(values)
+    if not values:
+        return {f"p{q}": None for q in qs}
+    return {f"p{q}": values[max(0, -(-q * len(values) // 100) - 1)] for q in qs}
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Histograms(object):
+    """Process level histograms of durations by name."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = dict(
+                    count=0, sum=0.0, counts=[0] * len(self.buckets)
+                )
+            stage["count"] += 1
+            stage["sum"] += seconds
+            stage["counts"][index] += 1
+
+    def snapshot(self):
+        """Return a copy of the histograms: count, sum and count of each
+        bucket (not cumulative) of each name."""
+        with self._lock:
+            return {
+                name: dict(stage, counts=list(stage["counts"]))
+                for name, stage in self.stages.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self.stages.clear()
+
+
+class ProcessStats(object):
+    """Counters of the requests served by the process.
+
+    The counters are updated in memory and written every `interval` seconds
+    by a background thread to a file per pid, the other processes of the
+    host (e.g. the alive consumer) read them with `snapshot` without calling
+    the process. The counters are reset in a forked process, the ones of
+    the processes that exited are kept in the archive by `collect`.
+    """
+
+    def __init__(
+        self, role="worker", directory=METRICS_DIR, window=WINDOW, interval=INTERVAL
+    ):
+        self.role = role
+        self.directory = directory
+        self.window = window
+        self.interval = interval
+        self.collectors = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self.latencies = collections.deque(maxlen=self.window)
+        self.counters = collections.Counter()
+        self.responses = collections.Counter()
+        self.routes = Histograms()
+        self.in_flight = 0
+        self._changed = threading.Event()
+        thread = threading.Thread(target=self._publish_loop, daemon=True)
+        thread.start()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def collect(self, name, collector):
+        """Add the dictionary returned by `collector()` to the statistics."""
+        self.collectors[name] = collector
+
+    def incr(self, name, delta=1):
+        self._check_pid()
+        with self._lock:
+            self.counters[name] += delta
+        self._changed.set()
+
+    def observe_request(self, method, route, status, seconds):
+        """Count the response of an HTTP request and record its duration."""
+        self._check_pid()
+        self.routes.observe(f"{method} {route}", seconds)
+        with self._lock:
+            self.responses[f"{method} {route} {status}"] += 1
+        self._changed.set()
+
+    @contextlib.contextmanager
+    def track(self):
+        """Count and time the request run in the block, the invalid requests
+        (4xx) are counted apart from the failures."""
+        self._check_pid()
+        with self._lock:
+            self.in_flight += 1
+        outcome = "errors"
+        start = time.perf_counter()
+        try:
+            yield
+            outcome = None
+        except ValidationError:
+            outcome = "rejected"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.in_flight -= 1
+                self.counters["requests"] += 1
+                self.counters["errors"] += outcome == "errors"
+                self.counters["rejected"] += outcome == "rejected"
+                self.latencies.append(round(elapsed * 1e3, 3))
+            self._changed.set()
+
+    def state(self):
+        """Return the statistics of the process."""
+        self._check_pid()
+        with self._lock:
+            state = dict(
+                pid=self._pid,
+                role=self.role,
+                time=time.time(),
+                in_flight=self.in_flight,
+                latencies_ms=list(self.latencies),
+                rss=rss(),
+                responses=dict(self.responses),
+                routes=self.routes.snapshot(),
+                **self.counters,
+            )
+        for name, collector in self.collectors.items():
+            state[name] = collector()
+        return state
+
+    def publish(self):
+        """Write the statistics to the file of the process."""
+        os.makedirs(self.directory, exist_ok=True)
+        write_json(os.path.join(self.directory, f"{os.getpid()}.json"), self.state())
+
+    def _publish_loop(self):
+        changed = self._changed
+        while self._changed is changed:
+            changed.wait()
+            changed.clear()
+            try:
+                self.publish()
+            except OSError:
+                LOGGER.exception("Unable to write the statistics")
+            time.sleep(self.interval)
+
+
+def add_counters(total, counters):
+    """Return the sum of the counters: numbers, lists of numbers or
+    dictionaries of counters."""
+    if total is None:
+        total = {} if isinstance(counters, dict) else 0
+    if isinstance(counters, dict):
+        for key, value in counters.items():
+            if key not in NOT_COUNTED:
+                total[key] = add_counters(total.get(key), value)
+        return total
+    if isinstance(counters, list):
+        if not total:
+            total = [0] * len(counters)
+        return [a + b for a, b in zip(total, counters)]
+    return total + counters
+
+
+@contextlib.contextmanager
+def locked(directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def read_json(path, default=None):
+    try:
+        with open(path) as data:
+            return json.load(data)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, obj):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as out:
+        json.dump(obj, out)
+    os.replace(tmp, path)
+
+
+def collect(directory=METRICS_DIR):
+    """Return the statistics written by the live processes of the host and
+    the archive: the counters of the processes that exited, summed by role.
+
+    The files of the processes that exited are added to the archive and
+    removed, so the sum of the counters of the archive and of the live
+    processes never decreases.
+    """
+    if not os.path.isdir(directory):
+        return [], {}
+    with locked(directory):
+        archive_path = os.path.join(directory, ARCHIVE)
+        archive = read_json(archive_path, {})
+        states, dead = [], []
+        for name in os.listdir(directory):
+            pid, ext = os.path.splitext(name)
+            if ext != ".json" or not pid.isdigit():
+                continue
+            path = os.path.join(directory, name)
+            state = read_json(path)
+            if not is_alive(int(pid)):
+                dead.append(path)
+                if state is not None:
+                    counters = {k: state[k] for k in COUNTERS if k in state}
+                    role = state["role"]
+                    archive[role] = add_counters(archive.get(role), counters)
+            elif state is not None:
+                states.append(state)
+        if dead:
+            write_json(archive_path, archive)
+            for path in dead:
+                os.remove(path)
+    return states, archive
+
+
+def read_states(directory=METRICS_DIR):
+    """Return the statistics written by the live processes of the host."""
+    return collect(directory)[0]
+
+
+def summarize(states, now=None):
+    """Merge the statistics of the processes of the same role."""
+    now = time.time() if now is None else now
+    roles = {}
+    for state in states:
+        roles.setdefault(state["role"], []).append(state)
+    summary = {}
+    for role, group in sorted(roles.items()):
+        latencies = [lat for state in group for lat in state["latencies_ms"]]
+        summary[role] = dict(
+            processes=len(group),
+            in_flight=sum(state["in_flight"] for state in group),
+            queued=sum(state.get("queued", 0) for state in group),
+            requests=sum(state.get("requests", 0) for state in group),
+            errors=sum(state.get("errors", 0) for state in group),
+            rejected=sum(state.get("rejected", 0) for state in group),
+            latency_ms=dict(percentiles(latencies), n=len(latencies)),
+            rss_mb=round(sum(state["rss"] for state in group) / 2**20, 1),
+            max_rss_mb=round(max(state["rss"] for state in group) / 2**20, 1),
+            age=round(now - min(state["time"] for state in group), 3),
+        )
+        loads = [
+            state["datasets"]["last_load"]
+            for state in group
+            if state.get("datasets", {}).get("last_load")
+        ]
+        if loads:
+            summary[role]["datasets"] = dict(
+                loaded=len(loads), age=round(now - min(loads), 1)
+            )
+        results = [state["results"] for state in group if "results" in state]
+        if results:
+            summary[role]["results"] = dict(
+                hits=sum(res["hits"] for res in results),
+                misses=sum(res["misses"] for res in results),
+            )
+    return summary
+
+
+def snapshot(directory=METRICS_DIR):
+    """Return the merged statistics of the processes of the host."""
+    return summarize(read_states(directory))
+
+
+# statistics of the process
+STATS = ProcessStats()
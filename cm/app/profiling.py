@@ -0,0 +1,105 @@
+import contextlib
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import tempfile
+import time
+
+from .metrics import STATS, Histograms
+
+LOGGER = logging.getLogger(__name__)
+
+# time the stages of the compute requests, 0 to disable
+ENABLED = os.environ.get("CM_STAGE_TIMERS", "1") != "0"
+# fraction of the compute requests run under cProfile, 0 to disable
+PROFILE_RATE = float(os.environ.get("CM_PROFILE_RATE", 0))
+PROFILE_DIR = os.environ.get(
+    "CM_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "biomass_profiles")
+)
+
+# seconds spent in each stage by the request of the current thread
+TIMINGS = contextvars.ContextVar("timings", default=None)
+
+
+class Stage(object):
+    """Time the block: the time is added to the stage of the current
+    request, or recorded in the histograms outside of a request."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        timings = TIMINGS.get()
+        if timings is None:
+            HISTOGRAMS.observe(self.name, elapsed)
+        else:
+            timings[self.name] = timings.get(self.name, 0.0) + elapsed
+
+
+NULL = contextlib.nullcontext()
+
+
+def stage(name):
+    """Return a context manager timing the stage `name`."""
+    return Stage(name) if ENABLED else NULL
+
+
+def profile_path(directory=None):
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{time.time():.6f}-{os.getpid()}.prof")
+
+
+@contextlib.contextmanager
+def request(rate=None):
+    """Collect the stage timings of the request run in the block and record
+    them in the histograms at the end, yield the dictionary of the timings
+    in seconds (empty if the timers are disabled).
+
+    A fraction `rate` (default PROFILE_RATE) of the requests is run under
+    cProfile, the statistics are written in PROFILE_DIR.
+    """
+    rate = PROFILE_RATE if rate is None else rate
+    profiler = None
+    if rate and random.random() < rate:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    timings = {}
+    token = TIMINGS.set(timings) if ENABLED else None
+    try:
+        yield timings
+    finally:
+        if token is not None:
+            TIMINGS.reset(token)
+            for name, seconds in timings.items():
+                HISTOGRAMS.observe(name, seconds)
+        if profiler is not None:
+            profiler.disable()
+            path = profile_path()
+            profiler.dump_stats(path)
+            LOGGER.info(f"Profile of the request written in {path}")
+
+
+def milliseconds(timings):
+    return {name: round(seconds * 1e3, 3) for name, seconds in timings.items()}
+
+
+def server_timing(timings):
+    """Return the value of the Server-Timing header of the timings."""
+    return ", ".join(
+        f"{name};dur={seconds * 1e3:.3f}" for name, seconds in timings.items()
+    )
+
+
+# histograms of the stages of the requests served by the process
+HISTOGRAMS = Histograms()
+STATS.collect("stages", lambda: HISTOGRAMS.snapshot())
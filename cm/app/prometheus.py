@@ -0,0 +1,194 @@
+"""Metrics of the processes of the host in the Prometheus text format.
+
+prometheus_client is not a dependency of the CM: the counters are the ones
+of app.metrics, written by each process (gunicorn workers, compute
+consumer) to its own file and summed here with the archive of the
+processes that exited, so that the counters of the host never decrease
+when gunicorn replaces a worker.
+"""
+
+import os
+
+from .metrics import BUCKETS, METRICS_DIR, STATS, collect
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Exposition(object):
+    """Lines of the families of metrics, in the order of their declaration."""
+
+    def __init__(self):
+        self.families = {}
+
+    def add(self, name, kind, help, value, **labels):
+        family = self.families.setdefault(name, dict(kind=kind, help=help, samples={}))
+        key = tuple(sorted(labels.items()))
+        family["samples"][key] = family["samples"].get(key, 0) + value
+
+    def histogram(self, name, help, histogram, **labels):
+        """Add a histogram of app.metrics.Histograms (counts per bucket)."""
+        family = self.families.setdefault(
+            name, dict(kind="histogram", help=help, samples={})
+        )
+        key = tuple(sorted(labels.items()))
+        total = family["samples"].setdefault(
+            key, dict(count=0, sum=0.0, counts=[0] * len(BUCKETS))
+        )
+        total["count"] += histogram["count"]
+        total["sum"] += histogram["sum"]
+        total["counts"] = [a + b for a, b in zip(total["counts"], histogram["counts"])]
+
+    def render(self):
+        lines = []
+        for name, family in self.families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            for key, value in sorted(family["samples"].items()):
+                if family["kind"] == "histogram":
+                    lines.extend(self._histogram(name, key, value))
+                else:
+                    lines.append(f"{name}{labels(key)} {number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _histogram(self, name, key, value):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, value["counts"]):
+            cumulative += count
+            bucket = key + (("le", number(float(bound))),)
+            yield f"{name}_bucket{labels(bucket)} {cumulative}"
+        yield f"{name}_sum{labels(key)} {number(value['sum'])}"
+        yield f"{name}_count{labels(key)} {value['count']}"
+
+
+def labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in key) + "}"
+
+
+def add_process(exposition, role, state):
+    """Add the counters of a process, or of the archive of a role."""
+    exposition.add(
+        "cm_requests_total",
+        "counter",
+        "Compute requests served.",
+        state.get("requests", 0),
+        role=role,
+    )
+    exposition.add(
+        "cm_request_errors_total",
+        "counter",
+        "Compute requests that failed.",
+        state.get("errors", 0),
+        role=role,
+    )
+    exposition.add(
+        "cm_request_rejections_total",
+        "counter",
+        "Compute requests rejected as invalid (4xx).",
+        state.get("rejected", 0),
+        role=role,
+    )
+    exposition.add(
+        "cm_rate_limited_total",
+        "counter",
+        "Requests rejected by the rate limiter.",
+        state.get("rate_limited", 0),
+        role=role,
+    )
+    for response, count in state.get("responses", {}).items():
+        method, route, status = response.split(" ", 2)
+        exposition.add(
+            "cm_http_requests_total",
+            "counter",
+            "HTTP requests by route and status.",
+            count,
+            method=method,
+            route=route,
+            status=status,
+        )
+    for route, histogram in state.get("routes", {}).items():
+        method, route = route.split(" ", 1)
+        exposition.histogram(
+            "cm_http_request_duration_seconds",
+            "Duration of the HTTP requests by route.",
+            histogram,
+            method=method,
+            route=route,
+        )
+    for name, histogram in state.get("stages", {}).items():
+        exposition.histogram(
+            "cm_stage_duration_seconds",
+            "Duration of the stages of the compute requests.",
+            histogram,
+            stage=name,
+        )
+    for cache, name in (("datasets", "dataset"), ("results", "result")):
+        stats = state.get(cache, {})
+        for field in ("hits", "misses"):
+            exposition.add(
+                f"cm_{name}_cache_{field}_total",
+                "counter",
+                f"Cache {field} of the {cache}.",
+                stats.get(field, 0),
+                role=role,
+            )
+    exposition.add(
+        "cm_dataset_loads_total",
+        "counter",
+        "Datasets loaded from the files.",
+        state.get("datasets", {}).get("loads", 0),
+        role=role,
+    )
+
+
+def render(directory=METRICS_DIR):
+    """Return the metrics of the processes of the host in the text format.
+
+    The statistics of the current process are taken from memory, the other
+    processes write theirs at most INTERVAL seconds late.
+    """
+    states, archive = collect(directory)
+    if directory == STATS.directory:
+        pid = os.getpid()
+        states = [state for state in states if state["pid"] != pid]
+        states.append(STATS.state())
+    exposition = Exposition()
+    for role, counters in sorted(archive.items()):
+        add_process(exposition, role, counters)
+    for state in states:
+        role = state["role"]
+        add_process(exposition, role, state)
+        exposition.add(
+            "cm_in_flight",
+            "gauge",
+            "Requests in progress.",
+            state["in_flight"],
+            role=role,
+        )
+        exposition.add(
+            "cm_queued",
+            "gauge",
+            "Compute messages received and not started.",
+            state.get("queued", 0),
+            role=role,
+        )
+        exposition.add("cm_processes", "gauge", "Live processes.", 1, role=role)
+        exposition.add(
+            "cm_resident_memory_bytes",
+            "gauge",
+            "Resident memory of the processes.",
+            state["rss"],
+            role=role,
+        )
+    return exposition.render()
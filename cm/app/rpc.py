@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import queue
+import random
+import socket
+import threading
+import time
+import uuid
+
+import pika
+
+from . import constant
+from .exceptions import RpcTimeout
+
+LOGGER = logging.getLogger(__name__)
+
+# seconds waited for the reply of the main web service
+TIMEOUT = float(os.environ.get("CM_RPC_TIMEOUT", 30))
+# number of connections to the broker kept open by the process
+POOL_SIZE = int(os.environ.get("CM_RPC_POOL_SIZE", 2))
+
+
+def backoff(initial=1.0, maximum=60.0, factor=2.0, jitter=0.1):
+    """Yield the delays between attempts: exponential, capped at maximum,
+    with a random jitter so that the CMs do not retry in lockstep."""
+    delay = initial
+    while True:
+        yield delay * random.uniform(1 - jitter, 1 + jitter)
+        delay = min(delay * factor, maximum)
+
+
+class CalculationModuleRpcClient(object):
+    """Client of the RPC queues of the main web service.
+
+    The connection to the broker and the exclusive reply queue are opened at
+    the first call and reused by the next ones, they are reopened after a
+    broker error or in a forked process. The connection is idle between the
+    calls: the heartbeats are disabled, like in the compute consumer, and a
+    call is published again once on a new connection if the broker closed
+    the idle one. Each call has its own correlation id and waits for its
+    reply in process_data_events, up to the timeout.
+    """
+
+    def __init__(self, url=None, timeout=TIMEOUT, connection_factory=None):
+        self.url = url or constant.CELERY_BROKER_URL
+        self.timeout = timeout
+        self.connection_factory = connection_factory or pika.BlockingConnection
+        self.connection = None
+        self.responses = {}
+        self._lock = threading.Lock()
+
+    def connect(self):
+        if self.connection is not None and self._pid == os.getpid():
+            return
+        parameters = pika.URLParameters(self.url)
+        # the heartbeats are only serviced during the calls
+        parameters.heartbeat = 0
+        self.connection = self.connection_factory(parameters)
+        self._pid = os.getpid()
+        self.channel = self.connection.channel()
+        result = self.channel.queue_declare(exclusive=True)
+        self.callback_queue = result.method.queue
+        self.channel.basic_consume(
+            self.on_response, no_ack=True, queue=self.callback_queue
+        )
+        self.responses = {}
+
+    def close(self):
+        connection, self.connection = self.connection, None
+        if connection is not None and self._pid == os.getpid():
+            try:
+                connection.close()
+            except pika.exceptions.AMQPError:
+                LOGGER.debug("Connection to the broker already closed")
+
+    def on_response(self, ch, method, props, body):
+        if props.correlation_id in self.responses:
+            self.responses[props.correlation_id] = body
+        else:
+            LOGGER.warning(f"Discarding the reply {props.correlation_id}")
+
+    def call(self, data, routing_key=constant.CM_REGISTER_Q, timeout=None):
+        """Publish data on the queue, return the body of the reply.
+
+        Raise RpcTimeout if the reply does not arrive in time.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            for retry in (True, False):
+                reused = self.connection is not None and self._pid == os.getpid()
+                try:
+                    self.connect()
+                    corr_id = self._publish(data, routing_key)
+                    break
+                except pika.exceptions.AMQPError:
+                    self.close()
+                    # nothing was published on the connection closed by the
+                    # broker, the call is safe to publish again
+                    if not (retry and reused):
+                        raise
+                    LOGGER.warning("Connection to the broker lost, reconnecting")
+            try:
+                return self._wait(corr_id, routing_key, timeout)
+            except pika.exceptions.AMQPError:
+                self.close()
+                raise
+
+    def _publish(self, data, routing_key):
+        """Publish data on the queue, return the correlation id."""
+        corr_id = uuid.uuid4().hex
+        LOGGER.info(f"RPC call {corr_id} to {routing_key}")
+        self.responses[corr_id] = None
+        self.channel.basic_publish(
+            exchange="",
+            routing_key=routing_key,
+            properties=pika.BasicProperties(
+                reply_to=self.callback_queue, correlation_id=corr_id
+            ),
+            body=data,
+        )
+        return corr_id
+
+    def _wait(self, corr_id, routing_key, timeout):
+        """Return the body of the reply of the call corr_id."""
+        try:
+            deadline = time.monotonic() + timeout
+            while self.responses[corr_id] is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RpcTimeout(
+                        f"No reply from {routing_key} after {timeout} seconds"
+                    )
+                self.connection.process_data_events(time_limit=remaining)
+            return self.responses[corr_id]
+        finally:
+            del self.responses[corr_id]
+
+
+class RpcClientPool(object):
+    """Pool of long-lived RPC clients shared by the threads of the process,
+    at most `size` calls are in progress at the same time."""
+
+    def __init__(self, size=POOL_SIZE, factory=CalculationModuleRpcClient):
+        self.factory = factory
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._pid = os.getpid()
+
+    def call(self, data, **kwargs):
+        if self._pid != os.getpid():
+            # the connections of the parent process are not shared
+            self._idle, self._pid = queue.LifoQueue(), os.getpid()
+        with self._slots:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                client = self.factory()
+            try:
+                return client.call(data, **kwargs)
+            finally:
+                self._idle.put(client)
+
+
+# clients shared by all the calls of the process
+RPC = RpcClientPool()
+
+
+def register(rpc=RPC):
+    """Send the SIGNATURE of the CM, with its url, to the main web service,
+    return the reply."""
+    ip = socket.gethostbyname(socket.gethostname())
+    signature = constant.SIGNATURE
+    signature["cm_url"] = "http://" + str(ip) + ":" + str(constant.PORT) + "/"
+    return rpc.call(json.dumps(signature))
@@ -0,0 +1,208 @@
+import logging
+import math
+
+from .constant import SIGNATURE
+from .exceptions import ValidationError
+
+LOGGER = logging.getLogger(__name__)
+
+# maximum number of scenarios of a batch request
+MAX_SCENARIOS = 1000
+
+
+class InputValidator(object):
+    """Validate the inputs of a compute request against the SIGNATURE.
+
+    The checks are compiled once from the SIGNATURE: the required raster and
+    vector layers and, for each parameter of `inputs_calculation_module`, its
+    name and min/max range. Parameters are coerced to float in one pass,
+    parameters that are not in the SIGNATURE are ignored.
+    """
+
+    def __init__(self, signature=SIGNATURE):
+        self.raster_layers = tuple(signature.get("layers_needed", ()))
+        self.vector_layers = tuple(signature.get("vectors_needed", ()))
+        self.parameters = tuple(
+            (
+                inp["input_parameter_name"],
+                float(inp.get("input_min", -math.inf)),
+                float(inp.get("input_max", math.inf)),
+            )
+            for inp in signature.get("inputs_calculation_module", ())
+        )
+
+    def raster_selection(self, selection):
+        """Return the raster selection: a dictionary of layer paths."""
+        selection = {} if selection is None else selection
+        if not isinstance(selection, dict):
+            raise ValidationError("inputs_raster_selection must be an object")
+        missing = [layer for layer in self.raster_layers if layer not in selection]
+        if missing:
+            raise ValidationError(f"Missing raster layers: {missing}")
+        for layer, path in selection.items():
+            if not isinstance(path, str):
+                raise ValidationError(f"Invalid path of the raster layer: {layer}")
+        return selection
+
+    def vector_selection(self, selection):
+        """Return the vector selection: a dictionary of lists of records,
+        each record is an object with a string code, its other fields are
+        checked when they are converted to arrays."""
+        selection = {} if selection is None else selection
+        if not isinstance(selection, dict):
+            raise ValidationError("inputs_vector_selection must be an object")
+        missing = [layer for layer in self.vector_layers if layer not in selection]
+        if missing:
+            raise ValidationError(f"Missing vector layers: {missing}")
+        for layer, records in selection.items():
+            if records is None:
+                continue
+            if not isinstance(records, list):
+                raise ValidationError(f"Vector layer {layer} must be a list")
+            for rec in records:
+                if not isinstance(rec, dict) or not isinstance(rec.get("code"), str):
+                    raise ValidationError(
+                        f"Invalid record of the vector layer {layer}, an object "
+                        f"with a string code is expected: {rec!r}"
+                    )
+        return selection
+
+    def parameter_selection(self, selection):
+        """Return the parameters of the SIGNATURE converted to float."""
+        if not isinstance(selection, dict):
+            raise ValidationError("inputs_parameter_selection must be an object")
+        psel = {}
+        for name, low, high in self.parameters:
+            try:
+                value = selection[name]
+                if isinstance(value, bool):
+                    raise TypeError(value)
+                value = float(value)
+            except KeyError:
+                raise ValidationError(f"Missing parameter: {name}")
+            except (TypeError, ValueError):
+                raise ValidationError(f"Invalid number for {name}: {value!r}")
+            if not low <= value <= high:
+                raise ValidationError(
+                    f"Parameter {name}: {value} is not between {low} and {high}"
+                )
+            psel[name] = value
+        return psel
+
+    def number(self, value, name):
+        """Return the value as a finite float."""
+        try:
+            if isinstance(value, bool):
+                raise TypeError(value)
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValidationError(f"Invalid number for {name}: {value!r}")
+        if not math.isfinite(value):
+            raise ValidationError(f"Invalid number for {name}: {value!r}")
+        return value
+
+    def sensitivity(self, spec, psel):
+        """Return the sensitivity options of the request: the distributions
+        of the sampled parameters, the number of samples and the seed."""
+        from .api_v1.my_calculation_module_directory.sensitivity import (
+            DISTRIBUTIONS,
+            MAX_SAMPLES,
+            NSAMPLES,
+        )
+
+        if isinstance(psel, list):
+            raise ValidationError(
+                "The sensitivity mode does not accept a list of "
+                "inputs_parameter_selection"
+            )
+        if not isinstance(spec, dict):
+            raise ValidationError("sensitivity must be an object")
+        samples = spec.get("samples", NSAMPLES)
+        if isinstance(samples, bool) or not isinstance(samples, (int, float, str)):
+            raise ValidationError(f"Invalid number of samples: {samples!r}")
+        try:
+            nsamples = int(samples)
+        except ValueError:
+            raise ValidationError(f"Invalid number of samples: {samples!r}")
+        if not 0 < nsamples <= MAX_SAMPLES:
+            raise ValidationError(f"The number of samples must be in: 1-{MAX_SAMPLES}")
+        seed = spec.get("seed")
+        if seed is not None and (
+            isinstance(seed, bool) or not isinstance(seed, int) or seed < 0
+        ):
+            raise ValidationError(f"The seed must be a positive integer: {seed!r}")
+        distributions = spec.get("distributions", {})
+        if not isinstance(distributions, dict):
+            raise ValidationError("sensitivity distributions must be an object")
+        names = {name for name, _, _ in self.parameters}
+        unknown = set(distributions) - names
+        if unknown:
+            raise ValidationError(f"Unknown parameters: {sorted(unknown)}")
+        for name, dist in distributions.items():
+            if not isinstance(dist, dict):
+                raise ValidationError(f"The distribution of {name} must be an object")
+            kind = dist.get("distribution", "uniform")
+            if kind not in DISTRIBUTIONS:
+                raise ValidationError(
+                    f"Unknown distribution for {name}: {kind!r}, "
+                    f"use one of: {list(DISTRIBUTIONS)}"
+                )
+            if kind == "normal":
+                missing = [key for key in ("mean", "std") if key not in dist]
+                if missing:
+                    raise ValidationError(f"Missing {missing} of {name}")
+            for key in ("min", "max", "mode", "mean", "std"):
+                if key in dist:
+                    self.number(dist[key], f"{name} {key}")
+            if kind == "normal" and float(dist["std"]) < 0:
+                raise ValidationError(f"Negative std of {name}")
+        return dict(distributions=distributions, samples=nsamples, seed=seed)
+
+    def outputs(self, data):
+        """Return the format of the breakdown, None without breakdown, and
+        whether the raster layers are requested."""
+        from .api_v1.my_calculation_module_directory.breakdown import FORMATS
+
+        breakdown = data.get("breakdown")
+        if breakdown is True:
+            breakdown = "csv"
+        elif breakdown is None or breakdown is False:
+            breakdown = None
+        elif not isinstance(breakdown, str) or breakdown not in FORMATS:
+            raise ValidationError(
+                f"Invalid breakdown: {breakdown!r}, use true, false or one of: "
+                f"{list(FORMATS)}"
+            )
+        raster = data.get("raster", False)
+        if not isinstance(raster, bool):
+            raise ValidationError(f"raster must be true or false: {raster!r}")
+        return breakdown, raster
+
+    def validate(self, data):
+        """Return the validated raster, vector and parameter selections of
+        the request, the parameter selection can be a list of scenarios."""
+        if not isinstance(data, dict):
+            raise ValidationError("The request must be a JSON object")
+        try:
+            psel = data["inputs_parameter_selection"]
+        except KeyError:
+            raise ValidationError("Missing inputs_parameter_selection")
+        if isinstance(psel, list):
+            if not psel:
+                raise ValidationError("Empty list of inputs_parameter_selection")
+            if len(psel) > MAX_SCENARIOS:
+                raise ValidationError(
+                    f"The number of scenarios must be in: 1-{MAX_SCENARIOS}"
+                )
+            psel = [self.parameter_selection(p) for p in psel]
+        else:
+            psel = self.parameter_selection(psel)
+        return (
+            self.raster_selection(data.get("inputs_raster_selection")),
+            self.vector_selection(data.get("inputs_vector_selection")),
+            psel,
+        )
+
+
+# validator compiled from the SIGNATURE of the calculation module
+VALIDATOR = InputValidator()
@@ -0,0 +1,101 @@
+import gc
+import json
+import logging
+import os
+import tempfile
+import time
+
+from .metrics import is_alive
+
+LOGGER = logging.getLogger(__name__)
+
+# file written when the CM serves its requests at steady-state latency
+READY_FILE = os.environ.get(
+    "CM_READY_FILE", os.path.join(tempfile.gettempdir(), "biomass_ready.json")
+)
+# seconds waited for the readiness before registering the CM anyway
+READY_TIMEOUT = float(os.environ.get("CM_READY_TIMEOUT", 600))
+# set by warm_up in the gunicorn master, inherited by the forked workers
+WARMED_UP = False
+
+
+def warm_up():
+    """Import the scientific stack, build the unit registry and load the
+    datasets with their NUTS indexes.
+
+    Called in the gunicorn master before the workers are forked, the
+    workers share the loaded pages copy-on-write. The objects are moved to
+    the permanent generation of the garbage collector, which does not write
+    their headers and keeps the pages shared.
+    """
+    global WARMED_UP
+    start = time.perf_counter()
+    from .api_v1 import calculation_module
+    from .api_v1.my_calculation_module_directory.units import get_registry
+
+    get_registry()
+    calculation_module.get_datasets()
+    # stale datasets are revalidated by threads holding a file lock: the
+    # forked workers would inherit the lock and the pending revalidations,
+    # not the threads. The updated datasets are loaded before the fork.
+    calculation_module.DOWNLOADER.wait()
+    datasets = calculation_module.get_datasets()
+    gc.collect()
+    gc.freeze()
+    elapsed = time.perf_counter() - start
+    LOGGER.info(f"Warmed up with {len(datasets)} datasets in {elapsed:.3f}s")
+    WARMED_UP = True
+    return datasets
+
+
+def reset_counters():
+    """Zero the counters inherited from the master in a forked worker, so
+    that the datasets loaded by warm_up are not counted once per worker."""
+    from . import profiling
+    from .api_v1 import calculation_module
+
+    for stats in (calculation_module.STORE.stats, calculation_module.RESULTS.stats):
+        for name, value in stats.items():
+            if name != "last_load":
+                stats[name] = type(value)()
+    profiling.HISTOGRAMS.clear()
+
+
+def mark_ready(pid=None, path=READY_FILE):
+    """Record that the CM is ready, while the process `pid` is alive."""
+    state = dict(pid=pid or os.getpid(), time=time.time())
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as out:
+        json.dump(state, out)
+    os.replace(tmp, path)
+
+
+def clear_ready(path=READY_FILE):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def is_ready(path=READY_FILE):
+    try:
+        with open(path) as data:
+            state = json.load(data)
+    except (OSError, ValueError):
+        return False
+    return is_alive(state["pid"])
+
+
+def wait_ready(timeout=READY_TIMEOUT, path=READY_FILE, delays=None):
+    """Wait for the CM to be ready, return False after the timeout."""
+    from .rpc import backoff
+
+    delays = delays or backoff(initial=0.5, maximum=10)
+    deadline = time.monotonic() + timeout
+    while not is_ready(path):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        LOGGER.info("Waiting for the CM to be ready")
+        time.sleep(min(next(delays), remaining))
+    return True
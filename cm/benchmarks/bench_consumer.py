@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""Measure end to end the compute requests handled by the RPC consumer,
+posted over HTTP to the web workers or computed in a local process pool.
+
+The broker is replaced by an in-process stand-in and the web workers by a
+threaded werkzeug server with the datasets loaded at start up (gunicorn is
+used in production, werkzeug would fork a process for each request). Each
+request has different parameters, so the result cache is never hit.
+
+    python benchmarks/bench_consumer.py [--requests 200] [--concurrency 4]
+"""
+
+import argparse
+import functools
+import json
+import os
+import queue
+import socket
+import sys
+import tempfile
+import time
+from multiprocessing import Process
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ["CM_RESULT_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-results-")
+
+from app import create_app  # noqa: E402
+from app.constant import INPUTS_CALCULATION_MODULE  # noqa: E402
+from consumer_cm_compute import ComputeConsumer, LocalCompute, forward  # noqa: E402
+
+
+class Broker(object):
+    """In-process stand-in of the connection and channel of pika."""
+
+    def __init__(self):
+        self.callbacks = queue.Queue()
+        self.replies = {}
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.put(callback)
+
+    def process_data_events(self, time_limit=0):
+        while True:
+            try:
+                self.callbacks.get(timeout=time_limit)()
+            except queue.Empty:
+                return
+
+    def basic_qos(self, prefetch_count):
+        pass
+
+    def basic_consume(self, callback, queue):
+        self.callback = callback
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        self.replies[properties.correlation_id] = (time.perf_counter(), body)
+
+    def basic_ack(self, delivery_tag):
+        pass
+
+    def run(self, bodies):
+        """Deliver all the bodies, wait for the replies and return the
+        latency of each request."""
+        sent = {}
+        for tag, body in enumerate(bodies):
+            sent[tag] = time.perf_counter()
+            method = SimpleNamespace(delivery_tag=tag)
+            props = SimpleNamespace(correlation_id=tag, reply_to="reply")
+            self.callback(self, method, props, body)
+        while len(self.replies) < len(bodies):
+            self.process_data_events(time_limit=0.01)
+        return np.array([self.replies[tag][0] - sent[tag] for tag in sent])
+
+
+def serve(port):
+    from app.api_v1 import calculation_module
+
+    app = create_app(os.environ.get("FLASK_CONFIG", "development"))
+    calculation_module.get_datasets()
+    app.run(host="127.0.0.1", port=port, threaded=True, use_reloader=False)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout=30):
+    import requests
+
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            requests.get(url)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server not started: {url}")
+
+
+def measure(handler, bodies, concurrency):
+    # warm up: load the datasets in all the workers
+    warmup, bodies = bodies[: 2 * concurrency], bodies[2 * concurrency :]
+    broker = Broker()
+    ComputeConsumer(broker, broker, handler=handler, concurrency=concurrency).start()
+    broker.run(warmup)
+    broker = Broker()
+    consumer = ComputeConsumer(broker, broker, handler=handler, concurrency=concurrency)
+    consumer.start()
+    start = time.perf_counter()
+    latencies = broker.run(bodies)
+    seconds = time.perf_counter() - start
+    consumer.stop()
+    p50, p95, p99 = np.percentile(latencies * 1e3, (50, 95, 99))
+    return dict(throughput=len(bodies) / seconds, p50_ms=p50, p95_ms=p95, p99_ms=p99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    psel = {
+        d["input_parameter_name"]: float(d["input_value"])
+        for d in INPUTS_CALCULATION_MODULE
+    }
+    nbodies = args.requests + 2 * args.concurrency
+    bodies = [
+        json.dumps(
+            dict(
+                inputs_raster_selection={},
+                inputs_vector_selection={},
+                inputs_parameter_selection=dict(psel, forst_coll_perc=i * 1e-4),
+            )
+        )
+        for i in range(2 * nbodies)
+    ]
+
+    port = free_port()
+    server = Process(target=serve, args=(port,), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{port}/computation-module/compute/"
+    wait_for(f"http://127.0.0.1:{port}/")
+    local = LocalCompute(processes=args.concurrency)
+    try:
+        report = dict(
+            http=measure(
+                functools.partial(forward, url=url), bodies[:nbodies], args.concurrency
+            ),
+            local=measure(local, bodies[nbodies:], args.concurrency),
+        )
+    finally:
+        local.shutdown()
+        server.terminate()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
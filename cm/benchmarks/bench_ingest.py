@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Compare the ingestion of the vector selection through the json round
+trips (helper.validateJSON + pd.read_json(json.dumps(...))) with the direct
+conversion of the parsed records, using the fixtures in tests/data. NaN
+values are replaced by 0, ast.literal_eval can not parse them.
+
+    python benchmarks/bench_ingest.py [--repeat 20]
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import helper  # noqa: E402
+from app.api_v1.my_calculation_module_directory.ingest import (  # noqa: E402
+    records_energy,
+)
+
+DATADIR = os.path.join(os.path.dirname(__file__), "..", "tests", "data")
+JSONS = (
+    "agricultural_residues.json",
+    "solid_waste.json",
+    "livestock_effluents.json",
+    "forest_residues.json",
+)
+
+
+def json_roundtrip(selection):
+    selection = helper.validateJSON(selection)
+    return [
+        pd.read_json(io.StringIO(json.dumps(records)), orient="records").value.sum()
+        for records in selection.values()
+    ]
+
+
+def direct(selection):
+    return [records_energy(records) for records in selection.values()]
+
+
+def measure(func, selection, repeat):
+    seconds = min(timeit.repeat(lambda: func(selection), number=1, repeat=repeat))
+    tracemalloc.start()
+    func(selection)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict(ms=seconds * 1e3, peak_kib=peak / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    selection = {}
+    for jsname in JSONS:
+        with open(os.path.join(DATADIR, jsname), mode="r") as js:
+            selection[jsname] = [
+                dict(rec, value=0.0 if rec["value"] != rec["value"] else rec["value"])
+                for rec in json.load(js)
+            ]
+    results = {
+        name: measure(func, selection, args.repeat)
+        for name, func in (("json_roundtrip", json_roundtrip), ("direct", direct))
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""Replay the workloads of the calculation module against calculation()
+and the compute route, report the latency percentiles, the throughput and
+the peak memory as JSON and compare them with a stored baseline.
+
+Workloads: a single NUTS3 region (AT111, from the test fixtures), a full
+country (AT), all the NUTS3 regions of the datasets and a batch of
+scenarios on the country. Each workload runs with a cold result cache
+(every request is computed) and a warm one (the same request is served
+from the in-memory cache, the batches are not cached).
+
+    python benchmarks/bench_pipeline.py [--repeat 50] [--output report.json]
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json
+
+The info logs of the app are disabled, unless --log is given, so that
+stdout only contains the report. With --baseline the exit status is 1 if
+the p50 latency of a case is more than --tolerance (default 0.5) slower
+than in the baseline, the baseline is specific to the machine where it
+was measured. The peak memory of a case is the peak of the memory
+allocated by one of its calls, traced with tracemalloc in an extra call
+that is not timed. The resident memory after a case also includes the
+cases before it.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# the results, metrics and outputs of the benchmark, removed at the end
+TMPDIR = tempfile.mkdtemp(prefix="bench-pipeline-")
+os.environ["CM_RESULT_CACHE_DIR"] = os.path.join(TMPDIR, "results")
+os.environ["CM_METRICS_DIR"] = os.path.join(TMPDIR, "metrics")
+
+from app import create_app, encoder  # noqa: E402
+from app.api_v1 import calculation_module as cm  # noqa: E402
+from app.api_v1.my_calculation_module_directory.result_cache import (  # noqa: E402
+    ResultCache,
+)
+from app.constant import INPUTS_CALCULATION_MODULE  # noqa: E402
+from app.metrics import rss  # noqa: E402
+
+LAYERS = (cm.WASTE, cm.AGRIC, cm.LVSTK, cm.FORST)
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "tests", "data")
+FIXTURE_NAMES = {
+    cm.AGRIC: "agricultural_residues.json",
+    cm.WASTE: "solid_waste.json",
+    cm.LVSTK: "livestock_effluents.json",
+    cm.FORST: "forest_residues.json",
+}
+
+
+def fixture_selection(prefix):
+    """Return the vector selection of the fixture records whose code starts
+    with prefix."""
+    selection = {}
+    for layer, name in FIXTURE_NAMES.items():
+        with open(os.path.join(FIXTURES, name)) as records:
+            selection[layer] = [
+                rec for rec in json.load(records) if rec["code"].startswith(prefix)
+            ]
+    return selection
+
+
+def nuts3_selection():
+    """Return a synthetic selection of all the NUTS3 regions of the
+    datasets."""
+    codes = sorted(
+        {str(code) for ds in cm.get_datasets() for code in ds.code if len(code) == 5}
+    )
+    return {layer: [dict(code=code) for code in codes] for layer in LAYERS}
+
+
+def workloads(scenarios):
+    psel = {
+        d["input_parameter_name"]: float(d["input_value"])
+        for d in INPUTS_CALCULATION_MODULE
+    }
+    country = fixture_selection("AT")
+    psels = [
+        dict(psel, forst_coll_perc=100.0 * i / scenarios) for i in range(scenarios)
+    ]
+    return dict(
+        nuts3=(fixture_selection("AT111"), psel),
+        country=(country, psel),
+        eu=(nuts3_selection(), psel),
+        batch=(country, psels),
+    )
+
+
+def calculation(vsel, psel, directory):
+    if isinstance(psel, list):
+        return cm.calculation_batch(directory, {}, vsel, psel)
+    return cm.calculation(directory, {}, vsel, psel)
+
+
+def route(client, vsel, psel):
+    rv = client.post(
+        "computation-module/compute/",
+        json=dict(
+            inputs_raster_selection={},
+            inputs_vector_selection=vsel,
+            inputs_parameter_selection=psel,
+        ),
+    )
+    assert rv.status_code == 200, rv.get_data(as_text=True)
+    return rv.get_data()
+
+
+def peak_memory(func):
+    """Return the peak of the memory allocated by a call of func, in bytes,
+    including the arrays of NumPy."""
+    tracemalloc.start()
+    try:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        return tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+
+
+def measure(func, repeat):
+    """Return the latency statistics of repeat calls of func, then the peak
+    memory of a call, tracemalloc slows down the calls it traces."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1e3
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+    stats = dict(
+        p50_ms=p50,
+        p95_ms=p95,
+        p99_ms=p99,
+        mean_ms=latencies.mean(),
+        throughput=repeat / latencies.sum() * 1e3,
+        rss_mb=rss() / 2**20,
+        peak_mb=peak_memory(func) / 2**20,
+    )
+    return {key: float(value) for key, value in stats.items()}
+
+
+def run(repeat, scenarios):
+    directory = os.path.join(TMPDIR, "outputs")
+    os.makedirs(directory)
+    client = create_app(os.environ.get("FLASK_CONFIG", "development")).test_client()
+    start = time.perf_counter()
+    cm.get_datasets()
+    report = dict(
+        meta=dict(
+            python=platform.python_version(),
+            machine=platform.machine(),
+            encoder=encoder.BACKEND,
+            repeat=repeat,
+            scenarios=scenarios,
+        ),
+        load_datasets_ms=(time.perf_counter() - start) * 1e3,
+        cases={},
+    )
+    for name, (vsel, psel) in workloads(scenarios).items():
+        targets = dict(
+            calculation=lambda: calculation(vsel, psel, directory),
+            route=lambda: route(client, vsel, psel),
+        )
+        for target, func in targets.items():
+            for cache in ("cold", "warm"):
+                if cache == "cold":
+                    cm.RESULTS = ResultCache(maxsize=0, directory=None)
+                else:
+                    cm.RESULTS = ResultCache(directory=None)
+                # first call: imports, lazy caches and, if warm, the cache
+                func()
+                case = f"{name}/{target}/{cache}"
+                report["cases"][case] = measure(func, repeat)
+                print(
+                    case, f"{report['cases'][case]['p50_ms']:.2f} ms", file=sys.stderr
+                )
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Return the ratio of the p50 latencies with the baseline of each case
+    and whether it is a regression."""
+    comparison = {}
+    for case, stats in report["cases"].items():
+        if case not in baseline["cases"]:
+            continue
+        ratio = stats["p50_ms"] / baseline["cases"][case]["p50_ms"]
+        comparison[case] = dict(
+            p50_ms=stats["p50_ms"],
+            baseline_p50_ms=baseline["cases"][case]["p50_ms"],
+            ratio=ratio,
+            regression=ratio > 1 + tolerance,
+        )
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--scenarios", type=int, default=100)
+    parser.add_argument("--output", help="write the report to this file")
+    parser.add_argument("--baseline", help="compare with this report")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument(
+        "--log", action="store_true", help="keep the info logs of the app on stdout"
+    )
+    args = parser.parse_args()
+    if not args.log:
+        logging.disable(logging.INFO)
+
+    # the route prints on stdout
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run(args.repeat, args.scenarios)
+    finally:
+        shutil.rmtree(TMPDIR, ignore_errors=True)
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(report, out, indent=2)
+    if not args.baseline:
+        print(json.dumps(report, indent=2))
+        return 0
+    with open(args.baseline) as data:
+        comparison = compare(report, json.load(data), args.tolerance)
+    print(json.dumps(comparison, indent=2))
+    regressions = [case for case, cmp in comparison.items() if cmp["regression"]]
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Measure the share of the serialization in the latency of the compute
+requests, before (pprint + logging of the whole result + json.dumps) and
+after (app.encoder.dumps), for a single result and a batch of scenarios.
+The result cache is disabled, the datasets are loaded before timing.
+
+    python benchmarks/bench_serialization.py [--repeat 20] [--scenarios 100]
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import timeit
+from pprint import pprint
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import encoder  # noqa: E402
+from app.api_v1 import calculation_module as cm  # noqa: E402
+from app.api_v1.my_calculation_module_directory.result_cache import (  # noqa: E402
+    ResultCache,
+)
+from app.constant import INPUTS_CALCULATION_MODULE  # noqa: E402
+
+
+def before(result, single):
+    if single:
+        # removed from calculation()
+        pprint(result, stream=io.StringIO())
+        f"Computation result for biomass is: {result}"
+    response = json.dumps({"result": result})
+    f"response {response}"
+    return response
+
+
+def after(result, single):
+    return encoder.dumps({"result": result})
+
+
+def measure(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--scenarios", type=int, default=100)
+    args = parser.parse_args()
+    cm.RESULTS = ResultCache(maxsize=0, directory=None)
+    psel = {
+        d["input_parameter_name"]: float(d["input_value"])
+        for d in INPUTS_CALCULATION_MODULE
+    }
+    psels = [
+        dict(psel, forst_coll_perc=100.0 * i / args.scenarios)
+        for i in range(args.scenarios)
+    ]
+    workloads = dict(
+        single=(lambda: cm.calculation("/tmp", {}, {}, psel), True),
+        batch=(lambda: cm.calculation_batch("/tmp", {}, {}, psels), False),
+    )
+    report = dict(backend=encoder.BACKEND)
+    for name, (compute, single) in workloads.items():
+        result = compute()
+        compute_ms = measure(compute, args.repeat)
+        report[name] = dict(compute_ms=compute_ms)
+        for label, func in (("before", before), ("after", after)):
+            ms = measure(lambda: func(result, single), args.repeat)
+            report[name][label] = dict(
+                serialization_ms=ms, share=ms / (compute_ms + ms)
+            )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
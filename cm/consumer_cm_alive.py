@@ -1,40 +1,90 @@
-
 #!/usr/bin/env python
-import pika
+import json
 import logging
+import time
+
+import pika
 
+from app.constant import RPC_CM_ALIVE, RPC_Q, CM_ID, CELERY_BROKER_URL
+from app.metrics import snapshot
 
-from app.constant import RPC_CM_ALIVE,CM_ID,CELERY_BROKER_URL
 LOG_FORMAT = ('%(levelname) -10s %(asctime)s %(name) -30s %(funcName) '
               '-35s %(lineno) -5d: %(message)s')
 LOGGER = logging.getLogger(__name__)
 
-queue_name =  RPC_CM_ALIVE + str(CM_ID)
-parameters = pika.URLParameters(str(CELERY_BROKER_URL))
-connection = pika.BlockingConnection(parameters)
+queue_name = RPC_CM_ALIVE + str(CM_ID)
+compute_queue_name = RPC_Q + str(CM_ID)
 
-channel = connection.channel()
 
-channel.queue_declare(queue=queue_name)
+class QueueDepth(object):
+    """Number of compute requests waiting in the broker and of consumers.
 
+    A passive declare of a missing queue closes the channel, so it uses its
+    own channel, opened again after a failure.
+    """
 
+    def __init__(self, connection, queue=compute_queue_name):
+        self.connection = connection
+        self.queue = queue
+        self.channel = None
 
-def on_request(ch, method, props, body):
-    #body.status = 'up'
+    def __call__(self):
+        try:
+            if self.channel is None or not self.channel.is_open:
+                self.channel = self.connection.channel()
+            method = self.channel.queue_declare(queue=self.queue, passive=True).method
+        except pika.exceptions.AMQPError:
+            LOGGER.warning('Unable to get the depth of %s', self.queue)
+            self.channel = None
+            return None
+        return {'depth': method.message_count, 'consumers': method.consumer_count}
 
 
-    response = body
+def health(queue_depth=None):
+    """Return the state of the CM: the statistics written by the processes
+    of the host and the depth of the compute queue."""
+    status = {'status': 'up', 'cm_id': CM_ID, 'time': time.time()}
+    if queue_depth is not None:
+        status['queue'] = queue_depth()
+    status.update(snapshot())
+    return status
+
+
+def on_request(ch, method, props, body, queue_depth=None):
+    try:
+        response = json.dumps(health(queue_depth))
+    except Exception:
+        LOGGER.exception('Unable to read the health of the CM')
+        response = json.dumps({'status': 'up', 'cm_id': CM_ID})
 
     ch.basic_publish(exchange='',
                      routing_key=props.reply_to,
                      properties=pika.BasicProperties(correlation_id = \
                                                          props.correlation_id),
-                     body=str(response))
+                     body=response)
     ch.basic_ack(delivery_tag = method.delivery_tag)
 
-channel.basic_qos(prefetch_count=1)
-channel.basic_consume(on_request, queue=queue_name)
 
-print(" [x] Awaiting RPC requests")
-LOGGER.info(" [x] Awaiting RPC requests")
-channel.start_consuming()
+def main():
+    parameters = pika.URLParameters(str(CELERY_BROKER_URL))
+    connection = pika.BlockingConnection(parameters)
+
+    channel = connection.channel()
+
+    channel.queue_declare(queue=queue_name)
+
+    queue_depth = QueueDepth(connection)
+
+    def callback(ch, method, props, body):
+        on_request(ch, method, props, body, queue_depth)
+
+    channel.basic_qos(prefetch_count=1)
+    channel.basic_consume(callback, queue=queue_name)
+
+    print(" [x] Awaiting RPC requests")
+    LOGGER.info(" [x] Awaiting RPC requests")
+    channel.start_consuming()
+
+
+if __name__ == '__main__':
+    main()
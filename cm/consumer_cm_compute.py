@@ -1,48 +1,168 @@
 #!/usr/bin/env python
-import pika
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+import pika
 
+from app.http_client import CLIENT
+from app.metrics import STATS
+from app.constant import PORT, CM_ID, CELERY_BROKER_URL, RPC_Q, TRANFER_PROTOCOLE
 
-import socket
-import requests
-import logging
-from app.constant import PORT,CM_ID,CELERY_BROKER_URL,RPC_Q,TRANFER_PROTOCOLE
 LOG_FORMAT = ('%(levelname) -10s %(asctime)s %(name) -30s %(funcName) '
               '-35s %(lineno) -5d: %(message)s')
 LOGGER = logging.getLogger(__name__)
-queue_name =  RPC_Q + str(CM_ID)
-parameters = pika.URLParameters(CELERY_BROKER_URL + "?heartbeat_interval=0")
-connection = pika.BlockingConnection(parameters)
+queue_name = RPC_Q + str(CM_ID)
 
-channel = connection.channel()
+# number of requests forwarded at the same time to the web workers, the
+# default matches the number of gunicorn workers (see gunicorn-config.py)
+CONCURRENCY = int(os.environ.get("CM_COMPUTE_CONCURRENCY", 15))
+# number of unacknowledged messages delivered by the broker, at least the
+# concurrency to keep all the threads busy
+PREFETCH = int(os.environ.get("CM_COMPUTE_PREFETCH", 0))
+# http: the requests are posted to the compute route of the web workers,
+# local: the requests are computed by a pool of processes of the consumer
+MODE = os.environ.get("CM_COMPUTE_MODE", "http")
+PROCESSES = int(os.environ.get("CM_COMPUTE_PROCESSES", CONCURRENCY))
 
-channel.queue_declare(queue=queue_name)
 
+@functools.lru_cache(maxsize=None)
+def compute_url():
+    ip = socket.gethostbyname(socket.gethostname())
+    return TRANFER_PROTOCOLE + str(ip) + ':' + str(PORT) + '/computation-module/compute/'
 
 
-def on_request(ch, method, props, body):
-    #body.status = 'up'
+def forward(body, url=None):
+    """Forward the body of the message to the compute route, return the
+    text of the response. The connections to the web workers are kept
+    alive and shared by the threads."""
+    headers = {'Content-Type': 'application/json'}
+    res = CLIENT.post(url or compute_url(), name='compute', data=body,
+                      headers=headers)
+    return res.text
 
-    print ('body',body)
 
-    headers = {'Content-Type':  'application/json'}
-    ip = socket.gethostbyname(socket.gethostname())
+def preload():
+    """Load the datasets in the process before the first request."""
+    from app.api_v1 import calculation_module
+
+    # the compute processes serve the requests, like the web workers
+    STATS.role = 'worker'
+
+    calculation_module.get_datasets()
+
+
+def compute_local(body):
+    from app.api_v1.transactions import compute_reply
+
+    return compute_reply(body).decode('utf-8')
+
+
+class LocalCompute(object):
+    """Compute the requests in a pool of processes, without the HTTP hop to
+    the web workers. The replies are the bytes returned by the compute
+    route, the processes load the datasets when they start.
+
+    The processes are spawned: the pool starts them from the threads of the
+    consumer, a fork would copy the state of the consumer and of its
+    threads.
+    """
+
+    def __init__(self, processes=PROCESSES):
+        self.pool = ProcessPoolExecutor(
+            max_workers=processes, initializer=preload,
+            mp_context=multiprocessing.get_context('spawn'))
+
+    def __call__(self, body):
+        return self.pool.submit(compute_local, body).result()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+class ComputeConsumer(object):
+    """Consume the compute requests with a pool of threads.
+
+    pika channels are not thread safe: the messages are handled by the
+    threads of the pool, while the replies and the acks are scheduled with
+    `connection.add_callback_threadsafe` and sent by the thread running the
+    connection. Each reply carries the correlation_id of its request and
+    each ack the delivery_tag of its message.
+    """
+
+    def __init__(self, connection, channel, queue=queue_name, handler=forward,
+                 concurrency=CONCURRENCY, prefetch=PREFETCH):
+        self.connection = connection
+        self.channel = channel
+        self.queue = queue
+        self.handler = handler
+        self.prefetch = max(prefetch, concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def start(self):
+        self.channel.basic_qos(prefetch_count=self.prefetch)
+        self.channel.basic_consume(self.on_request, queue=self.queue)
+
+    def on_request(self, ch, method, props, body):
+        STATS.incr('queued')
+        self.executor.submit(self.work, ch, method.delivery_tag, props, body)
+
+    def work(self, ch, delivery_tag, props, body):
+        STATS.incr('queued', -1)
+        try:
+            with STATS.track():
+                response = self.handler(body)
+        except Exception as exc:
+            LOGGER.exception('Compute request %s failed', props.correlation_id)
+            response = json.dumps({'status': 500, 'error': 'internal server error',
+                                   'message': str(exc)})
+        self.connection.add_callback_threadsafe(
+            functools.partial(self.reply, ch, delivery_tag, props, response))
+
+    def reply(self, ch, delivery_tag, props, response):
+        ch.basic_publish(exchange='',
+                         routing_key=props.reply_to,
+                         properties=pika.BasicProperties(correlation_id = \
+                                                             props.correlation_id),
+                         body=str(response))
+        ch.basic_ack(delivery_tag = delivery_tag)
+
+    def stop(self):
+        """Wait for the requests in progress and send their replies."""
+        self.executor.shutdown(wait=True)
+        self.connection.process_data_events(time_limit=0)
+
+
+def main():
+    STATS.role = 'consumer'
+    parameters = pika.URLParameters(CELERY_BROKER_URL + "?heartbeat_interval=0")
+    connection = pika.BlockingConnection(parameters)
+
+    channel = connection.channel()
+
+    channel.queue_declare(queue=queue_name)
 
-    base_url = TRANFER_PROTOCOLE+ str(ip) +':'+str(PORT)+'/computation-module/compute/'
-    print ('base_url ', base_url)
-    res = requests.post(base_url, data = body, headers = headers)
-    response = res.text
-    print ('onRequest response', response)
-    ch.basic_publish(exchange='',
-                     routing_key=props.reply_to,
-                     properties=pika.BasicProperties(correlation_id = \
-                                                         props.correlation_id),
-                     body=str(response))
+    handler = LocalCompute() if MODE == 'local' else forward
+    consumer = ComputeConsumer(connection, channel, handler=handler)
+    consumer.start()
 
-    ch.basic_ack(delivery_tag = method.delivery_tag)
+    print(" [x] Awaiting RPC requests")
+    LOGGER.info(" [x] Awaiting RPC requests, mode: %s, concurrency: %s, "
+                "prefetch: %s", MODE, CONCURRENCY, consumer.prefetch)
+    try:
+        channel.start_consuming()
+    except KeyboardInterrupt:
+        channel.stop_consuming()
+    finally:
+        consumer.stop()
+        if MODE == 'local':
+            handler.shutdown()
+        connection.close()
 
-channel.basic_qos(prefetch_count=1)
-channel.basic_consume(on_request, queue=queue_name)
 
-print(" [x] Awaiting RPC requests")
-channel.start_consuming()
+if __name__ == '__main__':
+    main()
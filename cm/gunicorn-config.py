@@ -1,2 +1,52 @@
 bind = "0.0.0.0:80"
 workers = 15
+# the application and the datasets are loaded once in the master process,
+# the workers share them copy-on-write
+preload_app = True
+
+
+def on_starting(server):
+    from app.warmup import clear_ready
+
+    clear_ready()
+
+
+def when_ready(server):
+    # called in the master after the application is loaded, before the
+    # workers are forked
+    from app.warmup import warm_up
+
+    try:
+        warm_up()
+    except Exception:
+        # the workers still serve the requests and load the datasets when
+        # they need them, but the CM is not marked as ready: /ready/ answers
+        # 503 until it is restarted
+        server.log.exception("Warm up failed")
+
+
+def post_fork(server, worker):
+    from app.warmup import reset_counters
+
+    reset_counters()
+
+
+def post_worker_init(worker):
+    # the CM is ready as soon as a worker can serve the requests
+    from app import warmup
+
+    if warmup.WARMED_UP:
+        warmup.mark_ready(pid=worker.ppid)
+
+
+def worker_exit(server, worker):
+    # write the last counters, added to the archive of the exited workers
+    from app.metrics import STATS
+
+    STATS.publish()
+
+
+def on_exit(server):
+    from app.warmup import clear_ready
+
+    clear_ready()
@@ -5,7 +5,11 @@ import json
 
 import time
 
-from app.api_v1.transactions import register
+from pika.exceptions import AMQPError
+
+from app.exceptions import RpcTimeout
+from app.rpc import backoff, register
+from app.warmup import wait_ready
 
 
 LOG_FORMAT = ('%(levelname) -10s %(asctime)s %(name) -30s %(funcName) '
@@ -20,23 +24,27 @@ def start_runner():
     def start_loop():
         not_started = True
         i = 0
+        delays = backoff()
         while not_started:
             LOGGER.info('In start loop')
-            response = register()
-            LOGGER.info("[HTAPI]  register response: %s ", response)
-            LOGGER.info('Server not yet started')
             i=i+1
             LOGGER.info('count = %s',str(i))
             try:
+                response = register()
+                LOGGER.info("[HTAPI]  register response: %s ", response)
                 json.loads(response)
                 LOGGER.info('Server started, quiting start_loop')
                 not_started = False
-            except :
-
-                LOGGER.info('Server not yet started')
-                time.sleep(2)
+            except (RpcTimeout, AMQPError, ValueError) as e:
+                delay = next(delays)
+                LOGGER.info('Server not yet started (%r), retrying in %.1f s',
+                            e, delay)
+                time.sleep(delay)
 
     LOGGER.info('Started runner 1')
+    # register once the datasets are loaded and the workers are up
+    if not wait_ready():
+        LOGGER.warning('The CM is not ready, registering anyway')
     start_loop()
 
 
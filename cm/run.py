@@ -3,6 +3,9 @@ import logging
 import os
 from app import create_app, log
 from app import constant
+from app.http_client import CLIENT
+from app.rpc import backoff
+from app.warmup import mark_ready, warm_up
 import requests
 import threading
 import time
@@ -22,31 +25,29 @@ if __name__ != '__main__':
 
 def start_runner():
     def start_loop():
+        headers = {'Content-Type':  'application/json'}
+        delays = backoff()
         not_started = True
         while not_started:
-            print('In start loop')
             LOGGER.info('In start loop')
             try:
             #get the external ip
                 ip = socket.gethostbyname(socket.gethostname())
-                # the cm will run his register request
-                LOGGER.info('ip ',ip )
                 base_url = constant.TRANFER_PROTOCOLE+ str(ip) +':'+ str(constant.PORT) +'/'
-                headers = {'Content-Type':  'application/json'}
-                r = requests.post(base_url +'computation-module/register/', headers=headers)
-                print (r.status_code)
-                LOGGER.info('r.status_code ',r.status_code )
+                # the cm registers once it serves the requests at steady state
+                r = CLIENT.get(base_url + 'computation-module/ready/', name='ready')
+                if r.status_code == 200:
+                    r = CLIENT.post(base_url +'computation-module/register/',
+                                    headers=headers, name='register')
+                LOGGER.info('r.status_code %s', r.status_code)
                 if r.status_code == 200:
-                    print('Server started, quiting start_loop')
                     LOGGER.info('Server started, quiting start_loop')
                     not_started = False
-                print(r.status_code)
-            except:
+            except (OSError, requests.RequestException):
                 LOGGER.info('Server not yet started')
-                print('Server not yet started')
-            time.sleep(2)
+            if not_started:
+                time.sleep(next(delays))
 
-    print('Started runner')
     LOGGER.info('Started runner')
     thread = threading.Thread(target=start_loop)
     thread.start()
@@ -55,6 +56,8 @@ def start_runner():
 
 log.info(application)
 if __name__ == '__main__':
+    warm_up()
+    mark_ready()
     #start_runner()
     application.run(host='0.0.0.0', port=constant.PORT)
 
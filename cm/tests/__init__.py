@@ -1,4 +1,64 @@
+import atexit
+import os
+import shutil
+import tempfile
 import unittest
+
+# the result cache, the metrics and the readiness flag of the tests are not
+# the ones of a CM running on the same host, set before the app is imported
+TMPDIR = tempfile.mkdtemp(prefix="biomass-tests-")
+atexit.register(shutil.rmtree, TMPDIR, ignore_errors=True)
+os.environ["CM_RESULT_CACHE_DIR"] = os.path.join(TMPDIR, "results")
+os.environ["CM_METRICS_DIR"] = os.path.join(TMPDIR, "metrics")
+os.environ["CM_READY_FILE"] = os.path.join(TMPDIR, "ready.json")
+
 from .tests import TestAPI
+from .test_calculation import (
+    TestBreakdown,
+    TestEfficiency,
+    TestEncoder,
+    TestRaster,
+    TestResultCache,
+    TestSensitivity,
+    TestUnits,
+)
+from .test_consumer import TestComputeConsumer, TestLocalCompute
+from .test_download import TestDownloader
+from .test_http_client import TestHttpClient
+from .test_rpc import TestRpcClient
+from .test_metrics import TestMetrics
+from .test_warmup import TestWarmUp
+from .test_startup import TestStartup
+from .test_profiling import TestProfiling
+from .test_prometheus import TestPrometheus
+from .test_validation import TestInputValidator
+from .test_datastore import TestDatasetStore, TestIngest, TestNutsIndex, TestNutsCube
 
-suite = unittest.TestLoader().loadTestsFromTestCase(TestAPI)
+loader = unittest.TestLoader()
+suite = unittest.TestSuite(
+    [
+        loader.loadTestsFromTestCase(TestAPI),
+        loader.loadTestsFromTestCase(TestDatasetStore),
+        loader.loadTestsFromTestCase(TestNutsIndex),
+        loader.loadTestsFromTestCase(TestNutsCube),
+        loader.loadTestsFromTestCase(TestIngest),
+        loader.loadTestsFromTestCase(TestInputValidator),
+        loader.loadTestsFromTestCase(TestEfficiency),
+        loader.loadTestsFromTestCase(TestBreakdown),
+        loader.loadTestsFromTestCase(TestRaster),
+        loader.loadTestsFromTestCase(TestUnits),
+        loader.loadTestsFromTestCase(TestSensitivity),
+        loader.loadTestsFromTestCase(TestEncoder),
+        loader.loadTestsFromTestCase(TestResultCache),
+        loader.loadTestsFromTestCase(TestDownloader),
+        loader.loadTestsFromTestCase(TestHttpClient),
+        loader.loadTestsFromTestCase(TestRpcClient),
+        loader.loadTestsFromTestCase(TestMetrics),
+        loader.loadTestsFromTestCase(TestWarmUp),
+        loader.loadTestsFromTestCase(TestStartup),
+        loader.loadTestsFromTestCase(TestProfiling),
+        loader.loadTestsFromTestCase(TestPrometheus),
+        loader.loadTestsFromTestCase(TestComputeConsumer),
+        loader.loadTestsFromTestCase(TestLocalCompute),
+    ]
+)
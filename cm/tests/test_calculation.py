@@ -0,0 +1,326 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from app import encoder
+from app.api_v1.calculation_module import (
+    KEYS,
+    LABELS,
+    check_eff,
+    check_effs,
+    parameter_matrix,
+)
+from app.constant import INPUTS_CALCULATION_MODULE
+from app.exceptions import ValidationError
+
+from app.api_v1.my_calculation_module_directory.breakdown import (
+    breakdown_columns,
+    write_breakdown,
+)
+from app.api_v1.my_calculation_module_directory.efficiency import compute_potentials
+from app.api_v1.my_calculation_module_directory.raster import (
+    NODATA,
+    get_gdal,
+    iter_windows,
+    region_densities,
+    write_density,
+)
+from app.api_v1.my_calculation_module_directory.result_cache import (
+    ResultCache,
+    make_key,
+)
+from app.api_v1.my_calculation_module_directory.sensitivity import (
+    percentile_bands,
+    sample_efficiencies,
+)
+from app.api_v1.my_calculation_module_directory.units import (
+    conversion_factor,
+    convert,
+    get_registry,
+)
+
+
+class TestEfficiency(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.energy = rng.random((4, 7))
+        self.eff = rng.random((4, 3))
+
+    def test_potentials(self):
+        pot = compute_potentials(self.energy, self.eff)
+        self.assertEqual(pot.heat.shape, (4, 7))
+        for layer, (coll, heat, elec) in enumerate(self.eff):
+            np.testing.assert_allclose(
+                pot.heat[layer], self.energy[layer] * coll * heat
+            )
+            np.testing.assert_allclose(
+                pot.electricity[layer], self.energy[layer] * coll * elec
+            )
+        np.testing.assert_allclose(pot.by_region().heat, pot.heat.sum(axis=0))
+        np.testing.assert_allclose(
+            pot.by_layer().electricity, pot.electricity.sum(axis=1)
+        )
+        self.assertAlmostEqual(pot.total().heat, pot.heat.sum())
+
+    def test_scenarios(self):
+        effs = np.stack([self.eff, self.eff * 0.5])
+        pot = compute_potentials(self.energy, effs)
+        self.assertEqual(pot.heat.shape, (2, 4, 7))
+        np.testing.assert_allclose(pot.heat[1], pot.heat[0] * 0.25)
+
+    def test_parameter_matrix(self):
+        psel = {
+            d["input_parameter_name"]: float(d["input_value"])
+            for d in INPUTS_CALCULATION_MODULE
+        }
+        psels = [psel, dict(psel, agric_coll_perc=120.0, forst_coll_perc=-1.0)]
+        effs = parameter_matrix(psels)
+        self.assertEqual(effs.shape, (2, len(KEYS), 3))
+        for p, eff in zip(psels, effs):
+            expected = np.array([[p[key] / 100 for key in lkeys] for lkeys in KEYS])
+            np.testing.assert_allclose(eff, expected)
+        # the same warnings as the single requests
+        expected = [[], []]
+        for warnings, eff in zip(expected, effs):
+            for label, (coll, heat, elec) in zip(LABELS, eff):
+                check_eff(label, coll, heat, elec, warnings=warnings)
+        self.assertEqual(check_effs(effs), expected)
+        self.assertEqual(len(expected[1]), 2)
+
+
+class TestBreakdown(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(42)
+        self.codes = np.array(["AT111", "AT112", "DE111"])
+        self.heat = rng.random((4, 3)) * 1e6
+        self.elec = rng.random((4, 3)) * 1e6
+        self.prefixes = ["waste", "agric", "forst", "lvstk"]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write(self):
+        for ext in (".csv", ".csv.gz"):
+            path = write_breakdown(
+                os.path.join(self.tmpdir.name, "breakdown" + ext),
+                self.codes,
+                self.heat,
+                self.elec,
+                self.prefixes,
+            )
+            df = pd.read_csv(path)
+            self.assertEqual(list(df.columns), breakdown_columns(self.prefixes))
+            self.assertEqual(list(df.code), list(self.codes))
+            np.testing.assert_allclose(df.forst_heat, self.heat[2], atol=1e-3)
+            np.testing.assert_allclose(df.lvstk_el, self.elec[3], atol=1e-3)
+
+
+try:
+    get_gdal()
+    HAS_GDAL = True
+except ImportError:
+    HAS_GDAL = False
+
+
+class TestRaster(unittest.TestCase):
+    def test_windows(self):
+        cover = np.zeros((700, 530), dtype=int)
+        for xoff, yoff, width, height in iter_windows(530, 700, block_size=256):
+            self.assertLessEqual(max(width, height), 256)
+            cover[yoff : yoff + height, xoff : xoff + width] += 1
+        self.assertTrue((cover == 1).all())
+
+    def test_region_densities(self):
+        densities = region_densities([100.0, 50.0, 10.0], np.array([4, 0, 10]), 0.5)
+        np.testing.assert_allclose(densities, [50.0, NODATA, 2.0])
+
+    @unittest.skipUnless(HAS_GDAL, "GDAL is not installed")
+    def test_write_density(self):
+        gdal = get_gdal()
+        reference = os.path.join(
+            os.path.dirname(__file__), "data", "raster_for_test.tif"
+        )
+        src = gdal.Open(reference)
+        x0, dx, _, y0, _, dy = src.GetGeoTransform()
+        x1, y1 = x0 + dx * src.RasterXSize, y0 + dy * src.RasterYSize
+        xmid = x0 + dx * (src.RasterXSize // 2)
+        # two regions: the west and the east halves of the reference
+        features = [
+            {
+                "type": "Feature",
+                "properties": {"NUTS_ID": code},
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [[[xa, y0], [xb, y0], [xb, y1], [xa, y1], [xa, y0]]],
+                },
+            }
+            for code, xa, xb in (("AT1", x0, xmid), ("AT2", xmid, x1))
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            geometries = os.path.join(tmpdir, "nuts.geojson")
+            with open(geometries, "w") as out:
+                json.dump(dict(type="FeatureCollection", features=features), out)
+            paths = write_density(
+                reference,
+                geometries,
+                ["AT1", "AT2"],
+                [(os.path.join(tmpdir, "heat.tif"), [1000.0, 10.0])],
+                block_size=64,
+            )
+            dst = gdal.Open(paths[0])
+            band = dst.GetRasterBand(1)
+            self.assertEqual(band.GetBlockSize(), [256, 256])
+            density = band.ReadAsArray()
+            valid = density != band.GetNoDataValue()
+            hectares = abs(dx * dy) / 1e4
+            half = src.RasterXSize // 2
+            west, east = density[:, :half], density[:, half:]
+            self.assertAlmostEqual(
+                west[valid[:, :half]].sum() * hectares, 1000.0, places=2
+            )
+            self.assertAlmostEqual(
+                east[valid[:, half:]].sum() * hectares, 10.0, places=4
+            )
+
+
+class TestUnits(unittest.TestCase):
+    def test_factors_as_pint(self):
+        ureg = get_registry()
+        for unit in ("PJ", "TJ", "GWh", "kWh", "kcal"):
+            self.assertAlmostEqual(
+                conversion_factor(unit, "MWh"),
+                ureg.Quantity(1.0, unit).to("MWh").magnitude,
+            )
+        self.assertEqual(conversion_factor("PetaJoule", "MWh"), 1e15 / 3.6e9)
+
+    def test_convert_mixed_units(self):
+        res = convert([1.0, 2.0, 3.0], ["PetaJoule", "GWh", "MWh"])
+        np.testing.assert_allclose(res, [1e15 / 3.6e9, 2e3, 3.0])
+
+
+class TestSensitivity(unittest.TestCase):
+    def setUp(self):
+        self.psel = {
+            d["input_parameter_name"]: float(d["input_value"]) / 100.0
+            for d in INPUTS_CALCULATION_MODULE
+        }
+
+    def test_sampling(self):
+        distributions = {
+            "waste_coll_perc": {"distribution": "normal", "mean": 95, "std": 20},
+            "agric_heat_eff": {"distribution": "triangular", "min": 40, "max": 60},
+            "forst_el_eff": {"distribution": "uniform", "min": -10, "max": 30},
+        }
+        effs = sample_efficiencies(self.psel, distributions, KEYS, 10000, seed=1)
+        self.assertEqual(effs.shape, (10000, 4, 3))
+        # samples are bounded by input_min and input_max
+        self.assertLessEqual(effs[:, 0, 0].max(), 1.0)
+        self.assertGreaterEqual(effs[:, 2, 2].min(), 0.0)
+        self.assertLessEqual(effs[:, 2, 2].max(), 0.3)
+        self.assertAlmostEqual(np.median(effs[:, 1, 1]), 0.5, places=2)
+        # parameters without a distribution are not sampled
+        self.assertTrue((effs[:, 3, 0] == self.psel["lvstk_coll_perc"]).all())
+        p5, p50, p95 = percentile_bands(effs[:, 1, 1])
+        self.assertTrue(0.4 < p5 < p50 < p95 < 0.6)
+
+    def test_invalid_distribution(self):
+        with self.assertRaises(ValidationError):
+            sample_efficiencies(
+                self.psel, {"waste_coll_perc": {"distribution": "beta"}}, KEYS
+            )
+        with self.assertRaises(ValidationError):
+            sample_efficiencies(self.psel, {"unknown": {}}, KEYS)
+
+
+class TestEncoder(unittest.TestCase):
+    def setUp(self):
+        self.obj = {
+            "result": {
+                "value": np.round(np.float64(1.2345), decimals=1),
+                "single": np.float32(0.5),
+                "count": np.int64(3),
+                "data": np.arange(3.0),
+                "list": [np.float64(2.5), "a", None],
+            }
+        }
+        self.expected = {
+            "result": {
+                "value": 1.2,
+                "single": 0.5,
+                "count": 3,
+                "data": [0.0, 1.0, 2.0],
+                "list": [2.5, "a", None],
+            }
+        }
+
+    def test_dumps(self):
+        self.assertEqual(encoder.loads(encoder.dumps(self.obj)), self.expected)
+        with self.assertRaises(TypeError):
+            encoder.dumps({"obj": object()})
+
+    def test_iterencode(self):
+        chunks = list(encoder.iterencode(self.obj, chunk_size=8))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(encoder.loads(b"".join(chunks)), self.expected)
+        obj = dict(self.obj, missing=np.nan)
+        self.assertEqual(b"".join(encoder.iterencode(obj)), encoder.dumps(obj))
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key(self):
+        self.assertEqual(
+            make_key(codes=["AT1"], params={"a": 1.0, "b": 2.0}),
+            make_key(params={"b": 2.0, "a": 1.0}, codes=["AT1"]),
+        )
+        self.assertNotEqual(make_key(codes=["AT1"]), make_key(codes=["AT2"]))
+
+    def test_lru(self):
+        cache = ResultCache(maxsize=2, directory=None)
+        cache.set("a", {"value": np.float64(1.5)})
+        cache.set("b", {"value": 2})
+        self.assertEqual(cache.get("a"), {"value": 1.5})
+        cache.set("c", {"value": 3})
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), {"value": 1.5})
+        self.assertEqual(cache.stats["evictions"], 1)
+        self.assertAlmostEqual(cache.hit_ratio, 2 / 3)
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.05, directory=self.tmpdir.name)
+        cache.set("a", {"value": 1})
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats["expirations"], 2)
+
+    def test_ttl_from_creation(self):
+        cache = ResultCache(ttl=0.2, directory=self.tmpdir.name)
+        cache.set("a", {"value": 1})
+        time.sleep(0.12)
+        # a hit, from the file in another process, does not extend the ttl
+        self.assertEqual(
+            ResultCache(ttl=0.2, directory=self.tmpdir.name).get("a"), {"value": 1}
+        )
+        time.sleep(0.12)
+        self.assertIsNone(ResultCache(ttl=0.2, directory=self.tmpdir.name).get("a"))
+
+    def test_shared_directory(self):
+        cache0 = ResultCache(maxsize=2, directory=self.tmpdir.name)
+        cache1 = ResultCache(maxsize=2, directory=self.tmpdir.name)
+        cache0.set("a", {"value": 1})
+        self.assertEqual(cache1.get("a"), {"value": 1})
+        cache0.set("b", {"value": 2})
+        cache0.set("c", {"value": 3})
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 2)
+        self.assertEqual(cache0.stats["file_evictions"], 1)
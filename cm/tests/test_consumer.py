@@ -0,0 +1,126 @@
+import json
+import os
+import queue
+import threading
+import unittest
+from types import SimpleNamespace
+
+from app import create_app
+from app.metrics import STATS
+from consumer_cm_compute import ComputeConsumer, LocalCompute
+from .tests import get_payload
+
+
+class FakeConnection(object):
+    """Stand-in of pika.BlockingConnection: the callbacks scheduled by the
+    threads are run by the thread calling process_data_events."""
+
+    def __init__(self):
+        self.callbacks = queue.Queue()
+        self.thread = threading.current_thread()
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.put(callback)
+
+    def process_data_events(self, time_limit=0):
+        while True:
+            try:
+                callback = self.callbacks.get(timeout=time_limit)
+            except queue.Empty:
+                return
+            callback()
+
+
+class FakeChannel(object):
+    """Stand-in of a pika channel, it records the calls and checks that they
+    are made by the thread of the connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.published = []
+        self.acks = []
+
+    def basic_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, callback, queue):
+        self.callback = callback
+
+    def deliver(self, tag, corr_id, body):
+        method = SimpleNamespace(delivery_tag=tag)
+        props = SimpleNamespace(correlation_id=corr_id, reply_to="reply")
+        self.callback(self, method, props, body)
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        assert threading.current_thread() is self.connection.thread
+        self.published.append((routing_key, properties.correlation_id, body))
+
+    def basic_ack(self, delivery_tag):
+        assert threading.current_thread() is self.connection.thread
+        self.acks.append(delivery_tag)
+
+
+class TestComputeConsumer(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection()
+        self.channel = FakeChannel(self.connection)
+
+    def test_concurrent_requests(self):
+        nreq = 8
+        # all the requests must be in progress at the same time to pass
+        barrier = threading.Barrier(nreq, timeout=5)
+
+        def handler(body):
+            barrier.wait()
+            return body.upper()
+
+        consumer = ComputeConsumer(
+            self.connection, self.channel, handler=handler, concurrency=nreq
+        )
+        consumer.start()
+        self.assertEqual(self.channel.prefetch_count, nreq)
+        for tag in range(nreq):
+            self.channel.deliver(tag, f"corr-{tag}", f"body-{tag}")
+        consumer.stop()
+        self.assertEqual(sorted(self.channel.acks), list(range(nreq)))
+        self.assertEqual(
+            sorted(self.channel.published),
+            [("reply", f"corr-{tag}", f"BODY-{tag}") for tag in range(nreq)],
+        )
+
+    def test_failed_request(self):
+        def handler(body):
+            raise ValueError("compute failed")
+
+        consumer = ComputeConsumer(self.connection, self.channel, handler=handler)
+        consumer.start()
+        self.channel.deliver(1, "corr-1", "body")
+        consumer.stop()
+        self.assertEqual(self.channel.acks, [1])
+        _, corr_id, body = self.channel.published[0]
+        self.assertEqual(corr_id, "corr-1")
+        self.assertIn("compute failed", body)
+
+
+def process_role():
+    return STATS.role
+
+
+class TestLocalCompute(unittest.TestCase):
+    def test_same_reply(self):
+        app = create_app(os.environ.get("FLASK_CONFIG", "development"))
+        payload = get_payload()
+        invalid = dict(payload, inputs_parameter_selection={})
+        role, STATS.role = STATS.role, "consumer"
+        local = LocalCompute(processes=1)
+        try:
+            for data, status in ((payload, 200), (invalid, 400)):
+                rv = app.test_client().post("computation-module/compute/", json=data)
+                self.assertEqual(rv.status_code, status)
+                reply = local(json.dumps(data))
+                self.assertEqual(reply, rv.get_data(as_text=True))
+            # the requests of the processes are counted as the ones of a worker
+            self.assertEqual(local.pool.submit(process_role).result(), "worker")
+        finally:
+            local.shutdown()
+            STATS.role = role
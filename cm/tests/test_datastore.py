@@ -0,0 +1,255 @@
+import functools
+import json
+import os
+import pathlib as pth
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from app.api_v1.my_calculation_module_directory import datastore
+from app.api_v1.my_calculation_module_directory.datastore import (
+    Dataset,
+    DatasetStore,
+    read_binary,
+)
+from app.api_v1.my_calculation_module_directory.ingest import (
+    columns_digest,
+    records_codes,
+    records_energy,
+    records_energy_by_code,
+    records_to_columns,
+)
+from app.api_v1.my_calculation_module_directory.nuts import (
+    NutsCube,
+    NutsSelection,
+    normalize_codes,
+    outermost_codes,
+)
+from app.api_v1.my_calculation_module_directory.units import conversion_factor
+from app.exceptions import ValidationError
+
+DATADIR = pth.Path(__file__).parent / "data"
+# datasets are in PJ, sums are returned in MWh
+PJ2MWH = conversion_factor("PetaJoule", "MWh")
+
+
+def read_json(jsname):
+    with open(DATADIR / jsname, mode="r") as js:
+        return json.load(js)
+
+
+class TestDatasetStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csvpath = pth.Path(self.tmpdir.name, "forest_residues.csv")
+        self.df = pd.DataFrame(read_json("forest_residues.json"))
+        self.df.to_csv(self.csvpath)
+        self.bindir = pth.Path(self.tmpdir.name, "npy")
+        self.store = DatasetStore(
+            loader=functools.partial(read_binary, bindir=self.bindir)
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load_once(self):
+        dset = self.store.get("forest", self.csvpath)
+        self.assertEqual(len(dset), len(self.df))
+        self.assertAlmostEqual(dset.value.sum(), self.df.value.sum())
+        self.assertEqual(dset.units, ["PetaJoule"])
+        self.assertIs(self.store.get("forest", self.csvpath), dset)
+        self.assertEqual(self.store.stats["loads"], 1)
+        self.assertEqual(self.store.stats["hits"], 1)
+        self.assertEqual(self.store.stats["misses"], 1)
+
+    def test_binary(self):
+        dset = self.store.get("forest", self.csvpath)
+        self.assertEqual(len(os.listdir(self.bindir)), 1)
+        self.assertIsInstance(dset.index.csum, np.memmap)
+        # a new process maps the converted arrays instead of parsing the csv
+        store = DatasetStore(loader=functools.partial(read_binary, bindir=self.bindir))
+        other = store.get("forest", self.csvpath)
+        np.testing.assert_array_equal(other.value, dset.value)
+        self.assertEqual(list(other.code), list(self.df.code))
+        self.assertEqual(other.sum(["AT1", "DE"]), dset.sum(["AT1", "DE"]))
+
+    def test_binary_format(self):
+        self.store.get("forest", self.csvpath)
+        (first,) = os.listdir(self.bindir)
+        self.assertTrue(first.endswith(datastore.FORMAT_VERSION))
+        # a new version of the format converts the csv file again, the
+        # previous version is kept for the processes still resolving it
+        os.utime(self.bindir / first, (0, 0))
+        with mock.patch.object(datastore, "FORMAT_VERSION", "new"):
+            read_binary("forest", self.csvpath, version="v", bindir=self.bindir)
+        self.assertEqual(
+            sorted(os.listdir(self.bindir)), sorted([first, "forest_residues-v-new"])
+        )
+        # only the versions older than the previous one are removed
+        os.utime(self.bindir / "forest_residues-v-new", (1, 1))
+        with mock.patch.object(datastore, "FORMAT_VERSION", "newer"):
+            read_binary("forest", self.csvpath, version="v", bindir=self.bindir)
+        self.assertEqual(
+            sorted(os.listdir(self.bindir)),
+            ["forest_residues-v-new", "forest_residues-v-newer"],
+        )
+
+    def test_stale_tmpdirs(self):
+        os.makedirs(self.bindir)
+        old = tempfile.mkdtemp(dir=self.bindir, prefix=".tmp-")
+        os.utime(old, (0, 0))
+        # may be a conversion still running in another process
+        recent = tempfile.mkdtemp(dir=self.bindir, prefix=".tmp-")
+        self.store.get("forest", self.csvpath)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(recent))
+
+    def test_invalidation(self):
+        dset = self.store.get("forest", self.csvpath)
+        # touching the file without changing the content does not reload
+        st = os.stat(self.csvpath)
+        os.utime(self.csvpath, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertIs(self.store.get("forest", self.csvpath), dset)
+        self.assertEqual(self.store.stats["loads"], 1)
+        # changing the content reloads the dataset
+        self.df.iloc[:10].to_csv(self.csvpath)
+        self.assertEqual(len(self.store.get("forest", self.csvpath)), 10)
+        self.assertEqual(self.store.stats["loads"], 2)
+        self.assertEqual(self.store.stats["invalidations"], 1)
+
+
+class TestNutsIndex(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame(read_json("agricultural_residues.json"))
+        self.dset = Dataset.from_frame("agric", self.df)
+
+    def test_prefix_selection(self):
+        for sel in (["AT111"], ["AT1"], ["AT", "at11", "AT111"], ["DE", "FR1"]):
+            mask = self.df.code.str.startswith(tuple(c.upper() for c in sel))
+            rows = self.dset.rows(sel)
+            self.assertEqual(sorted(rows), list(np.flatnonzero(mask)))
+            self.assertAlmostEqual(
+                self.dset.sum(sel) / PJ2MWH, self.df.value[mask].sum(), places=9
+            )
+
+    def test_empty_selection(self):
+        self.assertEqual(len(self.dset.rows(["XX"])), 0)
+        self.assertEqual(self.dset.sum([]), 0)
+
+    def test_sums_by_code(self):
+        codes = normalize_codes(["AT", "AT111", "DE1", "XX"])
+        expected = [
+            self.df.value[self.df.code.str.startswith(code)].sum() for code in codes
+        ]
+        np.testing.assert_allclose(self.dset.sums(codes) / PJ2MWH, expected)
+
+
+class TestNutsCube(unittest.TestCase):
+    def setUp(self):
+        jsnames = (
+            "agricultural_residues.json",
+            "solid_waste.json",
+            "livestock_effluents.json",
+            "forest_residues.json",
+        )
+        self.dfs = [pd.DataFrame(read_json(jsname)) for jsname in jsnames]
+        self.dsets = [Dataset.from_frame(str(i), df) for i, df in enumerate(self.dfs)]
+
+    def test_cover(self):
+        cube = self.dsets[0].cube
+        df = self.dfs[0]
+        at = df.code[df.code.str.startswith("AT")]
+        self.assertEqual(cube.cover(at), ["AT"])
+        self.assertEqual(cube.cover(list(at) + ["AT1"]), ["AT"])
+        at1 = at[at.str.startswith("AT1")]
+        self.assertEqual(cube.cover(list(at1) + ["DE111"]), ["AT1", "DE111"])
+        self.assertEqual(cube.cover(["XX", "AT111"]), ["AT111"])
+        # the selected codes themselves, without the codes below them
+        self.assertEqual(
+            outermost_codes(["AT1", "AT111", "AT2", "DE", "DE111"]),
+            ["AT1", "AT2", "DE"],
+        )
+
+    def test_shared_selection(self):
+        # AT1 has two children in the first cube and three in the second
+        first = NutsCube(["AT111", "AT112"], ["a", "a"], [1.0, 2.0])
+        second = NutsCube(["AT111", "AT112", "AT113"], ["a", "a", "a"], [1, 2, 4])
+        selection = NutsSelection(["AT111", "AT112", "AT"], [first, second])
+        self.assertEqual(selection.cover, ["AT"])
+        selection = NutsSelection(["AT111", "AT112", "DE1"], [first, second])
+        self.assertEqual(selection.cover, ["AT111", "AT112"])
+        self.assertEqual(first.sum_cover(selection.cover), 3.0)
+        self.assertEqual(second.sum_cover(selection.cover), 3.0)
+        # a NUTS 3 selection is summed with the index, as the cube does
+        codes = self.dfs[0].code[self.dfs[0].code.str.len() == 5]
+        selection = NutsSelection(codes, [dset.cube for dset in self.dsets])
+        self.assertTrue(selection.leaf)
+        for dset in self.dsets:
+            np.testing.assert_allclose(dset.sum(selection), dset.cube.sum(codes))
+
+    def test_sum_as_dataframe(self):
+        selections = [
+            None,
+            ["AT111"],
+            ["AT"],
+            ["AT1", "AT21", "AT211", "DE"],
+            self.dfs[0].code[self.dfs[0].code.str.startswith(("DE", "FR"))],
+            self.dfs[0].code,
+        ]
+        for df, dset in zip(self.dfs, self.dsets):
+            for sel in selections:
+                if sel is None:
+                    expected = df.value.sum()
+                else:
+                    expected = df.value[df.code.str.startswith(tuple(sel))].sum()
+                self.assertAlmostEqual(dset.sum(sel) / PJ2MWH, expected, places=9)
+
+
+class TestIngest(unittest.TestCase):
+    def test_records(self):
+        records = read_json("livestock_effluents.json")
+        cols = records_to_columns(records)
+        self.assertEqual(list(cols["code"]), [rec["code"] for rec in records])
+        self.assertEqual(cols["value"].dtype, np.float64)
+        self.assertAlmostEqual(
+            records_energy(records) / PJ2MWH,
+            pd.DataFrame(records).value.sum(),
+            places=9,
+        )
+        self.assertEqual(records_energy([]), 0.0)
+
+    def test_records_by_code(self):
+        records = read_json("livestock_effluents.json")[:50]
+        records.append(dict(records[0], unit="GWh", value=1.0))
+        codes = normalize_codes(["AT111", "AT112", "XX"])
+        df = pd.DataFrame(records[:-1])
+        expected = [df.value[df.code == code].sum() * PJ2MWH for code in codes]
+        expected[0] += 1e3
+        np.testing.assert_allclose(records_energy_by_code(records, codes), expected)
+
+    def test_columns_digest(self):
+        records = read_json("livestock_effluents.json")[:50]
+
+        def digest(records):
+            return columns_digest([records_to_columns(records), records_to_columns([])])
+
+        self.assertEqual(digest(records), digest([dict(rec) for rec in records]))
+        for change in (dict(value=1.0), dict(unit="GWh"), dict(code="AT112")):
+            self.assertNotEqual(digest(records), digest([dict(records[0], **change)]))
+        self.assertNotEqual(
+            digest(records), digest(records[:-1] + [dict(records[-1], value=0.5)])
+        )
+
+    def test_invalid_records(self):
+        with self.assertRaises(ValidationError):
+            records_to_columns([{"code": "AT111", "value": 1.0}])
+
+    def test_codes(self):
+        selection = {
+            "a": [{"code": "AT111"}, {"code": "AT112"}],
+            "b": [{"code": "AT111"}, {"value": 1.0}],
+        }
+        self.assertEqual(records_codes(selection, ("a", "b", "c")), {"AT111", "AT112"})
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from app.api_v1.my_calculation_module_directory import download
+from app.api_v1.my_calculation_module_directory.download import (
+    ChecksumError,
+    Downloader,
+    file_lock,
+)
+
+CONTENT = b"code,source,value,unit\nAT111,forest.residues,0.49,PetaJoule\n" * 1000
+ETAG = '"v1"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Local stand-in of the dataset repository that supports ETags."""
+
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(CONTENT)))
+        self.end_headers()
+        self.wfile.write(CONTENT)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloader(unittest.TestCase):
+    def setUp(self):
+        Handler.requests = []
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = "http://127.0.0.1:{}/data.csv".format(self.server.server_port)
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.tmpdir.cleanup()
+
+    def test_concurrent_fetch(self):
+        downloader = Downloader(directory=self.tmpdir.name)
+        paths = []
+        threads = [
+            threading.Thread(
+                target=lambda: paths.append(downloader.fetch(self.url, "data.csv"))
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(Handler.requests), 1)
+        self.assertEqual(len(set(paths)), 1)
+        with open(paths[0], mode="rb") as data:
+            self.assertEqual(data.read(), CONTENT)
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir.name)),
+            ["data.csv", "data.csv.lock", "data.csv.meta.json"],
+        )
+
+    def test_meta_cache(self):
+        downloader = Downloader(directory=self.tmpdir.name)
+        path = downloader.fetch(self.url, "data.csv")
+        with mock.patch.object(download.json, "load", wraps=download.json.load) as load:
+            for _ in range(3):
+                downloader.fetch(self.url, "data.csv")
+            self.assertEqual(load.call_count, 0)
+            # written by another process
+            meta = downloader._read_meta(path)
+            other = Downloader(directory=self.tmpdir.name)
+            other._write_meta(path, dict(meta, checked=0))
+            self.assertEqual(downloader._read_meta(path)["checked"], 0)
+            self.assertEqual(load.call_count, 1)
+
+    def test_revalidation(self):
+        downloader = Downloader(directory=self.tmpdir.name, revalidate=0)
+        path = downloader.fetch(self.url, "data.csv")
+        mtime = os.stat(path).st_mtime_ns
+        # the stale copy is served while it is revalidated
+        self.assertEqual(downloader.fetch(self.url, "data.csv"), path)
+        downloader.wait()
+        self.assertEqual(len(Handler.requests), 2)
+        self.assertEqual(downloader.stats["not_modified"], 1)
+        self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+
+    def test_checksum(self):
+        downloader = Downloader(directory=self.tmpdir.name)
+        sha256 = hashlib.sha256(CONTENT).hexdigest()
+        with self.assertRaises(ChecksumError):
+            downloader.fetch(self.url, "data.csv", sha256="0" * 64)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "data.csv")))
+        path = downloader.fetch(self.url, "data.csv", sha256=sha256)
+        self.assertTrue(os.path.exists(path))
+
+    def test_unreachable_server(self):
+        downloader = Downloader(directory=self.tmpdir.name, timeout=1)
+        path = downloader.fetch(self.url, "data.csv")
+        os.remove(path + ".meta.json")
+        self.server.shutdown()
+        self.server.server_close()
+        # the local copy is used and the server is not contacted again
+        self.assertEqual(downloader.fetch(self.url, "data.csv"), path)
+        downloader.wait()
+        self.assertEqual(downloader.fetch(self.url, "data.csv"), path)
+        downloader.wait()
+        self.assertEqual(downloader.stats["errors"], 1)
+
+    def test_revalidation_in_progress(self):
+        downloader = Downloader(directory=self.tmpdir.name, revalidate=0)
+        path = downloader.fetch(self.url, "data.csv")
+        # another process of the host is revalidating the file
+        with file_lock(path + ".lock"):
+            self.assertEqual(downloader.fetch(self.url, "data.csv"), path)
+            downloader.wait()
+        self.assertEqual(len(Handler.requests), 1)
+
+    def test_stale_checksum(self):
+        downloader = Downloader(directory=self.tmpdir.name, revalidate=0)
+        path = downloader.fetch(self.url, "data.csv")
+        os.remove(path + ".meta.json")
+        # a new content that does not match is rejected, the copy is kept
+        downloader.fetch(self.url, "data.csv", sha256="0" * 64)
+        downloader.wait()
+        self.assertEqual(downloader.stats["errors"], 1)
+        with open(path, mode="rb") as data:
+            self.assertEqual(data.read(), CONTENT)
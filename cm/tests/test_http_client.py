@@ -0,0 +1,103 @@
+import os
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app.api_v1.transactions import savefile
+from app.http_client import HttpClient
+
+CONTENT = bytes(range(256)) * 4096
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Local HTTP/1.1 server keeping the connections alive, it counts the
+    connections opened by the clients."""
+
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            Handler.connections += 1
+
+    def do_GET(self):
+        if self.path != "/raster.tif":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(CONTENT)))
+        self.end_headers()
+        self.wfile.write(CONTENT)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        Handler.connections = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_connection_reuse(self):
+        client = HttpClient(pool_size=4)
+        nthreads, ncalls = 4, 10
+
+        def post(i):
+            for j in range(ncalls):
+                body = f"{i}-{j}".encode()
+                res = client.post(self.url + "/compute/", data=body, name="compute")
+                self.assertEqual(res.content, body)
+
+        threads = [threading.Thread(target=post, args=(i,)) for i in range(nthreads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.session.close()
+        # one connection per thread at most, instead of one per call
+        self.assertLessEqual(Handler.connections, nthreads)
+        stats = client.timings()["compute"]
+        self.assertEqual(stats["calls"], nthreads * ncalls)
+        self.assertEqual(stats["errors"], 0)
+        self.assertGreater(stats["seconds"], 0)
+
+    def test_errors(self):
+        client = HttpClient()
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertRaises(requests.ConnectionError):
+            client.get(self.url + "/raster.tif", timeout=1, name="raster")
+        self.assertEqual(client.timings()["raster"]["errors"], 1)
+        self.assertEqual(client.timings()["raster"]["calls"], 1)
+
+    def test_savefile(self):
+        filename = "test_http_client_{}.tif".format(os.getpid())
+        path = savefile(filename, self.url + "/raster.tif")
+        try:
+            with open(path, mode="rb") as data:
+                self.assertEqual(data.read(), CONTENT)
+        finally:
+            os.remove(path)
+        self.assertIsNone(savefile(filename, self.url + "/missing.tif"))
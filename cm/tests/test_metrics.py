@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from app import create_app
+from app.exceptions import ValidationError
+from app.metrics import STATS, ProcessStats, percentiles, read_states, summarize
+from consumer_cm_alive import on_request
+from .tests import get_payload
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_percentiles(self):
+        values = list(range(100, 0, -1))
+        self.assertEqual(percentiles(values), dict(p50=50, p95=95, p99=99))
+        self.assertEqual(percentiles([3.0]), dict(p50=3.0, p95=3.0, p99=3.0))
+        self.assertEqual(percentiles([])["p99"], None)
+
+    def test_track(self):
+        stats = ProcessStats(directory=self.tmpdir.name, window=3)
+        for _ in range(5):
+            with stats.track():
+                pass
+        with self.assertRaises(ValueError):
+            with stats.track():
+                raise ValueError("failed")
+        # an invalid request is not a failure of the CM
+        with self.assertRaises(ValidationError):
+            with stats.track():
+                raise ValidationError("invalid")
+        state = stats.state()
+        self.assertEqual(state["requests"], 7)
+        self.assertEqual(state["errors"], 1)
+        self.assertEqual(state["rejected"], 1)
+        self.assertEqual(state["in_flight"], 0)
+        self.assertEqual(len(state["latencies_ms"]), 3)
+        self.assertGreater(state["rss"], 0)
+
+    def test_snapshot(self):
+        worker = ProcessStats(role="worker", directory=self.tmpdir.name)
+        worker.collect("datasets", lambda: dict(last_load=1000.0))
+        for _ in range(10):
+            with worker.track():
+                pass
+        worker.publish()
+        # statistics of a process that exited
+        dead = subprocess.run(
+            [sys.executable, "-c", "import os; print(os.getpid())"],
+            capture_output=True,
+            text=True,
+        )
+        path = os.path.join(self.tmpdir.name, dead.stdout.strip() + ".json")
+        with open(path, "w") as out:
+            json.dump(dict(worker.state(), role="dead"), out)
+
+        states = read_states(self.tmpdir.name)
+        self.assertEqual([state["pid"] for state in states], [os.getpid()])
+        self.assertFalse(os.path.exists(path))
+        summary = summarize(states, now=1060.0)
+        self.assertEqual(list(summary), ["worker"])
+        self.assertEqual(summary["worker"]["requests"], 10)
+        self.assertEqual(summary["worker"]["latency_ms"]["n"], 10)
+        self.assertEqual(summary["worker"]["datasets"], dict(loaded=1, age=60.0))
+
+    def test_compute_stats(self):
+        app = create_app(os.environ.get("FLASK_CONFIG", "development"))
+        before = STATS.state()
+        rv = app.test_client().post("computation-module/compute/", json=get_payload())
+        self.assertEqual(rv.status_code, 200)
+        after = STATS.state()
+        self.assertEqual(after.get("requests"), before.get("requests", 0) + 1)
+        self.assertGreater(after["datasets"]["loads"], 0)
+        self.assertIn("hits", after["results"])
+
+    def test_alive_reply(self):
+        published = []
+        channel = SimpleNamespace(
+            basic_publish=lambda **kwargs: published.append(kwargs),
+            basic_ack=lambda delivery_tag: None,
+        )
+        method = SimpleNamespace(delivery_tag=1)
+        props = SimpleNamespace(correlation_id="corr", reply_to="reply")
+        depth = lambda: dict(depth=3, consumers=1)
+        on_request(channel, method, props, b"ping", queue_depth=depth)
+        health = json.loads(published[0]["body"])
+        self.assertEqual(health["status"], "up")
+        self.assertEqual(health["queue"], dict(depth=3, consumers=1))
+        self.assertEqual(published[0]["properties"].correlation_id, "corr")
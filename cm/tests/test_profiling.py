@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app import create_app, profiling
+from app.api_v1 import calculation_module
+from app.api_v1.my_calculation_module_directory.result_cache import ResultCache
+from .tests import get_payload
+
+STAGES = {"parse", "load", "filter", "cache", "efficiency", "best_unit", "graphics"}
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.histograms = profiling.Histograms(buckets=(0.001, 0.01, float("inf")))
+        patcher = mock.patch.object(profiling, "HISTOGRAMS", self.histograms)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_histograms(self):
+        for seconds in (0.0005, 0.001, 0.005, 1.0):
+            self.histograms.observe("load", seconds)
+        load = self.histograms.snapshot()["load"]
+        self.assertEqual(load["count"], 4)
+        self.assertAlmostEqual(load["sum"], 1.0065)
+        self.assertEqual(load["counts"], [2, 1, 1])
+
+    def test_request(self):
+        with profiling.stage("load"):
+            pass
+        self.assertEqual(self.histograms.snapshot()["load"]["count"], 1)
+        with profiling.request() as timings:
+            for _ in range(3):
+                with profiling.stage("filter"):
+                    pass
+            with profiling.stage("load"):
+                pass
+        # the time of the stages is summed by request
+        self.assertEqual(set(timings), {"filter", "load"})
+        snapshot = self.histograms.snapshot()
+        self.assertEqual(snapshot["filter"]["count"], 1)
+        self.assertEqual(snapshot["load"]["count"], 2)
+
+    def test_disabled(self):
+        with mock.patch.object(profiling, "ENABLED", False):
+            with profiling.request() as timings:
+                with profiling.stage("filter"):
+                    pass
+        self.assertEqual(timings, {})
+        self.assertEqual(self.histograms.snapshot(), {})
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with mock.patch.object(profiling, "PROFILE_DIR", tmpdir):
+                with profiling.request(rate=0):
+                    pass
+                self.assertEqual(os.listdir(tmpdir), [])
+                with profiling.request(rate=1):
+                    sum(range(1000))
+                (name,) = os.listdir(tmpdir)
+            self.assertTrue(name.endswith(".prof"))
+
+    def test_compute_timings(self):
+        app = create_app(os.environ.get("FLASK_CONFIG", "development"))
+        client = app.test_client()
+        payload = dict(get_payload(), timings=True)
+        # the result is computed, not read from the result cache
+        results = ResultCache(maxsize=0, directory=None)
+        with mock.patch.object(calculation_module, "RESULTS", results):
+            rv = client.post("computation-module/compute/", json=payload)
+        self.assertEqual(rv.status_code, 200)
+        timings = rv.get_json()["timings"]
+        self.assertTrue(STAGES <= set(timings), timings)
+        self.assertIn("serialization;dur=", rv.headers["Server-Timing"])
+        self.assertTrue(STAGES | {"serialization"} <= set(self.histograms.snapshot()))
+        # the timings are only added on demand
+        rv = client.post("computation-module/compute/", json=get_payload())
+        self.assertNotIn("timings", rv.get_json())
+        self.assertNotIn("Server-Timing", rv.headers)
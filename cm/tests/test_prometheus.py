@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from app import create_app, prometheus
+from app.decorators import rate_limit
+from app.metrics import STATS, ProcessStats, collect
+from .tests import get_payload
+
+
+def dead_pid():
+    proc = subprocess.run(
+        [sys.executable, "-c", "import os; print(os.getpid())"],
+        capture_output=True,
+        text=True,
+    )
+    return int(proc.stdout)
+
+
+def samples(text):
+    """Return the value of each sample of the text format."""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    return values
+
+
+class TestPrometheus(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_state(self, stats, pid):
+        state = dict(stats.state(), pid=pid)
+        with open(os.path.join(self.directory, f"{pid}.json"), "w") as out:
+            json.dump(state, out)
+
+    def test_archive(self):
+        stats = ProcessStats(directory=self.directory)
+        stats.collect("datasets", lambda: dict(hits=2, misses=1, last_load=1.0))
+        for _ in range(3):
+            with stats.track():
+                pass
+        stats.observe_request("POST", "/computation-module/compute/", 200, 0.002)
+        # two workers that exited, the counters are summed in the archive
+        self.write_state(stats, dead_pid())
+        self.write_state(stats, dead_pid())
+        stats.publish()
+        states, archive = collect(self.directory)
+        self.assertEqual([state["pid"] for state in states], [os.getpid()])
+        self.assertEqual(archive["worker"]["requests"], 6)
+        self.assertEqual(archive["worker"]["datasets"], dict(hits=4, misses=2))
+        route = archive["worker"]["routes"]["POST /computation-module/compute/"]
+        self.assertEqual(route["count"], 2)
+        self.assertEqual(sum(route["counts"]), 2)
+        # the files of the exited processes are removed, the archive stays
+        self.assertEqual(collect(self.directory)[1], archive)
+
+        values = samples(prometheus.render(self.directory))
+        self.assertEqual(values['cm_requests_total{role="worker"}'], 9)
+        self.assertEqual(values['cm_dataset_cache_hits_total{role="worker"}'], 6)
+        self.assertEqual(values['cm_processes{role="worker"}'], 1)
+        labels = 'method="POST",route="/computation-module/compute/"'
+        self.assertEqual(
+            values[f"cm_http_request_duration_seconds_count{{{labels}}}"], 3
+        )
+        # the buckets are cumulative
+        self.assertEqual(
+            values[f'cm_http_request_duration_seconds_bucket{{{labels},le="0.001"}}'], 0
+        )
+        self.assertEqual(
+            values[f'cm_http_request_duration_seconds_bucket{{{labels},le="0.0025"}}'],
+            3,
+        )
+        self.assertEqual(
+            values[f'cm_http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], 3
+        )
+        self.assertEqual(values[f'cm_http_requests_total{{{labels},status="200"}}'], 3)
+
+    def test_metrics_route(self):
+        client = create_app(os.environ.get("FLASK_CONFIG", "development")).test_client()
+        rv = client.post("computation-module/compute/", json=get_payload())
+        self.assertEqual(rv.status_code, 200)
+        rv = client.get("computation-module/metrics")
+        self.assertEqual(rv.status_code, 200)
+        self.assertTrue(rv.content_type.startswith("text/plain; version=0.0.4"))
+        text = rv.get_data(as_text=True)
+        self.assertIn("# TYPE cm_http_request_duration_seconds histogram", text)
+        self.assertIn("# TYPE cm_stage_duration_seconds histogram", text)
+        values = samples(text)
+        labels = 'method="POST",route="/computation-module/compute/",status="200"'
+        self.assertGreaterEqual(values[f"cm_http_requests_total{{{labels}}}"], 1)
+        self.assertGreaterEqual(values['cm_requests_total{role="worker"}'], 1)
+        self.assertIn('cm_stage_duration_seconds_count{stage="load"}', values)
+        self.assertIn('cm_result_cache_misses_total{role="worker"}', values)
+
+    def test_rate_limited(self):
+        app = create_app(os.environ.get("FLASK_CONFIG", "development"))
+        app.config["TESTING"] = False
+
+        @app.route("/limited")
+        @rate_limit(1, 60)
+        def limited():
+            return "ok"
+
+        client = app.test_client()
+        before = STATS.state().get("rate_limited", 0)
+        self.assertEqual(client.get("/limited").status_code, 200)
+        self.assertEqual(client.get("/limited").status_code, 429)
+        self.assertEqual(STATS.state()["rate_limited"], before + 1)
@@ -0,0 +1,143 @@
+import itertools
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import pika
+
+from app.exceptions import RpcTimeout
+from app.rpc import CalculationModuleRpcClient, RpcClientPool, backoff
+
+
+class FakeBroker(object):
+    """Stand-in of the broker and of the main web service: the messages
+    published on a queue are answered by the replier of the queue."""
+
+    def __init__(self, replier=None):
+        self.replier = replier
+        self.connections = 0
+        self.waits = []
+        self.parameters = []
+        # number of publications that fail, as on a connection dropped by
+        # the broker
+        self.drops = 0
+
+
+class FakeConnection(object):
+    def __init__(self, broker, parameters):
+        broker.connections += 1
+        broker.parameters.append(parameters)
+        self.broker = broker
+        self.pending = []
+
+    def channel(self):
+        return FakeChannel(self)
+
+    def process_data_events(self, time_limit=0):
+        self.broker.waits.append(time_limit)
+        if not self.pending:
+            time.sleep(min(time_limit, 0.01))
+        pending, self.pending = self.pending, []
+        for callback, props, body in pending:
+            callback(None, None, props, body)
+
+    def close(self):
+        pass
+
+
+class FakeChannel(object):
+    def __init__(self, connection):
+        self.connection = connection
+
+    def queue_declare(self, exclusive):
+        return SimpleNamespace(method=SimpleNamespace(queue="amq.gen-reply"))
+
+    def basic_consume(self, callback, no_ack, queue):
+        self.callback = callback
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        broker = self.connection.broker
+        if broker.drops:
+            broker.drops -= 1
+            raise pika.exceptions.AMQPConnectionError("Connection dropped")
+        replier = broker.replier
+        if replier is None:
+            return
+        for corr_id, reply in replier(properties.correlation_id, body):
+            props = SimpleNamespace(correlation_id=corr_id)
+            self.connection.pending.append((self.callback, props, reply))
+
+
+def echo(corr_id, body):
+    # a late reply of a previous call is delivered first and discarded
+    return [("stale", b"stale"), (corr_id, body.upper())]
+
+
+class TestRpcClient(unittest.TestCase):
+    def client(self, broker, **kwargs):
+        return CalculationModuleRpcClient(
+            url="amqp://localhost/",
+            connection_factory=lambda parameters: FakeConnection(broker, parameters),
+            **kwargs,
+        )
+
+    def test_reused_connection(self):
+        broker = FakeBroker(echo)
+        client = self.client(broker)
+        for i in range(5):
+            self.assertEqual(client.call(f"body-{i}"), f"BODY-{i}")
+        self.assertEqual(broker.connections, 1)
+        self.assertEqual(client.responses, {})
+
+    def test_dropped_connection(self):
+        broker = FakeBroker(echo)
+        client = self.client(broker)
+        self.assertEqual(client.call("a"), "A")
+        self.assertEqual(broker.parameters[0].heartbeat, 0)
+        # the idle connection was closed by the broker: published again once
+        broker.drops = 1
+        self.assertEqual(client.call("b"), "B")
+        self.assertEqual(broker.connections, 2)
+        broker.drops = 2
+        with self.assertRaises(pika.exceptions.AMQPError):
+            client.call("c")
+        self.assertEqual(broker.connections, 3)
+        # a new connection is not retried
+        broker.drops = 1
+        with self.assertRaises(pika.exceptions.AMQPError):
+            client.call("d")
+        self.assertEqual(broker.connections, 4)
+        self.assertEqual(client.call("e"), "E")
+
+    def test_timeout(self):
+        broker = FakeBroker()
+        client = self.client(broker, timeout=0.1)
+        start = time.monotonic()
+        with self.assertRaises(RpcTimeout):
+            client.call("body")
+        self.assertLess(time.monotonic() - start, 1)
+        # the client waits in process_data_events instead of spinning
+        self.assertTrue(all(limit > 0 for limit in broker.waits))
+        self.assertLess(len(broker.waits), 50)
+
+    def test_pool(self):
+        broker = FakeBroker(echo)
+        pool = RpcClientPool(size=2, factory=lambda: self.client(broker))
+        results = []
+        threads = [
+            threading.Thread(target=lambda i=i: results.append(pool.call(f"b{i}")))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), sorted(f"B{i}" for i in range(8)))
+        self.assertLessEqual(broker.connections, 2)
+
+    def test_backoff(self):
+        delays = list(itertools.islice(backoff(1, 8, jitter=0), 6))
+        self.assertEqual(delays, [1, 2, 4, 8, 8, 8])
+        for delay in itertools.islice(backoff(10, 10, jitter=0.1), 20):
+            self.assertTrue(9 <= delay <= 11)
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import unittest
+
+CM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules only needed by the processes computing the requests
+HEAVY = ("numpy", "pandas", "pint", "resutils", "matplotlib", "osgeo")
+
+
+def import_times(module):
+    """Import the module in a new interpreter with -X importtime, return the
+    cumulative import time in microseconds of each imported module."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=CM_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    def assertLight(self, module):
+        times = import_times(module)
+        self.assertIn(module, times)
+        heavy = sorted(name for name in times if name.split(".")[0] in HEAVY)
+        self.assertEqual(heavy, [], f"{module} imports the scientific stack")
+        return times
+
+    def test_app(self):
+        times = self.assertLight("app")
+        self.assertNotIn("flask", times)
+        self.assertNotIn("pika", times)
+
+    def test_consumers(self):
+        self.assertLight("consumer_cm_compute")
+        self.assertLight("consumer_cm_alive")
+
+    def test_register(self):
+        self.assertLight("register_cm")
@@ -0,0 +1,114 @@
+import unittest
+
+from app.constant import INPUTS_CALCULATION_MODULE, SIGNATURE
+from app.exceptions import ValidationError
+from app.validation import MAX_SCENARIOS, InputValidator
+
+
+class TestInputValidator(unittest.TestCase):
+    def setUp(self):
+        signature = dict(SIGNATURE, vectors_needed=["layer"])
+        self.validator = InputValidator(signature)
+        self.psel = {
+            inp["input_parameter_name"]: inp["input_value"]
+            for inp in INPUTS_CALCULATION_MODULE
+        }
+        self.data = dict(
+            inputs_raster_selection={},
+            inputs_vector_selection={"layer": []},
+            inputs_parameter_selection=dict(self.psel, multiplication_factor=2),
+        )
+
+    def test_valid(self):
+        raster, vector, psel = self.validator.validate(self.data)
+        self.assertEqual(raster, {})
+        self.assertEqual(vector, {"layer": []})
+        self.assertEqual(psel, {k: float(v) for k, v in self.psel.items()})
+
+    def test_batch(self):
+        self.data["inputs_parameter_selection"] = [self.psel, self.psel]
+        _, _, psels = self.validator.validate(self.data)
+        self.assertEqual(len(psels), 2)
+        with self.assertRaises(ValidationError):
+            self.validator.validate(dict(self.data, inputs_parameter_selection=[]))
+        data = dict(self.data, inputs_parameter_selection=[self.psel] * MAX_SCENARIOS)
+        self.assertEqual(len(self.validator.validate(data)[2]), MAX_SCENARIOS)
+        data["inputs_parameter_selection"].append(self.psel)
+        with self.assertRaises(ValidationError):
+            self.validator.validate(data)
+
+    def test_invalid_parameters(self):
+        for value in ("abc", None, True, "101", -1, "nan"):
+            data = dict(
+                self.data,
+                inputs_parameter_selection=dict(self.psel, waste_coll_perc=value),
+            )
+            with self.assertRaises(ValidationError, msg=repr(value)):
+                self.validator.validate(data)
+        psel = dict(self.psel)
+        del psel["forst_el_eff"]
+        with self.assertRaises(ValidationError):
+            self.validator.validate(dict(self.data, inputs_parameter_selection=psel))
+
+    def test_invalid_layers(self):
+        with self.assertRaises(ValidationError):
+            self.validator.validate(dict(self.data, inputs_vector_selection={}))
+        with self.assertRaises(ValidationError):
+            self.validator.validate(
+                dict(self.data, inputs_vector_selection={"layer": {}})
+            )
+        for record in ("AT111", {"code": 5}, {"value": 1.0}, None):
+            with self.assertRaises(ValidationError, msg=repr(record)):
+                self.validator.validate(
+                    dict(self.data, inputs_vector_selection={"layer": [record]})
+                )
+        with self.assertRaises(ValidationError):
+            self.validator.validate(dict(self.data, inputs_raster_selection=[]))
+        with self.assertRaises(ValidationError):
+            self.validator.validate(None)
+
+    def test_outputs(self):
+        self.assertEqual(self.validator.outputs({}), (None, False))
+        self.assertEqual(
+            self.validator.outputs(dict(breakdown=True, raster=True)), ("csv", True)
+        )
+        self.assertEqual(
+            self.validator.outputs(dict(breakdown="csv.gz")), ("csv.gz", False)
+        )
+        self.assertEqual(self.validator.outputs(dict(breakdown=False)), (None, False))
+        for data in (
+            dict(breakdown={"a": 1}),
+            dict(breakdown="xlsx"),
+            dict(breakdown=1),
+            dict(raster="yes"),
+            dict(raster=1),
+        ):
+            with self.assertRaises(ValidationError, msg=repr(data)):
+                self.validator.outputs(data)
+
+    def test_sensitivity(self):
+        dist = {"waste_coll_perc": {"distribution": "normal", "mean": 50, "std": 5}}
+        spec = self.validator.sensitivity(
+            {"distributions": dist, "samples": "1000", "seed": 1}, self.psel
+        )
+        self.assertEqual(spec, dict(distributions=dist, samples=1000, seed=1))
+        invalid = [
+            True,
+            [],
+            {"samples": "lots"},
+            {"samples": 0},
+            {"samples": 10**9},
+            {"seed": -1},
+            {"distributions": []},
+            {"distributions": {"unknown": {}}},
+            {"distributions": {"waste_coll_perc": "normal"}},
+            {"distributions": {"waste_coll_perc": {"distribution": "beta"}}},
+            {"distributions": {"waste_coll_perc": {"distribution": "normal"}}},
+            {"distributions": {"waste_coll_perc": {"min": "low"}}},
+        ]
+        for spec in invalid:
+            with self.assertRaises(ValidationError, msg=repr(spec)):
+                self.validator.sensitivity(spec, self.psel)
+        # the batch mode and the sensitivity mode are exclusive
+        with self.assertRaises(ValidationError):
+            self.validator.sensitivity({}, [self.psel, self.psel])
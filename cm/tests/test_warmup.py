@@ -0,0 +1,115 @@
+import gc
+import itertools
+import os
+import runpy
+import shutil
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from app import create_app
+from app.api_v1 import calculation_module
+from app.api_v1.my_calculation_module_directory.download import Downloader
+from app.warmup import clear_ready, is_ready, mark_ready, wait_ready, warm_up
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn-config.py")
+
+
+class TestWarmUp(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "ready.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_ready_flag(self):
+        self.assertFalse(is_ready(self.path))
+        mark_ready(path=self.path)
+        self.assertTrue(is_ready(self.path))
+        clear_ready(self.path)
+        self.assertFalse(is_ready(self.path))
+        # the process that marked the CM as ready exited, the pid is larger
+        # than the maximum pid of Linux
+        mark_ready(pid=2**22 + 1, path=self.path)
+        self.assertFalse(is_ready(self.path))
+
+    def test_wait_ready(self):
+        delays = itertools.repeat(0.01)
+        self.assertFalse(wait_ready(timeout=0.05, path=self.path, delays=delays))
+        mark_ready(path=self.path)
+        self.assertTrue(wait_ready(timeout=0.05, path=self.path, delays=delays))
+
+    def test_warm_up(self):
+        try:
+            datasets = warm_up()
+        finally:
+            gc.unfreeze()
+        self.assertEqual(len(datasets), 4)
+        self.assertTrue(all(len(dataset) for dataset in datasets))
+
+    def test_warm_up_revalidation(self):
+        # the stale datasets are revalidated before the workers are forked
+        downloader = Downloader(directory=self.tmpdir.name)
+        for url in calculation_module.URLS.values():
+            shutil.copy(
+                calculation_module.get_csvpath(**url),
+                os.path.join(self.tmpdir.name, url["csv"]),
+            )
+
+        def revalidated(url, path, meta, sha256):
+            time.sleep(0.1)
+            downloader._write_meta(path, dict(meta, checked=time.time()))
+
+        with mock.patch.object(calculation_module, "DOWNLOADER", downloader):
+            with mock.patch.object(downloader, "_download", side_effect=revalidated):
+                try:
+                    warm_up()
+                finally:
+                    gc.unfreeze()
+                self.assertEqual(downloader._download.call_count, 4)
+        self.assertEqual(downloader._pending, {})
+
+    def test_gunicorn_hooks(self):
+        config = runpy.run_path(CONFIG)
+        self.assertTrue(config["preload_app"])
+        app = create_app(os.environ.get("FLASK_CONFIG", "development"))
+        client = app.test_client()
+        config["on_starting"](SimpleNamespace())
+        try:
+            rv = client.get("computation-module/ready/")
+            self.assertEqual(rv.status_code, 503)
+            with mock.patch("app.warmup.WARMED_UP", True):
+                config["post_worker_init"](SimpleNamespace(ppid=os.getpid()))
+            rv = client.get("computation-module/ready/")
+            self.assertEqual(rv.status_code, 200)
+            self.assertEqual(rv.get_json(), {"ready": True})
+        finally:
+            config["on_exit"](SimpleNamespace())
+        self.assertFalse(is_ready())
+
+    def test_warm_up_failure(self):
+        config = runpy.run_path(CONFIG)
+        log = mock.Mock()
+        failure = mock.patch("app.warmup.warm_up", side_effect=OSError("no dataset"))
+        with failure, mock.patch("app.warmup.WARMED_UP", False):
+            config["when_ready"](SimpleNamespace(log=log))
+            log.exception.assert_called_once()
+            # the workers do not mark the CM as ready
+            config["post_worker_init"](SimpleNamespace(ppid=os.getpid()))
+        self.assertFalse(is_ready())
+
+    def test_reset_counters(self):
+        config = runpy.run_path(CONFIG)
+        calculation_module.get_datasets()
+        for stats in (calculation_module.STORE.stats, calculation_module.RESULTS.stats):
+            self.addCleanup(stats.update, dict(stats))
+        # a forked worker does not report the loads of the master
+        config["post_fork"](SimpleNamespace(), SimpleNamespace())
+        stats = calculation_module.STORE.stats
+        self.assertEqual(stats["loads"], 0)
+        self.assertEqual(stats["load_time"], 0.0)
+        self.assertIsNotNone(stats["last_load"])
+        self.assertEqual(calculation_module.RESULTS.stats["hits"], 0)
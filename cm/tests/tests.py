@@ -1,10 +1,12 @@
 import tempfile
 import unittest
+from unittest import mock
 from werkzeug.exceptions import NotFound
 import pathlib as pth
 from pprint import pprint
 
 from app import create_app
+from app.api_v1 import calculation_module
 from app.api_v1.calculation_module import WASTE, AGRIC, LVSTK, FORST
 from app.constant import INPUTS_CALCULATION_MODULE
 
@@ -13,13 +15,11 @@ from shutil import copyfile
 from .test_client import TestClient
 
 import numpy as np
-import matplotlib.pyplot as plt
 
 import json
 
 from pint import UnitRegistry
 
-
 ureg = UnitRegistry()
 if os.environ.get("LOCAL", False):
     UPLOAD_DIRECTORY = os.path.join(
@@ -33,6 +33,45 @@ if not os.path.exists(UPLOAD_DIRECTORY):
     os.chmod(UPLOAD_DIRECTORY, 0o777)
 
 
+def get_payload(code="AT111"):
+    def read_json(jsname):
+        tdir = pth.Path(__file__).parent
+        print(tdir.absolute())
+        jsfile = tdir / "data" / jsname
+        with open(jsfile, mode="r") as js:
+            return json.load(js)
+
+    def sel_by_code(dlist, code):
+        return [d for d in dlist if d["code"] == code]
+
+    inputs_raster_selection = {}
+    inputs_parameter_selection = {
+        d["input_parameter_name"]: d["input_value"] for d in INPUTS_CALCULATION_MODULE
+    }
+    inputs_vector_selection = {}
+
+    json_names = (
+        "agricultural_residues.json",
+        "solid_waste.json",
+        "livestock_effluents.json",
+        "forest_residues.json",
+    )
+    json_keys = (AGRIC, WASTE, LVSTK, FORST)
+    for jskey, jsname in zip(json_keys, json_names):
+        jsn = sel_by_code(read_json(jsname), code=code)
+        inputs_vector_selection[jskey] = jsn
+
+    inputs_parameter_selection["multiplication_factor"] = 2
+
+    # register the calculation module a
+    payload = {
+        "inputs_raster_selection": inputs_raster_selection,
+        "inputs_parameter_selection": inputs_parameter_selection,
+        "inputs_vector_selection": inputs_vector_selection,
+    }
+    return payload
+
+
 class TestAPI(unittest.TestCase):
     def setUp(self):
         self.app = create_app(os.environ.get("FLASK_CONFIG", "development"))
@@ -45,42 +84,131 @@ class TestAPI(unittest.TestCase):
         self.ctx.pop()
 
     def test_compute(self):
-        def read_json(jsname):
-            tdir = pth.Path(__file__).parent
-            print(tdir.absolute())
-            jsfile = tdir / "data" / jsname
-            with open(jsfile, mode="r") as js:
-                return json.load(js)
-
-        def sel_by_code(dlist, code):
-            return [d for d in dlist if d["code"] == code]
-
-        inputs_raster_selection = {}
-        inputs_parameter_selection = {
-            d["input_parameter_name"]: d["input_value"]
-            for d in INPUTS_CALCULATION_MODULE
-        }
-        inputs_vector_selection = {}
-
-        json_names = (
-            "agricultural_residues.json",
-            "solid_waste.json",
-            "livestock_effluents.json",
-            "forest_residues.json",
-        )
-        json_keys = (AGRIC, WASTE, LVSTK, FORST)
-        for jskey, jsname in zip(json_keys, json_names):
-            jsn = sel_by_code(read_json(jsname), code="AT111")
-            inputs_vector_selection[jskey] = jsn
-
-        inputs_parameter_selection["multiplication_factor"] = 2
-
-        # register the calculation module a
-        payload = {
-            "inputs_raster_selection": inputs_raster_selection,
-            "inputs_parameter_selection": inputs_parameter_selection,
-            "inputs_vector_selection": inputs_vector_selection,
-        }
+        payload = get_payload()
+        rv, js = self.client.post("computation-module/compute/", data=payload)
+        self.assertTrue(rv.status_code == 200)
 
+    def test_compute_stream(self):
+        payload = get_payload()
+        rv, single = self.client.post("computation-module/compute/", data=payload)
+        rv = self.app.test_client().post(
+            "computation-module/compute/", json=dict(payload, stream=True)
+        )
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.mimetype, "application/json")
+        self.assertEqual(rv.get_json(), single)
+
+    def test_compute_breakdown(self):
+        payload = get_payload()
+        rv, single = self.client.post("computation-module/compute/", data=payload)
+        rv, js = self.client.post(
+            "computation-module/compute/", data=dict(payload, breakdown=True)
+        )
+        self.assertEqual(rv.status_code, 200)
+        (layer,) = js["result"].pop("vector_layers")
+        self.assertEqual(js, single)
+        filename = os.path.basename(layer["path"])
+        rv = self.app.test_client().get(f"computation-module/files/{filename}")
+        self.assertEqual(rv.status_code, 200)
+        lines = rv.data.decode("utf-8").splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith("AT111,"))
+        os.remove(layer["path"])
+
+    def test_compute_batch(self):
+        payload = get_payload()
+        rv, single = self.client.post("computation-module/compute/", data=payload)
+        psel = payload["inputs_parameter_selection"]
+        payload["inputs_parameter_selection"] = [
+            psel,
+            dict(psel, forst_coll_perc="0"),
+            dict(psel, forst_coll_perc="100"),
+        ]
         rv, js = self.client.post("computation-module/compute/", data=payload)
         self.assertTrue(rv.status_code == 200)
+        self.assertEqual(len(js["result"]), 3)
+        self.assertEqual(js["result"][0], single["result"])
+        heats = [
+            res["graphics"][0]["data"]["datasets"][0]["data"] for res in js["result"]
+        ]
+        self.assertEqual(heats[1][2], 0)
+        self.assertGreater(heats[2][2], heats[0][2])
+
+    def test_compute_reply(self):
+        # the RPC consumer replies the bytes of the compute route
+        from app.api_v1.transactions import compute_reply
+
+        payload = get_payload()
+        invalid = get_payload()
+        invalid["inputs_parameter_selection"]["waste_coll_perc"] = "120"
+        client = self.app.test_client()
+        for data in (payload, dict(payload, stream=True), invalid):
+            rv = client.post("computation-module/compute/", json=data)
+            self.assertEqual(compute_reply(json.dumps(data)), rv.get_data())
+
+    def test_compute_fetch_once(self):
+        # the datasets of a request are retrieved once, outputs included
+        payload = dict(get_payload(), breakdown=True)
+        downloader = calculation_module.DOWNLOADER
+        with mock.patch.object(downloader, "fetch", wraps=downloader.fetch) as fetch:
+            rv, js = self.client.post("computation-module/compute/", data=payload)
+        self.assertEqual(fetch.call_count, 4)
+        os.remove(js["result"]["vector_layers"][0]["path"])
+
+    def test_compute_vector_layers(self):
+        # the records of the selection are used instead of the datasets
+        payload = get_payload()
+        rv, single = self.client.post("computation-module/compute/", data=payload)
+        stats = calculation_module.RESULTS.stats
+        with mock.patch.object(calculation_module, "VECTOR_LAYERS", True):
+            hits = stats["hits"]
+            rv, js = self.client.post("computation-module/compute/", data=payload)
+            self.assertEqual(js, single)
+            rv, js = self.client.post("computation-module/compute/", data=payload)
+            self.assertEqual(stats["hits"], hits + 1)
+            # another value of a record is another key of the cache
+            payload["inputs_vector_selection"][FORST][0]["value"] *= 2
+            rv, js = self.client.post("computation-module/compute/", data=payload)
+            self.assertEqual(stats["hits"], hits + 1)
+            self.assertNotEqual(js, single)
+
+    def test_compute_invalid(self):
+        payload = get_payload()
+        payload["inputs_parameter_selection"]["waste_coll_perc"] = "120"
+        # TestClient dispatches the request without the error handlers
+        rv = self.app.test_client().post("computation-module/compute/", json=payload)
+        self.assertEqual(rv.status_code, 400)
+        self.assertIn("waste_coll_perc", rv.get_json()["message"])
+
+    def test_compute_invalid_records(self):
+        client = self.app.test_client()
+        for record in ("AT111", {"code": 5}):
+            payload = get_payload()
+            payload["inputs_vector_selection"][WASTE].append(record)
+            rv = client.post("computation-module/compute/", json=payload)
+            self.assertEqual(rv.status_code, 400, rv.get_data(as_text=True))
+
+    def test_compute_invalid_outputs(self):
+        client = self.app.test_client()
+        for options in (dict(breakdown={"a": 1}), dict(raster="yes")):
+            payload = dict(get_payload(), **options)
+            rv = client.post("computation-module/compute/", json=payload)
+            self.assertEqual(rv.status_code, 400, rv.get_data(as_text=True))
+
+    def test_compute_raster_without_geometries(self):
+        payload = dict(get_payload(), raster=True)
+        rv = self.app.test_client().post("computation-module/compute/", json=payload)
+        self.assertEqual(rv.status_code, 400)
+        self.assertIn("CM_NUTS_GEOMETRIES", rv.get_json()["message"])
+
+    def test_compute_invalid_sensitivity(self):
+        client = self.app.test_client()
+        payload = get_payload()
+        psel = payload["inputs_parameter_selection"]
+        for data in (
+            dict(payload, sensitivity=True),
+            dict(payload, sensitivity={"samples": "lots"}),
+            dict(payload, sensitivity={}, inputs_parameter_selection=[psel, psel]),
+        ):
+            rv = client.post("computation-module/compute/", json=data)
+            self.assertEqual(rv.status_code, 400, rv.get_data(as_text=True))